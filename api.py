@@ -1,9 +1,29 @@
+import asyncio
+from typing import Optional
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from main import process_artifact
+from main import process_artifact_async
+from insertion import ensure_schema, write_buffer, get_graph_store
+from jobs import JobStore, JobQueue
+from openai_scheduler import scheduler
+from metrics import render_metrics
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+job_queue = JobQueue(JobStore(), process_artifact_async)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ensure_schema()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    # Commits the writes still waiting for a batch before the drivers close.
+    await asyncio.to_thread(write_buffer.close)
+    await get_graph_store().close_async()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,17 +36,55 @@ app.add_middleware(
 class ArtifactInput(BaseModel):
     code: str
     user: str
+    force: bool = False
+    # Id of the artifact this code revises; only the changed region is processed (see revision.py).
+    previous_artifact_id: Optional[str] = None
 
 @app.post("/process_artifact/")
-async def process_artifact_endpoint(data: ArtifactInput):
+async def process_artifact_endpoint(data: ArtifactInput, background: bool = False):
+    """
+    Processes an artifact. With `?background=true` the artifact is queued and a job id is returned
+    immediately; its progress is available at `GET /jobs/{job_id}`.
+    """
+    if background:
+        if not data.code:
+            raise HTTPException(status_code=400, detail="El código del artifact está vacío.")
+        job_id = job_queue.submit(
+            data.code, data.user, force=data.force, previous_artifact_id=data.previous_artifact_id
+        )
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
     try:
-        response = process_artifact(data.code, data.user)
+        response = await process_artifact_async(
+            data.code, data.user, force=data.force, previous_artifact_id=data.previous_artifact_id
+        )
         return response
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    return job
+
+@app.get("/openai/queue")
+async def get_openai_queue():
+    """
+    Requests waiting for rate-limit budget and in flight, per OpenAI model.
+    """
+    return scheduler.queue_depth()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Pipeline, OpenAI, Neo4j and cache metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "Artifact Processing API is running! New version"}
\ No newline at end of file
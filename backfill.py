@@ -0,0 +1,365 @@
+"""
+Backfill del grafo a partir de la tabla `artifacts` de Supabase.
+
+Recorre la tabla por páginas ordenadas por (created_at, id), procesa los artifacts con concurrencia acotada
+y guarda un checkpoint después de cada página, de modo que un backfill interrumpido continúa donde quedó.
+Con un store que solo es durable al persistir (snapshot en memoria, export masivo) el checkpoint se guarda junto con
+cada persistencia, como mucho cada `--persist-seconds`. Los artifacts que fallan quedan en `failed` del checkpoint y el
+cursor sigue de largo; `--retry-failed` los vuelve a procesar antes de continuar con las páginas.
+
+    uv run python backfill.py --since 2025-04-01 --concurrency 8
+    uv run python backfill.py --since 2025-04-01 --source local --local-dir artifacts
+    uv run python backfill.py --since 2025-04-01 --export .cache/bulk_export
+    uv run python backfill.py --since 2025-04-01 --retry-failed
+"""
+import os
+import json
+import time
+import glob
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TABLE = "artifacts"
+COLUMNS = "id, code, user_id, created_at"
+DEFAULT_CHECKPOINT_PATH = ".cache/backfill_checkpoint.json"
+DEFAULT_PERSIST_SECONDS = 60.0
+# A memory snapshot rewrites the whole graph, so its cost grows with the run; persisting is also spaced out to at
+# least this many times its last duration, which keeps it to about a tenth of the run.
+PERSIST_INTERVAL_FACTOR = 10
+
+LOCAL_USERS = [
+    "497cf09f-fa20-4a41-a5f2-457503b7a4ad",
+    "d8f75ac4-dcd3-4fe7-8813-72b298bf5baa",
+    "12eb2c3c-3b98-4750-a4f4-7febe4af977b",
+    "75a2ec64-d909-4999-abd8-d4ccd8fc7854",
+    "ed273c28-a23b-4e6f-b184-5387ec40cfc6",
+]
+
+
+class LocalQueryResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    """
+    Supports the subset of the supabase-py query builder used by the backfill.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._columns = None
+        self._count = None
+
+    def select(self, columns="*", count=None):
+        self._columns = None if columns == "*" else [column.strip() for column in columns.split(",")]
+        self._count = count
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row[column] == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row[column] in values)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(lambda row: row[column] >= value)
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self._limit = size
+        return self
+
+    def execute(self):
+        rows = [row for row in self._rows if all(condition(row) for condition in self._filters)]
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        count = len(rows) if self._count else None
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        if self._columns:
+            rows = [{column: row[column] for column in self._columns} for row in rows]
+        return LocalQueryResponse(rows, count)
+
+
+class LocalSupabaseClient:
+    """
+    Offline stand-in for the Supabase client that serves the files of a directory as the `artifacts` table.
+    Each file becomes `copies` rows with synthetic ids, users and increasing `created_at` values.
+    """
+
+    def __init__(self, directory: str = "artifacts", copies: int = 1, start: str = "2025-04-01"):
+        paths = sorted(glob.glob(os.path.join(directory, "*.txt")))
+        base = datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        self.rows = []
+        for copy in range(copies):
+            for path in paths:
+                index = len(self.rows)
+                with open(path, encoding="utf-8") as file:
+                    code = file.read()
+                if copy:
+                    # Distinct code per copy, so copies are not short-circuited by the fingerprint check.
+                    code = f"{code}\n// copy {copy}\n"
+                self.rows.append({
+                    "id": f"{index:08d}-{os.path.splitext(os.path.basename(path))[0]}",
+                    "code": code,
+                    "user_id": LOCAL_USERS[index % len(LOCAL_USERS)],
+                    "created_at": (base + timedelta(seconds=index)).isoformat(),
+                })
+
+    def table(self, name):
+        return LocalQuery(self.rows)
+
+
+def create_supabase_client():
+    from supabase import create_client
+
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_API_KEY"))
+
+
+def validate_date(date: str) -> str:
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
+    return date
+
+
+def count_artifacts(client, since: str) -> int:
+    response = client.table(TABLE).select("id", count="exact").gte("created_at", since).execute()
+    return response.count or 0
+
+
+def fetch_page(client, since: str, cursor, page_size: int) -> list:
+    """
+    Returns the next page of artifacts after `cursor` (the last processed created_at/id), in (created_at, id) order.
+    Rows sharing the cursor's created_at are fetched first, so pages never skip or repeat rows on timestamp ties.
+    """
+    if cursor is None:
+        return (
+            client.table(TABLE).select(COLUMNS).gte("created_at", since)
+            .order("created_at").order("id").limit(page_size).execute().data
+        )
+
+    rows = (
+        client.table(TABLE).select(COLUMNS).eq("created_at", cursor["created_at"]).gt("id", cursor["id"])
+        .order("id").limit(page_size).execute().data
+    )
+    if len(rows) < page_size:
+        rows += (
+            client.table(TABLE).select(COLUMNS).gt("created_at", cursor["created_at"])
+            .order("created_at").order("id").limit(page_size - len(rows)).execute().data
+        )
+    return rows
+
+
+def fetch_rows(client, ids: list) -> list:
+    """
+    Returns the artifacts with the given ids, in (created_at, id) order.
+    """
+    return (
+        client.table(TABLE).select(COLUMNS).in_("id", ids)
+        .order("created_at").order("id").execute().data
+    )
+
+
+def load_checkpoint(path: str, since: str) -> dict:
+    empty = {"since": since, "cursor": None, "processed": 0, "reused": 0, "failed": []}
+    if not os.path.exists(path):
+        return empty
+
+    with open(path, encoding="utf-8") as file:
+        checkpoint = json.load(file)
+
+    if checkpoint.get("since") != since:
+        print(f"[Backfill] El checkpoint {path} es de otra fecha ({checkpoint.get('since')}); se ignora.")
+        return empty
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+
+async def run_backfill(client, since: str, page_size: int = 50, concurrency: int = 4,
+                       checkpoint_path: str = DEFAULT_CHECKPOINT_PATH, force: bool = False,
+                       persist_seconds: float = DEFAULT_PERSIST_SECONDS, retry_failed: bool = False) -> dict:
+    """
+    Processes every artifact created on or after `since`, resuming from the checkpoint if there is one.
+    With `retry_failed`, the artifacts that failed in earlier runs are processed again first.
+    Returns the final checkpoint.
+    """
+    from main import process_artifact_async
+    from insertion import get_graph_store, persist_graph_store
+
+    validate_date(since)
+    checkpoint = load_checkpoint(checkpoint_path, since)
+    total = await asyncio.to_thread(count_artifacts, client, since)
+    done_before = checkpoint["processed"] + len(checkpoint["failed"])
+    print(f"[Backfill] {total} artifacts desde {since}; {done_before} ya procesados según el checkpoint.")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started_at = time.perf_counter()
+    done_now = 0
+    durable = get_graph_store().durable_writes
+    persisted_at = started_at
+    persist_duration = 0.0
+    unsaved_pages = 0
+
+    async def persist():
+        nonlocal persisted_at, persist_duration, unsaved_pages
+        # The memory snapshot or the bulk export is saved first, so the checkpoint never gets ahead of the graph.
+        started = time.perf_counter()
+        await asyncio.to_thread(persist_graph_store)
+        save_checkpoint(checkpoint_path, checkpoint)
+        persisted_at = time.perf_counter()
+        persist_duration = persisted_at - started
+        unsaved_pages = 0
+
+    async def process_row(row):
+        async with semaphore:
+            try:
+                result = await process_artifact_async(row["code"], row["user_id"], force=force)
+                return row, result, None
+            except Exception as e:
+                return row, None, e
+
+    async def process_rows(rows, retrying: bool = False):
+        nonlocal unsaved_pages
+        for row, result, error in await asyncio.gather(*(process_row(row) for row in rows)):
+            if error is not None:
+                print(f"[Backfill] Error en el artifact {row['id']}: {error}")
+                if not retrying:
+                    checkpoint["failed"].append(row["id"])
+            else:
+                if retrying:
+                    checkpoint["failed"].remove(row["id"])
+                checkpoint["processed"] += 1
+                checkpoint["reused"] += int(result.get("reused", False))
+
+        unsaved_pages += 1
+        interval = max(persist_seconds, PERSIST_INTERVAL_FACTOR * persist_duration)
+        if durable or time.perf_counter() - persisted_at >= interval:
+            await persist()
+
+    if retry_failed and checkpoint["failed"]:
+        failed = list(checkpoint["failed"])
+        print(f"[Backfill] Reintentando {len(failed)} artifacts fallidos.")
+        for start in range(0, len(failed), page_size):
+            ids = failed[start:start + page_size]
+            rows = await asyncio.to_thread(fetch_rows, client, ids)
+            # Ids no longer in the table stay in `failed`, so they are not silently counted as processed.
+            await process_rows(rows, retrying=True)
+        print(f"[Backfill] {len(failed) - len(checkpoint['failed'])} de {len(failed)} artifacts fallidos procesados.")
+
+    while True:
+        rows = await asyncio.to_thread(fetch_page, client, since, checkpoint["cursor"], page_size)
+        if not rows:
+            break
+
+        last_row = rows[-1]
+        checkpoint["cursor"] = {"created_at": last_row["created_at"], "id": last_row["id"]}
+        await process_rows(rows)
+
+        done_now += len(rows)
+        elapsed = time.perf_counter() - started_at
+        rate = done_now / elapsed if elapsed else 0.0
+        remaining = max(total - done_before - done_now, 0)
+        eta = format_duration(remaining / rate) if rate else "?"
+        print(
+            f"[Backfill] {done_before + done_now}/{total} artifacts | {rate:.2f} artifacts/s | "
+            f"ETA {eta} | reutilizados {checkpoint['reused']} | fallidos {len(checkpoint['failed'])}"
+        )
+
+    if unsaved_pages:
+        await persist()
+    print(f"[Backfill] Terminado en {format_duration(time.perf_counter() - started_at)}.")
+    return checkpoint
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill del grafo desde la tabla artifacts de Supabase.")
+    parser.add_argument("--since", required=True, help="Procesa los artifacts con created_at >= esta fecha (YYYY-MM-DD).")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--reset", action="store_true", help="Ignora el checkpoint existente y empieza desde cero.")
+    parser.add_argument("--force", action="store_true", help="Reprocesa artifacts aunque su fingerprint ya exista.")
+    parser.add_argument("--source", choices=["supabase", "local"], default="supabase")
+    parser.add_argument("--local-dir", default="artifacts", help="Directorio de artifacts para --source local.")
+    parser.add_argument("--local-copies", type=int, default=1, help="Copias de cada archivo para --source local.")
+    parser.add_argument("--export", metavar="DIR",
+                        help="Exporta el grafo a archivos de importación en DIR en vez de escribirlo (ver bulk_export.py).")
+    parser.add_argument("--export-format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--persist-seconds", type=float, default=DEFAULT_PERSIST_SECONDS,
+                        help="Segundos mínimos entre persistencias del snapshot en memoria o del export.")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Reprocesa los artifacts que fallaron en ejecuciones anteriores antes de continuar.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    if args.source == "local":
+        supabase_client = LocalSupabaseClient(args.local_dir, copies=args.local_copies, start=args.since)
+    else:
+        supabase_client = create_supabase_client()
+
+    if args.export:
+        from bulk_export import BulkExportStore
+        from insertion import set_graph_store
+
+        export_store = BulkExportStore(args.export, args.export_format)
+        set_graph_store(export_store)
+
+    asyncio.run(run_backfill(
+        supabase_client,
+        args.since,
+        page_size=args.page_size,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint,
+        force=args.force,
+        persist_seconds=args.persist_seconds,
+        retry_failed=args.retry_failed
+    ))
+
+    if args.export:
+        from insertion import write_buffer
+
+        write_buffer.close()
+        export_store.close()
@@ -0,0 +1,555 @@
+"""
+Benchmark offline del pipeline.
+
+Procesa el corpus de `artifacts/*.txt` (replicado `--copies` veces) con `process_artifact` usando stand-ins locales
+de OpenAI (respuestas deterministas y latencia configurable) y de Neo4j (un sink en memoria), sin gastar API ni
+levantar una base. Reporta el tiempo por etapa, las llamadas a OpenAI, las filas escritas, artifacts/s y, con
+`--trace-allocations`, la memoria asignada; y compara contra un baseline guardado. `--check-revisions` verifica que
+procesar una revisión incrementalmente deja los mismos nodos que extraerla completa.
+
+    uv run python benchmark.py --copies 20 --save-baseline .cache/benchmark_baseline.json
+    uv run python benchmark.py --copies 20 --baseline .cache/benchmark_baseline.json --chat-latency 0.2
+    uv run python benchmark.py --check-revisions
+"""
+import os
+import io
+import sys
+import json
+import time
+import glob
+import shutil
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+from array import array
+from collections import defaultdict
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+# (previous version, revision) pairs of the corpus checked by `--check-revisions`.
+REVISION_PAIRS = [
+    ("faena_complete_example.txt", "faena_complete_example_v2.txt"),
+]
+
+EXTRACTION_CODE_MARKER = "### **Extract the information from the following artifact:**"
+BENCHMARK_USER = "benchmark-user"
+
+# Metrics compared against the baseline and whether a higher value is better.
+COMPARED_METRICS = {
+    "artifacts_per_second": True,
+    "chat_calls_per_artifact": False,
+    "embedding_calls_per_artifact": False,
+    "embedding_inputs_per_artifact": False,
+    "rows_written_per_artifact": False,
+    "write_transactions_per_artifact": False,
+    "peak_allocated_kb": False,
+}
+
+
+class FakeOpenAI:
+    """
+    Local stand-in for the chat (parse) and embeddings endpoints of the OpenAI client.
+    Extraction answers with the static extraction of the code in the prompt; the other stages answer empty;
+    embeddings are derived from a hash of the text.
+    """
+
+    def __init__(self, chat_latency: float = 0.0, embedding_latency: float = 0.0, asynchronous: bool = False):
+        self.chat_latency = chat_latency
+        self.embedding_latency = embedding_latency
+        self.calls = defaultdict(int)
+        self.embedding_inputs = 0
+        self.api_key = "benchmark"
+        completions = SimpleNamespace(parse=self.parse_async if asynchronous else self.parse)
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        self.embeddings = SimpleNamespace(create=self.create_async if asynchronous else self.create)
+
+    @staticmethod
+    def parsed_response(response_format, messages):
+        from extract import ExtractedEntities
+        from static_extract import extract_static
+        from minify import count_tokens
+
+        if response_format is ExtractedEntities:
+            code = messages[0]["content"].split(EXTRACTION_CODE_MARKER, 1)[-1]
+            parsed = extract_static(code).to_entities()
+        else:
+            fields = {name: [] for name in response_format.model_fields}
+            parsed = response_format(**fields)
+
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        completion_tokens = count_tokens(parsed.model_dump_json())
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    @staticmethod
+    def embedding_response(input, dimensions=None, **options):
+        from vectors import embedding_dimensions
+
+        size = dimensions or embedding_dimensions()
+        data = []
+        for index, text in enumerate(input):
+            digest = array("b", hashlib.shake_256(text.encode("utf-8")).digest(size))
+            data.append(SimpleNamespace(index=index, embedding=[value / 128 for value in digest]))
+        tokens = sum(len(text) // 4 + 1 for text in input)
+        return SimpleNamespace(data=data, usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+    def parse(self, model, response_format, messages, **options):
+        self.calls[response_format.__name__] += 1
+        time.sleep(self.chat_latency)
+        return self.parsed_response(response_format, messages)
+
+    async def parse_async(self, model, response_format, messages, **options):
+        self.calls[response_format.__name__] += 1
+        await asyncio.sleep(self.chat_latency)
+        return self.parsed_response(response_format, messages)
+
+    def create(self, input, **options):
+        self.calls["embeddings"] += 1
+        self.embedding_inputs += len(input)
+        time.sleep(self.embedding_latency)
+        return self.embedding_response(input, **options)
+
+    async def create_async(self, input, **options):
+        self.calls["embeddings"] += 1
+        self.embedding_inputs += len(input)
+        await asyncio.sleep(self.embedding_latency)
+        return self.embedding_response(input, **options)
+
+
+class GraphSink:
+    """
+    In-memory stand-in for the Neo4j drivers: reads return nothing and writes are counted. Each write
+    transaction takes `write_latency` seconds, as the round-trip and commit of a real server.
+    """
+
+    def __init__(self, write_latency: float = 0.0):
+        self.write_latency = write_latency
+        self.transactions = 0
+        self.statements = 0
+        self.rows = 0
+        self.node_ids = set()
+
+    def record(self, query, parameters):
+        self.statements += 1
+        rows = (parameters or {}).get("rows")
+        if rows is None:
+            self.rows += 1
+            return
+        self.rows += len(rows)
+        if "MERGE (n:" in query:
+            self.node_ids.update(row["id"] for row in rows)
+
+
+class SinkResult:
+    def __iter__(self):
+        return iter([])
+
+    def data(self):
+        return []
+
+    def single(self):
+        return None
+
+    def consume(self):
+        return None
+
+
+class AsyncSinkResult:
+    async def data(self):
+        return []
+
+    async def single(self):
+        return None
+
+    async def consume(self):
+        return None
+
+
+class SinkTransaction:
+    def __init__(self, sink: GraphSink):
+        self.sink = sink
+
+    def run(self, query, parameters=None, **kwargs):
+        self.sink.record(query, parameters)
+        return SinkResult()
+
+
+class AsyncSinkTransaction(SinkTransaction):
+    async def run(self, query, parameters=None, **kwargs):
+        self.sink.record(query, parameters)
+        return AsyncSinkResult()
+
+
+class SinkSession:
+    def __init__(self, sink: GraphSink):
+        self.sink = sink
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        return SinkResult()
+
+    def execute_write(self, work, *args):
+        self.sink.transactions += 1
+        time.sleep(self.sink.write_latency)
+        return work(SinkTransaction(self.sink), *args)
+
+
+class AsyncSinkSession(SinkSession):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def run(self, query, parameters=None, **kwargs):
+        return AsyncSinkResult()
+
+    async def execute_write(self, work, *args):
+        self.sink.transactions += 1
+        await asyncio.sleep(self.sink.write_latency)
+        return await work(AsyncSinkTransaction(self.sink), *args)
+
+
+class SinkDriver:
+    def __init__(self, sink: GraphSink, session_class=SinkSession):
+        self.sink = sink
+        self.session_class = session_class
+
+    def session(self, **kwargs):
+        return self.session_class(self.sink)
+
+    def close(self):
+        return None
+
+
+class AsyncSinkDriver(SinkDriver):
+    def __init__(self, sink: GraphSink):
+        super().__init__(sink, AsyncSinkSession)
+
+    async def close(self):
+        return None
+
+
+def load_corpus(directory: str = "artifacts", copies: int = 1) -> list:
+    """
+    Returns the code of every `*.txt` file of `directory`, `copies` times; copies get distinct code.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.txt")))
+    corpus = []
+    for copy in range(copies):
+        for path in paths:
+            with open(path, encoding="utf-8") as file:
+                code = file.read()
+            corpus.append(f"{code}\nconst benchmarkCopy = {copy};\n" if copy else code)
+    return corpus
+
+
+def install_stand_ins(chat_latency: float, embedding_latency: float, with_caches: bool, static_extraction: bool,
+                      write_latency: float = 0.0, store: str = "sink"):
+    import openai_scheduler
+    import insertion
+    import extract
+    import metrics
+    import llm_cache
+    import embedding_cache
+    from embeddings import EMBEDDING_MODEL
+    from graph_store import MemoryGraphStore
+    from bulk_export import BulkExportStore
+
+    sync_client = FakeOpenAI(chat_latency, embedding_latency)
+    async_client = FakeOpenAI(chat_latency, embedding_latency, asynchronous=True)
+    openai_scheduler._openai_client = sync_client
+    openai_scheduler._async_openai_client = async_client
+    # The benchmark measures the pipeline, not the account limits.
+    openai_scheduler.scheduler.limits = {"gpt-4o": (10 ** 9, 10 ** 12), EMBEDDING_MODEL: (10 ** 9, 10 ** 12)}
+    openai_scheduler.scheduler.budgets.clear()
+
+    sink = GraphSink(write_latency)
+    insertion.neo4j_conn.driver = SinkDriver(sink)
+    insertion.neo4j_conn.async_driver = AsyncSinkDriver(sink)
+    # "sink" runs the Bolt store (and its Cypher) against the sink; "memory" builds the graph in process;
+    # "bulk" exports it to import files in a temporary directory.
+    if store == "memory":
+        insertion.set_graph_store(MemoryGraphStore(insertion.VECTOR_INDEX_PROPERTIES))
+    elif store == "bulk":
+        insertion.set_graph_store(BulkExportStore(tempfile.mkdtemp(prefix="bulk_export_")))
+    else:
+        insertion.set_graph_store(insertion.BoltGraphStore())
+
+    metrics.METRICS_LOG_ENABLED = False
+    extract.STATIC_EXTRACTION_ENABLED = static_extraction
+    if not with_caches:
+        llm_cache.LLM_CACHE_ENABLED = False
+        embedding_cache.EMBEDDING_CACHE_ENABLED = False
+
+    return sync_client, async_client, sink
+
+
+def run_artifacts(corpus: list, mode: str, concurrency: int) -> list:
+    from main import process_artifact, process_artifact_async
+
+    if mode == "sync":
+        return [process_artifact(code, BENCHMARK_USER, force=True) for code in corpus]
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(code):
+            async with semaphore:
+                return await process_artifact_async(code, BENCHMARK_USER, force=True)
+
+        return await asyncio.gather(*(run_one(code) for code in corpus))
+
+    return asyncio.run(run_all())
+
+
+def build_report(responses: list, elapsed: float, clients, sink: GraphSink, peak_bytes=None) -> dict:
+    count = len(responses)
+    stages = defaultdict(float)
+    for response in responses:
+        for stage, seconds in response["timings"].items():
+            if stage != "total":
+                stages[stage] += seconds
+
+    calls = defaultdict(int)
+    for client in clients:
+        for name, value in client.calls.items():
+            calls[name] += value
+    embedding_calls = calls.pop("embeddings", 0)
+    embedding_inputs = sum(client.embedding_inputs for client in clients)
+
+    report = {
+        "artifacts": count,
+        "elapsed_seconds": round(elapsed, 4),
+        "artifacts_per_second": round(count / elapsed, 4) if elapsed else 0.0,
+        "stage_seconds_per_artifact": {stage: round(seconds / count, 6) for stage, seconds in sorted(stages.items())},
+        "chat_calls": dict(calls),
+        "chat_calls_per_artifact": round(sum(calls.values()) / count, 4),
+        "embedding_calls_per_artifact": round(embedding_calls / count, 4),
+        "embedding_inputs_per_artifact": round(embedding_inputs / count, 4),
+        "write_transactions_per_artifact": round(sink.transactions / count, 4),
+        "statements_written": sink.statements,
+        "rows_written_per_artifact": round(sink.rows / count, 4),
+        "distinct_nodes": len(sink.node_ids),
+    }
+    if peak_bytes is not None:
+        report["peak_allocated_kb"] = round(peak_bytes / 1024, 1)
+    return report
+
+
+def run_benchmark(directory: str = "artifacts", copies: int = 1, mode: str = "async", concurrency: int = 4,
+                  chat_latency: float = 0.0, embedding_latency: float = 0.0, with_caches: bool = False,
+                  static_extraction: bool = True, trace_allocations: bool = False, verbose: bool = False,
+                  write_latency: float = 0.0, store: str = "sink") -> dict:
+    corpus = load_corpus(directory, copies)
+    if not corpus:
+        raise ValueError(f"No hay artifacts en {directory}.")
+
+    sync_client, async_client, sink = install_stand_ins(
+        chat_latency, embedding_latency, with_caches, static_extraction, write_latency, store
+    )
+
+    if trace_allocations:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    with redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        responses = run_artifacts(corpus, mode, concurrency)
+    elapsed = time.perf_counter() - started_at
+    peak_bytes = None
+    if trace_allocations:
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    report = build_report(responses, elapsed, (sync_client, async_client), sink, peak_bytes)
+    if store == "memory":
+        from insertion import get_graph_store
+        graph = get_graph_store()
+        report["distinct_nodes"] = sum(
+            len(by_id) for label, by_id in graph.nodes.items() if label not in ("Artifact", "User")
+        )
+        report["graph_relationships"] = graph.relationship_count()
+    elif store == "bulk":
+        from insertion import get_graph_store, write_buffer
+        write_buffer.close()
+        graph = get_graph_store()
+        with redirect_stdout(io.StringIO()):
+            graph.close()
+        report["exported_rows"] = {**graph.exported, "files": len(graph.files)}
+        shutil.rmtree(graph.directory)
+    report["config"] = {
+        "copies": copies, "mode": mode, "concurrency": concurrency, "chat_latency": chat_latency,
+        "embedding_latency": embedding_latency, "write_latency": write_latency, "store": store, "with_caches": with_caches, "static_extraction": static_extraction,
+    }
+    return report
+
+
+def artifact_node_keys(store, artifact_id: str) -> set:
+    graph = store.artifact_graph(artifact_id)
+    return {(node["tipo"], node.get("canonical_key") or node["id"]) for node in graph["nodes"]}
+
+
+def check_revisions(directory: str = "artifacts", pairs=REVISION_PAIRS) -> list:
+    """
+    Processes each revision incrementally on top of its previous version and in full on an empty graph, and
+    returns the differences between the nodes each run links to the artifact.
+    """
+    import graph_catalog
+    from main import process_artifact
+    from insertion import get_graph_store
+
+    def run(*codes):
+        install_stand_ins(0.0, 0.0, False, True, store="memory")
+        graph_catalog.catalog = graph_catalog.GraphCatalog()
+        previous_id = None
+        for code in codes:
+            with redirect_stdout(io.StringIO()):
+                response = process_artifact(code, BENCHMARK_USER, previous_artifact_id=previous_id)
+            previous_id = response["artifact_id"]
+        return response, artifact_node_keys(get_graph_store(), previous_id)
+
+    differences = []
+    for previous_name, revision_name in pairs:
+        with open(os.path.join(directory, previous_name), encoding="utf-8") as file:
+            previous_code = file.read()
+        with open(os.path.join(directory, revision_name), encoding="utf-8") as file:
+            revision_code = file.read()
+        response, incremental = run(previous_code, revision_code)
+        _, full = run(revision_code)
+        mode = "incremental" if response.get("incremental") else "completa"
+        print(f"[Benchmark] {previous_name} -> {revision_name} ({mode}): {len(incremental)} nodos, "
+              f"{len(full)} con extracción completa.")
+        differences.extend(f"{revision_name}: {label} {key} solo en la revisión" for label, key in sorted(incremental - full))
+        differences.extend(f"{revision_name}: {label} {key} falta en la revisión" for label, key in sorted(full - incremental))
+    return differences
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a description of every metric (including per-stage times) that is worse than the baseline
+    by more than `tolerance`.
+    """
+    pairs = [(name, report.get(name), baseline.get(name), higher_is_better)
+             for name, higher_is_better in COMPARED_METRICS.items()]
+    for stage, seconds in report["stage_seconds_per_artifact"].items():
+        pairs.append((f"stage:{stage}", seconds, baseline.get("stage_seconds_per_artifact", {}).get(stage), False))
+
+    regressions = []
+    for name, current, previous, higher_is_better in pairs:
+        if current is None or previous is None or previous == 0:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"[Benchmark] {report['artifacts']} artifacts en {report['elapsed_seconds']:.2f}s "
+          f"({report['artifacts_per_second']:.2f} artifacts/s)")
+    print(f"{'etapa':20} {'s/artifact':>12}")
+    for stage, seconds in report["stage_seconds_per_artifact"].items():
+        print(f"{stage:20} {seconds:12.6f}")
+    print(f"[Benchmark] Llamadas chat: {report['chat_calls']} | embeddings por artifact: "
+          f"{report['embedding_calls_per_artifact']} ({report['embedding_inputs_per_artifact']} textos)")
+    print(f"[Benchmark] Transacciones por artifact: {report['write_transactions_per_artifact']} | "
+          f"sentencias escritas: {report['statements_written']} | filas por artifact: "
+          f"{report['rows_written_per_artifact']} | nodos distintos: {report['distinct_nodes']}")
+    if "exported_rows" in report:
+        exported = report["exported_rows"]
+        print(f"[Benchmark] Exportados: {exported['nodes']} nodos, {exported['relationships']} relaciones "
+              f"en {exported['files']} archivos")
+    if "peak_allocated_kb" in report:
+        print(f"[Benchmark] Pico de memoria asignada: {report['peak_allocated_kb']} KB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline con OpenAI y Neo4j simulados.")
+    parser.add_argument("--dir", default="artifacts", help="Directorio con los artifacts *.txt.")
+    parser.add_argument("--copies", type=int, default=5, help="Veces que se replica el corpus.")
+    parser.add_argument("--mode", choices=["sync", "async"], default="async")
+    parser.add_argument("--concurrency", type=int, default=4, help="Artifacts simultáneos en modo async.")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Segundos por llamada de chat simulada.")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Segundos por llamada de embeddings.")
+    parser.add_argument("--write-latency", type=float, default=0.0, help="Segundos por transacción de escritura.")
+    parser.add_argument("--store", choices=["sink", "memory", "bulk"], default="sink",
+                        help="Grafo simulado: sink de Bolt, MemoryGraphStore o BulkExportStore.")
+    parser.add_argument("--with-caches", action="store_true", help="Mantiene activos los caches de LLM y embeddings.")
+    parser.add_argument("--no-static", action="store_true", help="Desactiva la extracción estática (siempre LLM).")
+    parser.add_argument("--trace-allocations", action="store_true", help="Mide la memoria asignada con tracemalloc.")
+    parser.add_argument("--verbose", action="store_true", help="Muestra la salida del pipeline.")
+    parser.add_argument("--output", help="Guarda el reporte JSON en este archivo.")
+    parser.add_argument("--baseline", help="Compara contra este reporte y termina con error si hay regresiones.")
+    parser.add_argument("--save-baseline", help="Guarda el reporte como baseline en este archivo.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento permitido sobre el baseline.")
+    parser.add_argument("--check-revisions", action="store_true",
+                        help="Compara las revisiones incrementales de REVISION_PAIRS con su extracción completa.")
+    return parser.parse_args()
+
+
+def write_json(path: str, data: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.check_revisions:
+        differences = check_revisions(args.dir)
+        if differences:
+            print("[Benchmark] Las revisiones incrementales difieren de la extracción completa:")
+            for difference in differences:
+                print(f"  - {difference}")
+            sys.exit(1)
+        print("[Benchmark] Las revisiones incrementales coinciden con la extracción completa.")
+        sys.exit(0)
+
+    report = run_benchmark(
+        args.dir,
+        copies=args.copies,
+        mode=args.mode,
+        concurrency=args.concurrency,
+        chat_latency=args.chat_latency,
+        embedding_latency=args.embedding_latency,
+        write_latency=args.write_latency,
+        store=args.store,
+        with_caches=args.with_caches,
+        static_extraction=not args.no_static,
+        trace_allocations=args.trace_allocations,
+        verbose=args.verbose
+    )
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            write_json(path, report)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("config") != report["config"]:
+            print("[Benchmark] El baseline se generó con otra configuración; la comparación es orientativa.")
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("[Benchmark] Regresiones respecto al baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("[Benchmark] Sin regresiones respecto al baseline.")
@@ -0,0 +1,414 @@
+"""
+Offline bulk export of the graph, for large backfills.
+
+`BulkExportStore` (GRAPH_STORE=bulk, or `backfill.py --export DIR`) takes the writes of the pipeline and, instead of
+merging them into the graph, appends them to chunked CSV (or Parquet) files in the header format of
+`neo4j-admin database import`: one file per node label or relationship type and chunk, every node in one global id
+space (`id:ID`), embeddings as `double[]` arrays or base64 text, as `insertion.py` would write them. Nodes and
+relationships are exported once; the files are then loaded in a single offline import.
+
+Ids are stable: entities already get the uuid5 of their canonical key (see entity_resolution.py), and the store keeps
+its index (exported ids, canonical keys, artifact fingerprints, relationships) in `state.json`, so a later run into
+the same directory reuses the ids and only appends what is new. `persist` flushes the files and saves the index with
+the committed size of every file; files or bytes written after the last `persist` are discarded on the next run.
+The store answers key and fingerprint lookups; it has no similarity search, so relationships to earlier nodes come
+from the graph catalog's rule candidates (see graph_catalog.py).
+"""
+import os
+import csv
+import json
+import time
+import base64
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from graph_store import (
+    GraphStore, WriteOp, NODES, RELATIONSHIPS, ARTIFACTS, ARTIFACT_STATUS, USERS, GENERATED, CREATED_BY,
+    REVISIONS, ARTIFACT_FIELDS,
+)
+
+load_dotenv()
+
+BULK_EXPORT_DIR = os.getenv("BULK_EXPORT_DIR", ".cache/bulk_export")
+# "csv" or "parquet" (needs pyarrow).
+BULK_EXPORT_FORMAT = os.getenv("BULK_EXPORT_FORMAT", "csv").lower()
+BULK_EXPORT_CHUNK_ROWS = int(os.getenv("BULK_EXPORT_CHUNK_ROWS", "100000"))
+
+ARRAY_DELIMITER = ";"
+STATE_FILE = "state.json"
+# Arguments for `neo4j-admin database import full <database> @import.args`, run from the export directory.
+MANIFEST_FILE = "import.args"
+
+NODE_COLUMNS = ["id:ID", ":LABEL"]
+RELATIONSHIP_COLUMNS = [":START_ID", ":END_ID", ":TYPE"]
+
+# Status of an artifact while the pipeline runs; its row is held until it gets a final one.
+PROCESSING_STATUS = "processing"
+
+
+def column_type(value) -> str:
+    """
+    Import type of a property value, as written in the header (`name:type`).
+    """
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "long"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, (list, tuple, array)):
+        items = [item for item in value if item is not None]
+        return f"{column_type(items[0]) if items else 'string'}[]"
+    return "string"
+
+
+def export_value(value):
+    """
+    Value as written to the file: packed embeddings as base64 text (like Memgraph's), sequences as lists.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, (tuple, array)):
+        return list(value)
+    return value
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        return ARRAY_DELIMITER.join(csv_value(item) for item in value)
+    return str(value)
+
+
+def relationship_digest(origen: str, tipo: str, destino: str) -> str:
+    return hashlib.blake2b(f"{origen}|{tipo}|{destino}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ExportFile:
+    """
+    One chunk of rows with the same columns: streamed to a CSV file, or buffered and written as Parquet on close.
+    """
+
+    def __init__(self, path: str, fixed: List[str], columns: Dict[str, str], file_format: str):
+        self.path = path
+        self.fixed = fixed
+        self.columns = columns
+        self.file_format = file_format
+        self.rows = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if file_format == "csv":
+            self.file = open(path, "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.header())
+        else:
+            self.buffer = []
+
+    def header(self) -> List[str]:
+        return self.fixed + [name if kind == "string" else f"{name}:{kind}" for name, kind in self.columns.items()]
+
+    def fits(self, properties: dict) -> bool:
+        return all(value is None or self.columns.get(name) == column_type(value) for name, value in properties.items())
+
+    def append(self, values: list, properties: dict):
+        row = values + [properties.get(name) for name in self.columns]
+        if self.file_format == "csv":
+            self.writer.writerow([csv_value(value) for value in row])
+        else:
+            self.buffer.append(dict(zip(self.header(), row)))
+        self.rows += 1
+
+    def flush(self) -> int:
+        """
+        Makes the rows written so far durable and returns the committed size of the CSV file.
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self) -> int:
+        if self.file_format == "csv":
+            size = self.flush()
+            self.file.close()
+            return size
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("BULK_EXPORT_FORMAT=parquet requiere pyarrow (uv add pyarrow).")
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(self.buffer), self.path)
+        self.buffer = []
+        return os.path.getsize(self.path)
+
+
+class BulkExportStore(GraphStore):
+    """
+    Graph store that exports the writes to import files instead of running them (see the module docstring).
+    """
+
+    durable_writes = False
+
+    def __init__(self, directory: str = BULK_EXPORT_DIR, file_format: str = BULK_EXPORT_FORMAT,
+                 chunk_rows: int = BULK_EXPORT_CHUNK_ROWS):
+        if file_format not in ("csv", "parquet"):
+            raise ValueError(f"Formato de exportación desconocido: {file_format}")
+        self.directory = directory
+        self.file_format = file_format
+        self.chunk_rows = chunk_rows
+        self.lock = threading.RLock()
+        self.node_ids: Set[str] = set()
+        self.keys: Dict[Tuple[str, str], str] = {}
+        # fingerprint -> id, nodes_inserted and relationships_inserted of a complete Artifact
+        self.fingerprints: Dict[str, dict] = {}
+        self.relationships: Set[str] = set()
+        # Artifact rows waiting for a final status, by id.
+        self.pending: Dict[str, dict] = {}
+        # Committed files (relative path -> size in bytes) and the files being written, by (kind, label or type).
+        self.files: Dict[str, int] = {}
+        self.open_files: Dict[Tuple[str, str], ExportFile] = {}
+        self.run = time.strftime("%Y%m%dT%H%M%S")
+        self.sequence = 0
+        self.clock = 0
+        self.exported = {"nodes": 0, "relationships": 0, "dropped_relationships": 0}
+        self.load_state()
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def server_time(self) -> int:
+        # Written as `created_at`, so the graph catalog can sync the imported nodes like live ones.
+        with self.lock:
+            self.clock = max(self.clock + 1, int(time.time() * 1000))
+            return self.clock
+
+    def known(self, node_id: str) -> bool:
+        return node_id in self.node_ids or node_id in self.pending
+
+    def export_file(self, kind: str, group: str, properties: dict) -> ExportFile:
+        """
+        Returns the open file of `group` that can take a row with these properties, starting a new chunk when the
+        current one is full or its columns do not fit.
+        """
+        current = self.open_files.get((kind, group))
+        if current is not None and current.rows < self.chunk_rows and current.fits(properties):
+            return current
+
+        columns = dict(current.columns) if current is not None else {}
+        if current is not None:
+            self.commit_file(current, current.close())
+        columns.update((name, column_type(value)) for name, value in properties.items() if value is not None)
+        columns.update((name, "string") for name, value in properties.items() if name not in columns)
+
+        self.sequence += 1
+        relative = os.path.join(kind, f"{group}-{self.run}-{self.sequence:05d}.{self.file_format}")
+        fixed = NODE_COLUMNS if kind == "nodes" else RELATIONSHIP_COLUMNS
+        export_file = ExportFile(self.path(relative), fixed, columns, self.file_format)
+        self.open_files[(kind, group)] = export_file
+        return export_file
+
+    def commit_file(self, export_file: ExportFile, size: int):
+        self.files[os.path.relpath(export_file.path, self.directory)] = size
+
+    def write_node(self, label: str, node_id: str, properties: dict):
+        properties = {name: export_value(value) for name, value in properties.items()}
+        self.export_file("nodes", label, properties).append([node_id, label], properties)
+        self.node_ids.add(node_id)
+        self.exported["nodes"] += 1
+
+    def write_relationship(self, origen: str, tipo: str, destino: str):
+        # Like the MATCH of the Cypher writes: a relationship to a node that was never written is dropped.
+        if not self.known(origen) or not self.known(destino):
+            self.exported["dropped_relationships"] += 1
+            return
+        digest = relationship_digest(origen, tipo, destino)
+        if digest in self.relationships:
+            return
+        self.relationships.add(digest)
+        self.export_file("relationships", tipo, {}).append([origen, destino, tipo], {})
+        self.exported["relationships"] += 1
+
+    def write_user(self, user_id: str):
+        if not self.known(user_id):
+            self.write_node("User", user_id, {"created_at": self.server_time()})
+
+    def write_artifact(self, artifact_id: str):
+        row = self.pending.pop(artifact_id)
+        if row.get("status") == "complete" and row.get("fingerprint"):
+            self.fingerprints.setdefault(row["fingerprint"], {
+                "id": artifact_id,
+                "nodes_inserted": row.get("nodes_inserted"),
+                "relationships_inserted": row.get("relationships_inserted"),
+            })
+        self.write_node("Artifact", artifact_id, {
+            **{field: row.get(field) for field in ARTIFACT_FIELDS}, "created_at": self.server_time()
+        })
+
+    def apply(self, op: WriteOp):
+        for row in op.rows:
+            if op.kind == NODES:
+                label = op.key[0]
+                if self.known(row["id"]):
+                    continue
+                canonical_key = row.get("canonical_key")
+                if canonical_key:
+                    current = self.keys.get((label, canonical_key))
+                    if current is None or row["id"] < current:
+                        self.keys[(label, canonical_key)] = row["id"]
+                self.write_node(label, row["id"], {
+                    "canonical_key": canonical_key, **row["atributos"], "created_at": self.server_time()
+                })
+            elif op.kind == RELATIONSHIPS:
+                self.write_relationship(row["origen"], op.key[1], row["destino"])
+            elif op.kind == ARTIFACTS:
+                if row["id"] in self.node_ids:
+                    continue
+                self.pending[row["id"]] = {**self.pending.get(row["id"], {}), **row}
+                if row.get("status") != PROCESSING_STATUS:
+                    self.write_artifact(row["id"])
+            elif op.kind == ARTIFACT_STATUS:
+                if row["id"] in self.pending:
+                    self.pending[row["id"]]["status"] = row["status"]
+                    if row["status"] != PROCESSING_STATUS:
+                        self.write_artifact(row["id"])
+            elif op.kind == USERS:
+                self.write_user(row["id"])
+            elif op.kind == GENERATED:
+                self.write_relationship(row["artifact_id"], "GENERATED", row["node_id"])
+            elif op.kind == CREATED_BY:
+                self.write_user(row["user_id"])
+                self.write_relationship(row["artifact_id"], "CREATED_BY", row["user_id"])
+            elif op.kind == REVISIONS:
+                self.write_relationship(row["artifact_id"], "REVISION_OF", row["previous_id"])
+            else:
+                raise ValueError(f"Operación de escritura desconocida: {op.kind}")
+
+    def write(self, ops: List[WriteOp]):
+        # Unlike the other stores this is not atomic: rows of a write that fails partway stay in the export files.
+        with self.lock:
+            for op in ops:
+                self.apply(op)
+
+    def find_entities_by_key(self, label: str, keys) -> dict:
+        with self.lock:
+            return {key: self.keys[(label, key)] for key in keys if (label, key) in self.keys}
+
+    def find_artifact_by_fingerprint(self, fingerprint: str) -> Optional[dict]:
+        with self.lock:
+            return self.fingerprints.get(fingerprint)
+
+    def existing_nodes(self) -> List[dict]:
+        # Only the index is kept in memory; the exported properties are not read back.
+        return []
+
+    def artifact_graph(self, artifact_id: str) -> Optional[dict]:
+        # Exported artifacts are not read back; revisions are processed against a live graph.
+        return None
+
+    def similar_nodes(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        return []
+
+    def catalog_page(self, label: str, after: str, fields: List[str], limit: int) -> List[dict]:
+        return []
+
+    def catalog_delta(self, label: str, since: int, fields: List[str]) -> List[dict]:
+        return []
+
+    def manifest(self) -> List[str]:
+        """
+        Arguments of `neo4j-admin database import full` for the committed files, relative to the export directory.
+        """
+        if self.file_format == "parquet":
+            lines = ["--input-type=parquet"]
+        else:
+            lines = [f"--array-delimiter={ARRAY_DELIMITER}", "--multiline-fields=true"]
+        # Entities are shared between runs exported to different directories.
+        lines += ["--skip-duplicate-nodes=true", "--skip-bad-relationships=true"]
+        for relative in sorted(self.files):
+            kind = "nodes" if relative.startswith("nodes") else "relationships"
+            lines.append(f"--{kind}={relative}")
+        return lines
+
+    def state(self) -> dict:
+        return {
+            "version": 1,
+            "format": self.file_format,
+            "clock": self.clock,
+            "node_ids": sorted(self.node_ids),
+            "keys": [[label, key, node_id] for (label, key), node_id in sorted(self.keys.items())],
+            "fingerprints": self.fingerprints,
+            "relationships": sorted(self.relationships),
+            "files": self.files,
+            "sequence": self.sequence,
+        }
+
+    def write_file(self, name: str, content: str):
+        temporary = self.path(f"{name}.tmp")
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temporary, self.path(name))
+
+    def persist(self):
+        """
+        Flushes the CSV files (Parquet chunks are closed) and saves the index and the import arguments.
+        """
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for key, export_file in list(self.open_files.items()):
+                if self.file_format == "csv":
+                    self.commit_file(export_file, export_file.flush())
+                else:
+                    self.commit_file(export_file, export_file.close())
+                    del self.open_files[key]
+            self.write_file(STATE_FILE, json.dumps(self.state()))
+            self.write_file(MANIFEST_FILE, "\n".join(self.manifest()) + "\n")
+
+    def close(self):
+        with self.lock:
+            for artifact_id in list(self.pending):
+                self.write_artifact(artifact_id)
+            for export_file in self.open_files.values():
+                self.commit_file(export_file, export_file.close())
+            self.open_files.clear()
+            self.persist()
+        print(
+            f"[Export] {self.exported['nodes']} nodos y {self.exported['relationships']} relaciones exportados a "
+            f"{self.directory} ({len(self.files)} archivos); {self.exported['dropped_relationships']} relaciones "
+            f"descartadas por nodos inexistentes."
+        )
+
+    def load_state(self):
+        """
+        Loads the index of an earlier export into this directory and discards what it wrote after its last `persist`.
+        """
+        state_path = self.path(STATE_FILE)
+        if not os.path.exists(state_path):
+            return
+        with open(state_path, encoding="utf-8") as file:
+            state = json.load(file)
+        if state["format"] != self.file_format:
+            raise ValueError(f"{self.directory} tiene una exportación en formato {state['format']}.")
+
+        self.clock = state["clock"]
+        self.node_ids = set(state["node_ids"])
+        self.keys = {(label, key): node_id for label, key, node_id in state["keys"]}
+        self.fingerprints = state["fingerprints"]
+        self.relationships = set(state["relationships"])
+        self.files = state["files"]
+        # File numbers keep increasing across runs, so a new run never reuses a committed file name.
+        self.sequence = state["sequence"]
+
+        for kind in ("nodes", "relationships"):
+            for name in os.listdir(self.path(kind)) if os.path.isdir(self.path(kind)) else []:
+                relative = os.path.join(kind, name)
+                if relative not in self.files:
+                    print(f"[Export] Se descarta {relative}, escrito después del último checkpoint.")
+                    os.remove(self.path(relative))
+                elif os.path.getsize(self.path(relative)) > self.files[relative]:
+                    with open(self.path(relative), "r+b") as file:
+                        file.truncate(self.files[relative])
+        print(f"[Export] Continuando la exportación de {self.directory}: {len(self.node_ids)} nodos ya exportados.")
@@ -1,9 +1,12 @@
-from openai import OpenAI
 from openai.types.chat import ParsedChatCompletion
+from openai_scheduler import scheduler, estimate_chat_tokens, get_openai_client, get_async_openai_client
 from pydantic import BaseModel
 from typing import List, Dict
+from llm_cache import cached_parse, cached_parse_async
 
-openai_client = OpenAI()
+
+# Cambiar a True para obtener insights del analista de negocios
+BUSINESS_ANALYSIS_ENABLED = False
 
 class BusinessInsight(BaseModel):
     entity_id: str  # ID of the API, Endpoint, Database, KPI, or Statistic
@@ -14,6 +17,11 @@ class BusinessInsight(BaseModel):
 class BusinessAnalysisResponse(BaseModel):
     insights: List[BusinessInsight]
 
+# Bump when the prompt changes in a way the rendered text does not capture, to invalidate cached responses.
+# Version 2 sends the extracted entities to the model; version 1 only sent the system prompt, so its answers
+# were not about the artifact.
+BUSINESS_ANALYST_PROMPT_VERSION = "2"
+
 BUSINESS_ANALYST_PROMPT = """
 Eres un analista de negocios experto en arquitectura de software y gestión de datos.
 Tu tarea es analizar APIs, Endpoints, Bases de Datos, KPIs y Métodos Estadísticos
@@ -33,24 +41,61 @@ Ejemplo:
 Devuelve un JSON con la estructura `BusinessAnalysisResponse`.
 """
 
+def business_analysis_messages(extracted_entities) -> list:
+    """
+    The entities to analyze go in the user message, so each artifact has its own cache key.
+    """
+    return [
+        {"role": "system", "content": BUSINESS_ANALYST_PROMPT},
+        {"role": "user", "content": f"Entidades extraídas del artifact:\n{extracted_entities.model_dump_json(indent=2)}"}
+    ]
+
 def analyze_business_context(extracted_entities) -> BusinessAnalysisResponse:
     """
     Uses an AI-powered Business Analyst to generate business insights for APIs, Endpoints, Databases, KPIs, and Statistics.
     """
+    if not BUSINESS_ANALYSIS_ENABLED:
+        return BusinessAnalysisResponse(insights=[])
 
-    ### Quitar este bloque para obtener insights del analista de negocios
-    dummy_business_response = BusinessAnalysisResponse(
-        insights=[]
-    )
-    return dummy_business_response
-    ### Fin del bloque
+    messages = business_analysis_messages(extracted_entities)
 
-    prompt = BUSINESS_ANALYST_PROMPT
+    def call() -> BusinessAnalysisResponse:
+        response: ParsedChatCompletion[BusinessAnalysisResponse] = scheduler.submit(
+            "business_analysis", "gpt-4o",
+            lambda: get_openai_client().beta.chat.completions.parse(
+                model="gpt-4o",
+                response_format=BusinessAnalysisResponse,
+                messages=messages
+            ),
+            estimate_chat_tokens(messages)
+        )
+        return response.choices[0].message.parsed
 
-    response: ParsedChatCompletion[BusinessAnalysisResponse] = openai_client.beta.chat.completions.parse(
-        model="gpt-4o",
-        response_format=BusinessAnalysisResponse,
-        messages=[{"role": "system", "content": prompt}]
+    return cached_parse(
+        "business_analysis", "gpt-4o", BUSINESS_ANALYST_PROMPT_VERSION, messages, BusinessAnalysisResponse, call
     )
 
-    return response.choices[0].message.parsed
\ No newline at end of file
+async def analyze_business_context_async(extracted_entities) -> BusinessAnalysisResponse:
+    """
+    Async version of `analyze_business_context`.
+    """
+    if not BUSINESS_ANALYSIS_ENABLED:
+        return BusinessAnalysisResponse(insights=[])
+
+    messages = business_analysis_messages(extracted_entities)
+
+    async def call() -> BusinessAnalysisResponse:
+        response: ParsedChatCompletion[BusinessAnalysisResponse] = await scheduler.submit_async(
+            "business_analysis", "gpt-4o",
+            lambda: get_async_openai_client().beta.chat.completions.parse(
+                model="gpt-4o",
+                response_format=BusinessAnalysisResponse,
+                messages=messages
+            ),
+            estimate_chat_tokens(messages)
+        )
+        return response.choices[0].message.parsed
+
+    return await cached_parse_async(
+        "business_analysis", "gpt-4o", BUSINESS_ANALYST_PROMPT_VERSION, messages, BusinessAnalysisResponse, call
+    )
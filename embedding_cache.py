@@ -0,0 +1,252 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from metrics import register_collector
+
+load_dotenv()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class LRUCache:
+    """
+    Bounded in-process cache that evicts the least recently used entry first.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    On-disk key/value store for binary blobs, bounded by total size.
+    When the size limit is exceeded, the least recently accessed entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, table: str = "entries"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+        self._total_bytes = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+    def get_many(self, keys: List[str], max_age: Optional[float] = None) -> Dict[str, bytes]:
+        """
+        Returns the stored values for the given keys, skipping entries older than `max_age` seconds.
+        """
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement.
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if max_age is not None and now - created_at > max_age:
+                        continue
+                    found[key] = value
+
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def put_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for key, value in items.items():
+                previous = self._conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if previous:
+                    self._total_bytes -= previous[0]
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now)
+                )
+                self._total_bytes += len(value)
+            self._conn.execute("COMMIT")
+            self._evict()
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Evict down to 90% of the limit so we do not evict on every insert once full.
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def pack_vector(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(data: bytes) -> array:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with an in-process LRU tier in front of a SQLite tier.
+    Entries are keyed by (model, dimensions, hash of the normalized text).
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES,
+                 max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.memory = LRUCache(memory_entries)
+        self.disk = SQLiteStore(path, max_bytes, table="embeddings") if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions or 'native'}:f32:{digest}"
+
+    def get_many(self, model: str, dimensions: Optional[int], texts: Iterable[str]) -> Dict[str, array]:
+        """
+        Returns the cached vectors for the given texts, keyed by text. Texts not in the cache are omitted.
+        """
+        found = {}
+        pending = {}
+        for text in texts:
+            key = self.make_key(model, dimensions, text)
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[text] = vector
+                self.memory_hits += 1
+            else:
+                pending.setdefault(key, []).append(text)
+
+        if pending and self.disk is not None:
+            for key, data in self.disk.get_many(list(pending)).items():
+                vector = unpack_vector(data)
+                self.memory.put(key, vector)
+                for text in pending.pop(key):
+                    found[text] = vector
+                    self.disk_hits += 1
+
+        self.misses += sum(len(missing) for missing in pending.values())
+        return found
+
+    def put_many(self, model: str, dimensions: Optional[int], vectors: Dict[str, Iterable[float]]):
+        to_disk = {}
+        for text, vector in vectors.items():
+            key = self.make_key(model, dimensions, text)
+            self.memory.put(key, vector)
+            to_disk[key] = pack_vector(vector)
+
+        if self.disk is not None:
+            self.disk.put_many(to_disk)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_bytes": self.disk.total_bytes if self.disk is not None else 0,
+        }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Returns the process-wide embedding cache, or None when caching is disabled.
+    """
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def collect_embedding_cache_metrics():
+    if _embedding_cache is None:
+        return
+    stats = _embedding_cache.stats()
+    yield ("embedding_cache_lookups_total", "counter", "Embedding cache lookups by tier and result.", [
+        ({"result": "memory_hit"}, stats["memory_hits"]),
+        ({"result": "disk_hit"}, stats["disk_hits"]),
+        ({"result": "miss"}, stats["misses"]),
+    ])
+    yield ("embedding_cache_hit_ratio", "gauge", "Share of embedding lookups served from the cache.",
+           [({}, stats["hit_rate"])])
+
+
+register_collector(collect_embedding_cache_metrics)
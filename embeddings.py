@@ -0,0 +1,118 @@
+import os
+import asyncio
+from typing import Dict, List
+from dotenv import load_dotenv
+from embedding_cache import get_embedding_cache
+from openai_scheduler import scheduler, estimate_embedding_tokens, get_openai_client, get_async_openai_client
+from vectors import Embedding, EMBEDDING_DIMENSIONS, compact_vector
+
+load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# The embeddings API accepts up to 2048 inputs per request; we stay well below it and also
+# cap the characters per request so a batch of long SQL/code fields never exceeds the token limit.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "512"))
+EMBEDDING_BATCH_MAX_CHARS = int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", "400000"))
+
+
+def split_into_batches(texts: List[str], max_items: int = EMBEDDING_BATCH_SIZE,
+                       max_chars: int = EMBEDDING_BATCH_MAX_CHARS) -> List[List[str]]:
+    """
+    Splits texts into consecutive batches bounded by item count and total characters.
+    """
+    batches = []
+    current = []
+    current_chars = 0
+
+    for text in texts:
+        if current and (len(current) >= max_items or current_chars + len(text) > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(text)
+        current_chars += len(text)
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def embedding_request_options() -> dict:
+    options = {"model": EMBEDDING_MODEL}
+    if EMBEDDING_DIMENSIONS:
+        options["dimensions"] = EMBEDDING_DIMENSIONS
+    return options
+
+
+def lookup_cached(unique_texts: List[str]) -> Dict[str, Embedding]:
+    cache = get_embedding_cache()
+    if not cache:
+        return {}
+    return {
+        text: compact_vector(vector)
+        for text, vector in cache.get_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, unique_texts).items()
+    }
+
+
+def store_cached(vectors: Dict[str, Embedding]):
+    cache = get_embedding_cache()
+    if cache:
+        cache.put_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, vectors)
+
+
+def response_vectors(batch: List[str], response) -> Dict[str, Embedding]:
+    return {batch[item.index]: compact_vector(item.embedding) for item in response.data}
+
+
+def embed_texts(texts: List[str]) -> List[Embedding]:
+    """
+    Embeds many texts with the list `input` form of the embeddings API.
+    Vectors are returned in the compact form of vectors.py (float32 or int8), with EMBEDDING_DIMENSIONS
+    dimensions when it is set.
+    Texts already in the embedding cache are not sent, duplicated texts are sent once,
+    and the returned vectors keep the order of `texts`.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    vectors = lookup_cached(unique_texts)
+    missing = [text for text in unique_texts if text not in vectors]
+
+    for batch in split_into_batches(missing):
+        response = scheduler.submit(
+            "embeddings", EMBEDDING_MODEL,
+            lambda: get_openai_client().embeddings.create(input=batch, **embedding_request_options()),
+            estimate_embedding_tokens(batch)
+        )
+        batch_vectors = response_vectors(batch, response)
+        store_cached(batch_vectors)
+        vectors.update(batch_vectors)
+
+    return [vectors[text] for text in texts]
+
+
+async def embed_texts_async(texts: List[str]) -> List[Embedding]:
+    """
+    Async version of `embed_texts`. All batches are requested concurrently.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    vectors = lookup_cached(unique_texts)
+    missing = [text for text in unique_texts if text not in vectors]
+
+    async def embed_batch(batch):
+        response = await scheduler.submit_async(
+            "embeddings", EMBEDDING_MODEL,
+            lambda: get_async_openai_client().embeddings.create(input=batch, **embedding_request_options()),
+            estimate_embedding_tokens(batch)
+        )
+        return response_vectors(batch, response)
+
+    for batch_vectors in await asyncio.gather(*(embed_batch(batch) for batch in split_into_batches(missing))):
+        store_cached(batch_vectors)
+        vectors.update(batch_vectors)
+
+    return [vectors[text] for text in texts]
+
+
+def embed_with_openai_large(text: str) -> Embedding:
+    return embed_texts([text])[0]
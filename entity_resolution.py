@@ -0,0 +1,185 @@
+"""
+Cross-artifact entity resolution.
+
+New nodes get the id of the entity they represent instead of a fresh uuid4, so the `orders` table seen in many
+artifacts stays one Table node. An entity is matched by its canonical key (normalized base_url, method+path under
+its API, table name, normalized SQL...) against the `canonical_key` of the graph nodes, looked up in the graph
+catalog (graph_catalog.py); nodes without a key match fall back to a vector search with a high similarity
+threshold. Unmatched nodes get a stable uuid5 from their key.
+"""
+import os
+from collections import defaultdict
+from typing import Optional
+from dotenv import load_dotenv
+from fingerprint import compute_entity_key, stable_entity_id
+from insertion import NODE_TYPE_MAPPING
+from graph_catalog import find_entity_ids, find_entity_ids_async
+from retrieval import retrieval_vector, search_similar, search_similar_async
+
+load_dotenv()
+
+ENTITY_RESOLUTION_ENABLED = os.getenv("ENTITY_RESOLUTION_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity for the embedding fallback to consider two nodes the same entity.
+ENTITY_RESOLUTION_MIN_SCORE = float(os.getenv("ENTITY_RESOLUTION_MIN_SCORE", "0.95"))
+
+# Labels whose keys come from free text written by the LLM; they also use the embedding fallback.
+FUZZY_KEY_LABELS = {"Database", "KPI", "Statistic"}
+
+
+def node_label(nodo) -> str:
+    return NODE_TYPE_MAPPING.get(nodo.__class__.__name__)
+
+
+def resolution_batches(nodos) -> list:
+    """
+    Splits the nodes in the order they must be resolved: APIs first, because endpoint keys use the API id.
+    """
+    apis = [nodo for nodo in nodos if node_label(nodo) == "API"]
+    others = [nodo for nodo in nodos if node_label(nodo) not in ("API", None, "Artifact")]
+    return [batch for batch in (apis, others) if batch]
+
+
+def keys_by_label(nodos) -> dict:
+    keys = defaultdict(set)
+    for nodo in nodos:
+        key = compute_entity_key(nodo)
+        if key:
+            keys[node_label(nodo)].add(key)
+    return keys
+
+
+def fallback_requests(nodos, key_ids: dict) -> dict:
+    """
+    Builds the same-label vector searches for the nodes that need the embedding fallback.
+    """
+    requests = defaultdict(list)
+    for nodo in nodos:
+        label = node_label(nodo)
+        key = compute_entity_key(nodo)
+        if key in key_ids.get(label, {}):
+            continue
+        if key is not None and label not in FUZZY_KEY_LABELS:
+            continue
+
+        search = retrieval_vector(nodo)
+        if search is not None:
+            requests[label].append({"source": nodo.id, "vector": list(search[1])})
+    return requests
+
+
+def best_matches(matches, new_ids, min_score: float = ENTITY_RESOLUTION_MIN_SCORE) -> dict:
+    best = {}
+    for match in matches:
+        if match["id"] in new_ids or match["score"] < min_score:
+            continue
+        if match["source"] not in best or match["score"] > best[match["source"]]["score"]:
+            best[match["source"]] = match
+    return {source: match["id"] for source, match in best.items()}
+
+
+def assign_ids(nodos, key_ids: dict, similar_ids: dict, id_map: dict):
+    """
+    Replaces the id of each node by the id of its existing entity, or by the stable id of its key.
+    """
+    for nodo in nodos:
+        label = node_label(nodo)
+        key = compute_entity_key(nodo)
+        if key in key_ids.get(label, {}):
+            canonical_id = key_ids[label][key]
+        elif nodo.id in similar_ids:
+            canonical_id = similar_ids[nodo.id]
+        elif key is not None:
+            canonical_id = stable_entity_id(nodo.__class__.__name__, key)
+        else:
+            continue
+
+        id_map[nodo.id] = canonical_id
+        nodo.id = canonical_id
+
+
+def remap_endpoint_apis(nodos, id_map: dict):
+    for nodo in nodos:
+        if node_label(nodo) == "Endpoint" and nodo.api_id in id_map:
+            nodo.api_id = id_map[nodo.api_id]
+
+
+def deduplicate(nodos) -> list:
+    unique = {}
+    for nodo in nodos:
+        unique.setdefault(nodo.id, nodo)
+    return list(unique.values())
+
+
+def report(nodos, id_map: dict, existing_ids: set):
+    matched = sum(1 for nodo in nodos if nodo.id in existing_ids)
+    print(
+        f"[Entidades] {matched} de {len(nodos)} nodos resueltos a entidades existentes; "
+        f"{len(id_map) - len(set(id_map.values()))} duplicados dentro del artifact."
+    )
+
+
+def remap_relationships(relaciones, id_map: dict) -> list:
+    """
+    Points relationships computed before resolution to the canonical ids, dropping the duplicates and the
+    self-loops left when both ends were merged into the same entity.
+    """
+    remapped = {}
+    for relacion in relaciones:
+        origen = id_map.get(relacion.origen, relacion.origen)
+        destino = id_map.get(relacion.destino, relacion.destino)
+        if origen != destino:
+            remapped.setdefault(
+                (origen, destino, relacion.tipo),
+                relacion.model_copy(update={"origen": origen, "destino": destino})
+            )
+    return list(remapped.values())
+
+
+def resolve_entities(nodos, id_map: Optional[dict] = None) -> list:
+    """
+    Maps the new nodes onto the canonical ids of the entities already in the graph and returns them
+    without duplicates. Endpoints are updated to point to the canonical id of their API.
+    When `id_map` is given, it is filled with the original id -> canonical id of every remapped node.
+    """
+    if not ENTITY_RESOLUTION_ENABLED:
+        return nodos
+
+    id_map = {} if id_map is None else id_map
+    existing_ids = set()
+    for batch in resolution_batches(nodos):
+        remap_endpoint_apis(batch, id_map)
+        key_ids = {label: find_entity_ids(label, keys) for label, keys in keys_by_label(batch).items()}
+        matches = search_similar(fallback_requests(batch, key_ids), 1)
+        similar_ids = best_matches(matches, {nodo.id for nodo in batch})
+
+        existing_ids |= {node_id for ids in key_ids.values() for node_id in ids.values()} | set(similar_ids.values())
+        assign_ids(batch, key_ids, similar_ids, id_map)
+
+    resolved = deduplicate(nodos)
+    report(resolved, id_map, existing_ids)
+    return resolved
+
+
+async def resolve_entities_async(nodos, id_map: Optional[dict] = None) -> list:
+    """
+    Async version of `resolve_entities`.
+    """
+    if not ENTITY_RESOLUTION_ENABLED:
+        return nodos
+
+    id_map = {} if id_map is None else id_map
+    existing_ids = set()
+    for batch in resolution_batches(nodos):
+        remap_endpoint_apis(batch, id_map)
+        key_ids = {
+            label: await find_entity_ids_async(label, keys) for label, keys in keys_by_label(batch).items()
+        }
+        matches = await search_similar_async(fallback_requests(batch, key_ids), 1)
+        similar_ids = best_matches(matches, {nodo.id for nodo in batch})
+
+        existing_ids |= {node_id for ids in key_ids.values() for node_id in ids.values()} | set(similar_ids.values())
+        assign_ids(batch, key_ids, similar_ids, id_map)
+
+    resolved = deduplicate(nodos)
+    report(resolved, id_map, existing_ids)
+    return resolved
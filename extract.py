@@ -1,14 +1,22 @@
-from openai import OpenAI
 from openai.types.chat import ParsedChatCompletion
+from openai_scheduler import scheduler, estimate_chat_tokens, get_openai_client, get_async_openai_client
 from pydantic import BaseModel
 from typing import List, Optional
 from nodes import APINode, EndpointNode, DatabaseNode, QueryNode, TableNode, KPINode, StatisticNode
 from relations import KnowledgeRelationshipsCollection, KnowledgeRelationship
 from dotenv import load_dotenv
+import os
+from static_extract import extract_static, merge_extracted_entities, describe_static_extraction
+from minify import minify_code, token_report
+from llm_cache import cached_parse, cached_parse_async
 
 load_dotenv()
 
-openai_api_client = OpenAI()
+# Run the deterministic parser before the LLM and skip the LLM when it resolves everything.
+STATIC_EXTRACTION_ENABLED = os.getenv("STATIC_EXTRACTION_ENABLED", "true").lower() == "true"
+# Strip comments, styling and static JSX from the code sent to the LLM.
+ARTIFACT_MINIFY_ENABLED = os.getenv("ARTIFACT_MINIFY_ENABLED", "true").lower() == "true"
+
 
 class ExtractedEntities(BaseModel):
     apis: List[APINode]
@@ -18,6 +26,9 @@ class ExtractedEntities(BaseModel):
     tables: List[TableNode]
     relationships: KnowledgeRelationshipsCollection
 
+# Bump when the prompt or the post-processing of its answer changes, to invalidate cached responses.
+EXTRACTION_PROMPT_VERSION = "1"
+
 EXTRACTION_PROMPT = """You are an advanced code analyzer specialized in extracting APIs, endpoints, database interactions, tables, and queries from source code.
 The provided code will contain UI components, charts, and data processing logic.
 
@@ -142,28 +153,138 @@ export default OrderTable;
 {codigo}
 """
 
-def extract_metadata(code: str) -> ExtractedEntities:
-    response: ParsedChatCompletion[ExtractedEntities] = openai_api_client.beta.chat.completions.parse(
-        model="gpt-4o",
-        response_format=ExtractedEntities,
-        messages=[{"role": "system", "content": EXTRACTION_PROMPT.format(codigo=code)}]
+def build_extraction_messages(code: str, static_extraction=None) -> list:
+    messages = [{"role": "system", "content": EXTRACTION_PROMPT.format(codigo=code)}]
+    if static_extraction is not None and not static_extraction.empty:
+        messages.append({"role": "user", "content": describe_static_extraction(static_extraction)})
+    return messages
+
+def extract_metadata(code: str, static_extraction=None) -> ExtractedEntities:
+    messages = build_extraction_messages(code, static_extraction)
+
+    def call() -> ExtractedEntities:
+        response: ParsedChatCompletion[ExtractedEntities] = scheduler.submit(
+            "extraction", "gpt-4o",
+            lambda: get_openai_client().beta.chat.completions.parse(
+                model="gpt-4o",
+                response_format=ExtractedEntities,
+                messages=messages
+            ),
+            estimate_chat_tokens(messages)
+        )
+        return response.choices[0].message.parsed
+
+    return cached_parse(
+        "extraction", "gpt-4o", EXTRACTION_PROMPT_VERSION, messages, ExtractedEntities, call, cacheable=has_entities
+    )
+
+async def extract_metadata_async(code: str, static_extraction=None) -> ExtractedEntities:
+    messages = build_extraction_messages(code, static_extraction)
+
+    async def call() -> ExtractedEntities:
+        response: ParsedChatCompletion[ExtractedEntities] = await scheduler.submit_async(
+            "extraction", "gpt-4o",
+            lambda: get_async_openai_client().beta.chat.completions.parse(
+                model="gpt-4o",
+                response_format=ExtractedEntities,
+                messages=messages
+            ),
+            estimate_chat_tokens(messages)
+        )
+        return response.choices[0].message.parsed
+
+    return await cached_parse_async(
+        "extraction", "gpt-4o", EXTRACTION_PROMPT_VERSION, messages, ExtractedEntities, call, cacheable=has_entities
     )
 
-    return response.choices[0].message.parsed
+def empty_extraction() -> ExtractedEntities:
+    return ExtractedEntities(
+        apis=[], endpoints=[], databases=[], queries=[], tables=[],
+        relationships=KnowledgeRelationshipsCollection(relaciones=[])
+    )
+
+def has_entities(extracted_entities: ExtractedEntities) -> bool:
+    return bool(
+        extracted_entities.apis or extracted_entities.endpoints or extracted_entities.databases
+        or extracted_entities.queries or extracted_entities.tables or extracted_entities.relationships.relaciones
+    )
+
+def run_static_extraction(artifact_code):
+    """
+    Returns the static extraction of the artifact, or None when it is disabled.
+    """
+    if not STATIC_EXTRACTION_ENABLED:
+        return None
+
+    static_extraction = extract_static(artifact_code)
+    if static_extraction.complete:
+        print("[Static] Extracción estática completa; se omite la llamada al LLM.")
+    else:
+        print(f"[Static] Elementos sin resolver: {static_extraction.unresolved}")
+    return static_extraction
+
+def prepare_prompt_code(artifact_code):
+    """
+    Returns the code to send in the extraction prompt, minified when enabled, and prints the token reduction.
+    """
+    if not ARTIFACT_MINIFY_ENABLED:
+        return artifact_code
+
+    prompt_code = minify_code(artifact_code)
+    report = token_report(artifact_code, prompt_code)
+    print(
+        f"[Minify] Tokens del código: {report['original_tokens']} -> {report['minified_tokens']} "
+        f"({report['reduction']:.1%} menos)"
+    )
+    return prompt_code
+
+def combine_with_static(static_extraction, extracted_entities: ExtractedEntities) -> ExtractedEntities:
+    if static_extraction is None:
+        return extracted_entities
+    return merge_extracted_entities(static_extraction, extracted_entities)
 
 def extract_metadata_with_retries(artifact_code, max_retries=2):
     """
     Intenta extraer metadatos hasta `max_retries` veces si la primera ejecución falla.
+    Primero corre la extracción estática; si resuelve todo el código, no se llama al LLM.
+    Al LLM se le envía el código minificado (ver `minify.py`).
     """
+    static_extraction = run_static_extraction(artifact_code)
+    if static_extraction is not None and static_extraction.complete:
+        return static_extraction.to_entities()
+
+    prompt_code = prepare_prompt_code(artifact_code)
+    for attempt in range(max_retries):
+        print(f"[Neo4j] Extrayendo información del código... (Intento {attempt + 1})")
+        extracted_entities = combine_with_static(static_extraction, extract_metadata(prompt_code, static_extraction))
+
+        if has_entities(extracted_entities):
+            return extracted_entities
+
+        print("[Warning] No se encontraron entidades en este intento.")
+
+    print("[Error] No se encontraron entidades después de varios intentos.")
+    return extracted_entities
+
+async def extract_metadata_with_retries_async(artifact_code, max_retries=2):
+    """
+    Versión asíncrona de `extract_metadata_with_retries`.
+    """
+    static_extraction = run_static_extraction(artifact_code)
+    if static_extraction is not None and static_extraction.complete:
+        return static_extraction.to_entities()
+
+    prompt_code = prepare_prompt_code(artifact_code)
     for attempt in range(max_retries):
         print(f"[Neo4j] Extrayendo información del código... (Intento {attempt + 1})")
-        extracted_entities = extract_metadata(artifact_code)
+        extracted_entities = combine_with_static(
+            static_extraction, await extract_metadata_async(prompt_code, static_extraction)
+        )
 
-        if extracted_entities.apis or extracted_entities.endpoints or extracted_entities.databases \
-           or extracted_entities.queries or extracted_entities.tables or extracted_entities.relationships.relaciones:
+        if has_entities(extracted_entities):
             return extracted_entities
 
         print("[Warning] No se encontraron entidades en este intento.")
 
     print("[Error] No se encontraron entidades después de varios intentos.")
-    return extracted_entities
\ No newline at end of file
+    return extracted_entities
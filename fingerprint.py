@@ -0,0 +1,66 @@
+import re
+import uuid
+import hashlib
+from typing import Optional
+from urllib.parse import urlsplit
+from static_extract import normalize_sql
+
+def normalize_code(code: str) -> str:
+    """
+    Normalizes artifact code so that cosmetic differences (line endings, trailing
+    whitespace, surrounding blank lines) do not change its fingerprint.
+    """
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+def compute_artifact_fingerprint(code: str) -> str:
+    """
+    Returns the content fingerprint (sha256 of the normalized code) of an artifact.
+    """
+    return hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+
+# Namespace of the stable ids given to entities (APIs, tables, queries...) from their canonical key.
+ENTITY_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "llm-extract-artifact-information/entity")
+
+PATH_PARAMETER = re.compile(r"\$\{[^}]*\}|\{[^}]*\}|:[A-Za-z_]\w*|<[^>]*>")
+
+def normalize_base_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        return url.strip().rstrip("/").lower()
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+def normalize_endpoint_path(path: str) -> str:
+    """
+    Reduces an endpoint path (relative or absolute URL) to its path, with every parameter written as `{}`.
+    """
+    path = urlsplit(path.strip()).path if "://" in path else path.strip().split("?")[0]
+    return "/" + PATH_PARAMETER.sub("{}", path).strip("/")
+
+def compute_entity_key(node) -> Optional[str]:
+    """
+    Returns the canonical key of an extracted entity, or None when it has no identifying data.
+    Endpoints are keyed by their API id, so APIs must be resolved before their endpoints.
+    """
+    node_class = node.__class__.__name__
+    if node_class == "APINode":
+        key = normalize_base_url(node.base_url or "")
+    elif node_class == "EndpointNode":
+        key = f"{node.api_id}|{(node.method or 'GET').upper()}|{normalize_endpoint_path(node.path or '')}"
+    elif node_class == "TableNode":
+        key = (node.nombre_tabla or "").split(".")[-1].strip().lower()
+    elif node_class == "QueryNode":
+        key = normalize_sql(node.sql_query or "") or " ".join((node.cypher_query or "").split()).lower()
+    elif node_class == "DatabaseNode":
+        name = (node.name or "").strip().lower()
+        key = f"{(node.type or '').strip().lower()}|{name}" if name else ""
+    elif node_class == "KPINode":
+        key = (node.nombre or "").strip().lower()
+    elif node_class == "StatisticNode":
+        key = (node.name or "").strip().lower()
+    else:
+        key = ""
+    return key or None
+
+def stable_entity_id(node_class: str, key: str) -> str:
+    return str(uuid.uuid5(ENTITY_ID_NAMESPACE, f"{node_class}|{key}"))
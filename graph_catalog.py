@@ -0,0 +1,286 @@
+"""
+In-process catalog of the entity nodes in the graph.
+
+Keeps, per node, its label, canonical key and a few identifying fields (never properties with embeddings), so
+entity resolution can match canonical keys and the relationship step can get the existing nodes its rules can
+decide (tables named in a query's SQL, the API of an endpoint, ...) without reading the graph per artifact.
+It is loaded once with paged queries, updated with the nodes the pipeline writes and synced every
+GRAPH_CATALOG_SYNC_SECONDS with the nodes created since the last sync (by their `created_at`), which covers
+the writes of other processes.
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from dotenv import load_dotenv
+from fingerprint import compute_entity_key
+from metrics import register_collector
+from relationship_rules import sql_table_names
+from insertion import NODE_TYPE_MAPPING, ENTITY_LABELS, find_entities_by_key, find_entities_by_key_async, get_graph_store
+
+load_dotenv()
+
+GRAPH_CATALOG_ENABLED = os.getenv("GRAPH_CATALOG_ENABLED", "true").lower() == "true"
+GRAPH_CATALOG_PAGE_SIZE = int(os.getenv("GRAPH_CATALOG_PAGE_SIZE", "5000"))
+GRAPH_CATALOG_SYNC_SECONDS = float(os.getenv("GRAPH_CATALOG_SYNC_SECONDS", "60"))
+# `created_at` is taken when the writing transaction starts, so a node committed after a sync may be older than its
+# watermark; each sync also re-reads the nodes created this long before it.
+GRAPH_CATALOG_SYNC_OVERLAP_MS = int(os.getenv("GRAPH_CATALOG_SYNC_OVERLAP_MS", "120000"))
+
+# Identifying fields kept per label, in this order; descriptions, SQL and embeddings stay in the graph.
+CATALOG_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "API": ("name", "base_url"),
+    "Endpoint": ("api_id", "method", "path"),
+    "Database": ("name", "type"),
+    "Query": ("pregunta_generica",),
+    "Table": ("nombre_tabla",),
+    "KPI": ("nombre",),
+    "Statistic": ("name",),
+    "Visualization": ("tipo", "eje_x"),
+}
+
+# Fields the catalog can be searched by (label -> field), lower-cased.
+LOOKUP_FIELDS = {
+    "Table": "nombre_tabla",
+    "Endpoint": "api_id",
+}
+
+class CatalogEntry(NamedTuple):
+    label: str
+    canonical_key: Optional[str]
+    values: tuple
+
+
+def lookup_value(value) -> Optional[str]:
+    return str(value).lower() if value else None
+
+
+class GraphCatalog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Held while loading or syncing, so lookups are not blocked by the queries.
+        self.refresh_lock = threading.Lock()
+        self.entries: Dict[str, CatalogEntry] = {}
+        # (label, canonical key) -> smallest node id with that key, as `find_entities_by_key` returns.
+        self.keys: Dict[Tuple[str, str], str] = {}
+        # (label, lower-cased LOOKUP_FIELDS value) -> node ids
+        self.lookups: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self.loaded = False
+        self.synced_at = 0.0
+        # Server time (`timestamp()`) at the start of the last load or sync.
+        self.watermark: Optional[int] = None
+
+    def add(self, node_id: str, label: str, canonical_key: Optional[str], values: Iterable):
+        label = sys.intern(label)
+        entry = CatalogEntry(label, canonical_key, tuple(values))
+        with self.lock:
+            self.entries[node_id] = entry
+            if canonical_key:
+                current = self.keys.get((label, canonical_key))
+                if current is None or node_id < current:
+                    self.keys[(label, canonical_key)] = node_id
+            field = LOOKUP_FIELDS.get(label)
+            if field:
+                value = lookup_value(entry.values[CATALOG_FIELDS[label].index(field)])
+                if value:
+                    self.lookups[(label, value)].add(node_id)
+
+    def add_record(self, label: str, record):
+        self.add(record["id"], label, record["canonical_key"], record["values"])
+
+    def add_nodes(self, nodos):
+        """
+        Adds the nodes just written by the pipeline.
+        """
+        for nodo in nodos:
+            label = NODE_TYPE_MAPPING.get(nodo.__class__.__name__)
+            if label in CATALOG_FIELDS:
+                self.add(nodo.id, label, compute_entity_key(nodo),
+                         (getattr(nodo, field, None) for field in CATALOG_FIELDS[label]))
+
+    def load(self):
+        """
+        Reads every entity node, one page of GRAPH_CATALOG_PAGE_SIZE ids at a time per label.
+        """
+        started = time.perf_counter()
+        store = get_graph_store()
+        watermark = store.server_time()
+        for label in ENTITY_LABELS:
+            after = ""
+            while True:
+                count = 0
+                # Records are consumed as they stream in; only the catalog fields are kept.
+                for record in store.catalog_page(label, after, list(CATALOG_FIELDS[label]), GRAPH_CATALOG_PAGE_SIZE):
+                    self.add_record(label, record)
+                    after = record["id"]
+                    count += 1
+                if count < GRAPH_CATALOG_PAGE_SIZE:
+                    break
+
+        with self.lock:
+            self.loaded = True
+            self.watermark = watermark
+            self.synced_at = time.monotonic()
+        print(f"[Catálogo] {len(self)} nodos cargados en {time.perf_counter() - started:.2f}s.")
+
+    def sync(self):
+        """
+        Adds the nodes created since the last load or sync, including those written by other processes.
+        """
+        store = get_graph_store()
+        watermark = store.server_time()
+        since = self.watermark - GRAPH_CATALOG_SYNC_OVERLAP_MS
+        added = 0
+        for label in ENTITY_LABELS:
+            for record in store.catalog_delta(label, since, list(CATALOG_FIELDS[label])):
+                with self.lock:
+                    known = record["id"] in self.entries
+                # Nodes in the overlap are usually known already; adding them again is harmless.
+                self.add_record(label, record)
+                added += not known
+
+        with self.lock:
+            self.watermark = watermark
+            self.synced_at = time.monotonic()
+        if added:
+            print(f"[Catálogo] {added} nodos nuevos sincronizados.")
+
+    def refresh(self) -> bool:
+        """
+        Loads the catalog the first time and syncs it when it is older than GRAPH_CATALOG_SYNC_SECONDS.
+        Returns False if the graph could not be read and the catalog was never loaded.
+        """
+        with self.refresh_lock:
+            try:
+                stale = time.monotonic() - self.synced_at >= GRAPH_CATALOG_SYNC_SECONDS
+                if not self.loaded and (stale or not self.synced_at):
+                    self.load()
+                elif self.loaded and stale:
+                    self.sync()
+            except Exception as e:
+                # Retried after GRAPH_CATALOG_SYNC_SECONDS; meanwhile callers fall back to querying the graph.
+                self.synced_at = time.monotonic()
+                print(f"[Warning] No se pudo actualizar el catálogo del grafo: {e}")
+            return self.loaded
+
+    def find_by_keys(self, label: str, keys) -> dict:
+        with self.lock:
+            return {key: self.keys[(label, key)] for key in keys if (label, key) in self.keys}
+
+    def find_by_field(self, label: str, value) -> Set[str]:
+        with self.lock:
+            return set(self.lookups.get((label, lookup_value(value)), ()))
+
+    def node_data(self, node_id: str) -> Optional[dict]:
+        """
+        Returns the node in the format of `get_existing_nodes`, with only the catalog fields.
+        """
+        with self.lock:
+            entry = self.entries.get(node_id)
+        if entry is None:
+            return None
+        return {"id": node_id, "tipo": entry.label, **dict(zip(CATALOG_FIELDS[entry.label], entry.values))}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+catalog = GraphCatalog()
+
+
+def catalog_ready() -> bool:
+    return GRAPH_CATALOG_ENABLED and catalog.refresh()
+
+
+async def catalog_ready_async() -> bool:
+    return GRAPH_CATALOG_ENABLED and await asyncio.to_thread(catalog.refresh)
+
+
+def find_entity_ids(label: str, keys) -> dict:
+    """
+    Returns the id of the existing `label` node for each canonical key, from the catalog or, when it is
+    disabled or unavailable, from the graph.
+    """
+    if catalog_ready():
+        return catalog.find_by_keys(label, keys)
+    return find_entities_by_key(label, keys)
+
+
+async def find_entity_ids_async(label: str, keys) -> dict:
+    if await catalog_ready_async():
+        return catalog.find_by_keys(label, keys)
+    return await find_entities_by_key_async(label, keys)
+
+
+def rule_candidate_ids(nodos) -> Set[str]:
+    """
+    Ids of the existing nodes the relationship rules can link to the new ones: tables named in the SQL of new
+    queries and databases, the API of new endpoints and the endpoints of new APIs.
+    """
+    ids = set()
+    for nodo in nodos:
+        label = NODE_TYPE_MAPPING.get(nodo.__class__.__name__)
+        if label == "Query":
+            tables = sql_table_names(nodo.sql_query)
+        elif label == "Database":
+            tables = sql_table_names(nodo.query_pattern)
+        else:
+            tables = set()
+        for table in tables:
+            ids |= catalog.find_by_field("Table", table)
+
+        if label == "Endpoint":
+            ids.add(nodo.api_id)
+        elif label == "API":
+            ids |= catalog.find_by_field("Endpoint", nodo.id)
+    return ids - {nodo.id for nodo in nodos}
+
+
+def catalog_candidates(nodos) -> List[dict]:
+    """
+    Returns the existing nodes found by `rule_candidate_ids`, in the format of `get_existing_nodes`.
+    """
+    candidates = [catalog.node_data(node_id) for node_id in sorted(rule_candidate_ids(nodos))]
+    return [candidate for candidate in candidates if candidate is not None]
+
+
+def merge_catalog_candidates(retrieved: List[dict], nodos) -> List[dict]:
+    known = {node_data["id"] for node_data in retrieved}
+    added = [candidate for candidate in catalog_candidates(nodos) if candidate["id"] not in known]
+    if added:
+        print(f"[Catálogo] {len(added)} nodos existentes agregados por reglas.")
+    return retrieved + added
+
+
+def merge_candidates(retrieved: List[dict], nodos) -> List[dict]:
+    """
+    Adds the catalog candidates to the nodes found by similarity; a node found by both keeps its retrieved data.
+    """
+    if not catalog_ready():
+        return retrieved
+    return merge_catalog_candidates(retrieved, nodos)
+
+
+async def merge_candidates_async(retrieved: List[dict], nodos) -> List[dict]:
+    if not await catalog_ready_async():
+        return retrieved
+    return merge_catalog_candidates(retrieved, nodos)
+
+
+def record_written_nodes(nodos):
+    """
+    Adds freshly written nodes to the catalog, if it was loaded.
+    """
+    if catalog.loaded:
+        catalog.add_nodes(nodos)
+
+
+def collect_catalog_metrics():
+    yield ("graph_catalog_nodes", "gauge", "Nodes in the in-process graph catalog.", [({}, len(catalog))])
+
+
+register_collector(collect_catalog_metrics)
@@ -0,0 +1,500 @@
+"""
+Graph-store interface and its embedded in-memory implementation.
+
+The pipeline talks to the graph through a `GraphStore`: writes are lists of `WriteOp` (rows to merge for one kind
+of node or relationship) and reads are the few lookups the pipeline needs (canonical keys, artifact fingerprints,
+existing nodes, similarity search, catalog pages). `insertion.BoltGraphStore` runs them as Cypher on Neo4j or
+Memgraph; `MemoryGraphStore` keeps the graph in process, indexed by id, label and canonical key, and can be saved
+to and loaded from a snapshot file and pushed later to a Bolt server. GRAPH_STORE picks the backend.
+"""
+import os
+import json
+import math
+import time
+import base64
+import heapq
+import asyncio
+import operator
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from dotenv import load_dotenv
+from vectors import decode_embedding, decode_embedding_properties
+
+load_dotenv()
+
+# "bolt" (Neo4j/Memgraph server), "memory" (embedded, see MemoryGraphStore) or "bulk" (import files, see bulk_export.py).
+GRAPH_STORE = os.getenv("GRAPH_STORE", "bolt").lower()
+GRAPH_SNAPSHOT_PATH = os.getenv("GRAPH_SNAPSHOT_PATH", ".cache/graph_snapshot.json")
+
+# Kinds of write, with their key and rows:
+#   nodes            (label,)                    {"id", "canonical_key", "atributos"}
+#   relationships    (origin label, type,        {"origen", "destino"}; an empty label matches any node
+#                     destination label)
+#   artifacts        ()                          {"id", *ARTIFACT_FIELDS}
+#   artifact_status  ()                          {"id", "status"}
+#   users            ()                          {"id"}
+#   generated        (node label,)               {"artifact_id", "node_id"}
+#   created_by       ()                          {"user_id", "artifact_id"}
+#   revisions        ()                          {"artifact_id", "previous_id"}
+NODES = "nodes"
+RELATIONSHIPS = "relationships"
+ARTIFACTS = "artifacts"
+ARTIFACT_STATUS = "artifact_status"
+USERS = "users"
+GENERATED = "generated"
+CREATED_BY = "created_by"
+REVISIONS = "revisions"
+
+ARTIFACT_FIELDS = ("code", "fingerprint", "nodes_inserted", "relationships_inserted", "status")
+
+
+# Marks a dict entry that did not exist before a journaled change.
+MISSING = object()
+
+
+class WriteOp(NamedTuple):
+    kind: str
+    key: tuple
+    rows: list
+
+
+class GraphStore(ABC):
+    """
+    Operations the pipeline runs against the graph. The async methods default to the sync ones, which is
+    what an in-process store wants; network stores override them.
+    """
+
+    # False when writes are only durable after `persist`, which then may be costly (see backfill.py).
+    durable_writes = True
+
+    def ensure_schema(self):
+        pass
+
+    @abstractmethod
+    def write(self, ops: List[WriteOp]):
+        """
+        Applies the operations in order, atomically: if one fails, none of them is applied.
+        """
+
+    @abstractmethod
+    def find_entities_by_key(self, label: str, keys) -> dict:
+        """
+        Returns the smallest id of the `label` node with each canonical key found.
+        """
+
+    @abstractmethod
+    def find_artifact_by_fingerprint(self, fingerprint: str) -> Optional[dict]:
+        """
+        Returns id, nodes_inserted and relationships_inserted of a complete Artifact with the fingerprint.
+        """
+
+    @abstractmethod
+    def existing_nodes(self) -> List[dict]:
+        """
+        Returns every node except Artifacts as {"id", "tipo", **properties}, embeddings decoded.
+        """
+
+    @abstractmethod
+    def artifact_graph(self, artifact_id: str) -> Optional[dict]:
+        """
+        Returns the code and status of an Artifact and the nodes it GENERATED, as {"id", "tipo", **properties}
+        without embeddings; None if it does not exist.
+        """
+
+    @abstractmethod
+    def similar_nodes(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        """
+        For each row ({"source", "vector"}), the `k` `label` nodes most similar to its vector, as
+        {"source", "id", "tipo", "properties" (without embeddings), "score"}.
+        """
+
+    @abstractmethod
+    def server_time(self) -> int:
+        """
+        Current time of the store, in the unit of the `created_at` it writes.
+        """
+
+    @abstractmethod
+    def catalog_page(self, label: str, after: str, fields: List[str], limit: int) -> Iterable[dict]:
+        """
+        Up to `limit` `label` nodes with id greater than `after`, by id, as {"id", "canonical_key", "values"}.
+        """
+
+    @abstractmethod
+    def catalog_delta(self, label: str, since: int, fields: List[str]) -> Iterable[dict]:
+        """
+        The `label` nodes created at or after `since`, in the format of `catalog_page`.
+        """
+
+    def persist(self):
+        """
+        Makes the written data durable, if the store is not already.
+        """
+
+    def close(self):
+        pass
+
+    async def write_async(self, ops: List[WriteOp]):
+        self.write(ops)
+
+    async def find_entities_by_key_async(self, label: str, keys) -> dict:
+        return self.find_entities_by_key(label, keys)
+
+    async def find_artifact_by_fingerprint_async(self, fingerprint: str) -> Optional[dict]:
+        return self.find_artifact_by_fingerprint(fingerprint)
+
+    async def similar_nodes_async(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        return self.similar_nodes(label, rows, k)
+
+    async def artifact_graph_async(self, artifact_id: str) -> Optional[dict]:
+        return self.artifact_graph(artifact_id)
+
+    async def close_async(self):
+        self.close()
+
+
+def normalize(vector) -> Optional[array]:
+    values = array("f", vector)
+    norm = math.sqrt(sum(value * value for value in values))
+    return array("f", (value / norm for value in values)) if norm else None
+
+
+def without_embeddings(properties: dict) -> dict:
+    return {key: value for key, value in properties.items() if not key.endswith("_embedding")}
+
+
+def encode_snapshot_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    return value
+
+
+def decode_snapshot_value(value):
+    if isinstance(value, dict) and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+class MemoryGraphStore(GraphStore):
+    """
+    Embedded graph: nodes by label and id, an id index, a canonical-key index, a fingerprint index and the
+    relationships as (origin id, type, destination id). Vector properties are kept normalized for similarity
+    search. With `snapshot_path`, the graph is loaded from it if it exists and saved to it by `persist` and `close`.
+    """
+
+    durable_writes = False
+
+    def __init__(self, vector_properties: Optional[Dict[str, str]] = None, snapshot_path: Optional[str] = None):
+        self.vector_properties = vector_properties or {}
+        self.snapshot_path = snapshot_path
+        self.lock = threading.RLock()
+        self.nodes: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.labels: Dict[str, str] = {}
+        self.keys: Dict[Tuple[str, str], str] = {}
+        self.fingerprints: Dict[str, Set[str]] = defaultdict(set)
+        self.relationships: Set[Tuple[str, str, str]] = set()
+        self.vectors: Dict[str, Dict[str, array]] = defaultdict(dict)
+        self.clock = 0
+        # Undo entries of the write in progress, see `write`.
+        self.journal: Optional[list] = None
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    def server_time(self) -> int:
+        # Milliseconds like Neo4j's timestamp(), strictly increasing so deltas never miss a node.
+        with self.lock:
+            self.clock = max(self.clock + 1, int(time.time() * 1000))
+            return self.clock
+
+    def set_item(self, mapping: dict, key, value):
+        if self.journal is not None:
+            self.journal.append((mapping, key, mapping.get(key, MISSING)))
+        mapping[key] = value
+
+    def add_member(self, members: set, member):
+        if member not in members:
+            if self.journal is not None:
+                self.journal.append((members, member, None))
+            members.add(member)
+
+    def discard_member(self, members: set, member):
+        if member in members:
+            if self.journal is not None:
+                self.journal.append((members, member, member))
+            members.discard(member)
+
+    def rollback(self, journal: list):
+        for container, key, previous in reversed(journal):
+            if isinstance(container, set):
+                if previous is None:
+                    container.discard(key)
+                else:
+                    container.add(key)
+            elif previous is MISSING:
+                container.pop(key, None)
+            else:
+                container[key] = previous
+
+    def node(self, node_id: str, label: str = "") -> Optional[dict]:
+        found = self.labels.get(node_id)
+        if found is None or (label and found != label):
+            return None
+        return self.nodes[found][node_id]
+
+    def index_node(self, label: str, node_id: str, properties: dict):
+        self.set_item(self.labels, node_id, label)
+        canonical_key = properties.get("canonical_key")
+        if canonical_key:
+            current = self.keys.get((label, canonical_key))
+            if current is None or node_id < current:
+                self.set_item(self.keys, (label, canonical_key), node_id)
+        if label == "Artifact" and properties.get("fingerprint"):
+            self.add_member(self.fingerprints[properties["fingerprint"]], node_id)
+        prop = self.vector_properties.get(label)
+        if prop and properties.get(prop) is not None:
+            vector = normalize(decode_embedding(properties[prop]))
+            if vector is not None:
+                self.set_item(self.vectors[label], node_id, vector)
+
+    def merge_node(self, label: str, node_id: str, properties: Optional[dict] = None) -> dict:
+        existing = self.node(node_id, label)
+        if existing is not None:
+            return existing
+        node = {"id": node_id, **(properties or {}), "created_at": self.server_time()}
+        self.set_item(self.nodes[label], node_id, node)
+        self.index_node(label, node_id, node)
+        return node
+
+    def apply(self, op: WriteOp):
+        for row in op.rows:
+            if op.kind == NODES:
+                node = self.merge_node(op.key[0], row["id"], row["atributos"])
+                if node.get("canonical_key") is None and row.get("canonical_key"):
+                    self.set_item(node, "canonical_key", row["canonical_key"])
+                    self.index_node(op.key[0], row["id"], node)
+            elif op.kind == RELATIONSHIPS:
+                origen_label, tipo, destino_label = op.key
+                if self.node(row["origen"], origen_label) and self.node(row["destino"], destino_label):
+                    self.add_member(self.relationships, (row["origen"], tipo, row["destino"]))
+            elif op.kind == ARTIFACTS:
+                artifact = self.merge_node("Artifact", row["id"])
+                if artifact.get("fingerprint") and artifact["fingerprint"] != row.get("fingerprint"):
+                    self.discard_member(self.fingerprints[artifact["fingerprint"]], row["id"])
+                for field in ARTIFACT_FIELDS:
+                    self.set_item(artifact, field, row.get(field))
+                self.index_node("Artifact", row["id"], artifact)
+            elif op.kind == ARTIFACT_STATUS:
+                artifact = self.node(row["id"], "Artifact")
+                if artifact is not None:
+                    self.set_item(artifact, "status", row["status"])
+            elif op.kind == USERS:
+                self.merge_node("User", row["id"])
+            elif op.kind == GENERATED:
+                if self.node(row["artifact_id"], "Artifact") and self.node(row["node_id"], op.key[0]):
+                    self.add_member(self.relationships, (row["artifact_id"], "GENERATED", row["node_id"]))
+            elif op.kind == CREATED_BY:
+                self.merge_node("User", row["user_id"])
+                if self.node(row["artifact_id"], "Artifact"):
+                    self.add_member(self.relationships, (row["artifact_id"], "CREATED_BY", row["user_id"]))
+            elif op.kind == REVISIONS:
+                if self.node(row["artifact_id"], "Artifact") and self.node(row["previous_id"], "Artifact"):
+                    self.add_member(self.relationships, (row["artifact_id"], "REVISION_OF", row["previous_id"]))
+            else:
+                raise ValueError(f"Operación de escritura desconocida: {op.kind}")
+
+    def write(self, ops: List[WriteOp]):
+        # Every change is journaled, so a failing op undoes the ones applied before it, like a Bolt transaction.
+        with self.lock:
+            self.journal = []
+            try:
+                for op in ops:
+                    self.apply(op)
+            except Exception:
+                self.rollback(self.journal)
+                raise
+            finally:
+                self.journal = None
+
+    def find_entities_by_key(self, label: str, keys) -> dict:
+        with self.lock:
+            return {key: self.keys[(label, key)] for key in keys if (label, key) in self.keys}
+
+    def find_artifact_by_fingerprint(self, fingerprint: str) -> Optional[dict]:
+        with self.lock:
+            for artifact_id in sorted(self.fingerprints.get(fingerprint, ())):
+                artifact = self.nodes["Artifact"][artifact_id]
+                if (artifact.get("status") or "complete") == "complete":
+                    return {
+                        "id": artifact_id,
+                        "nodes_inserted": artifact.get("nodes_inserted"),
+                        "relationships_inserted": artifact.get("relationships_inserted"),
+                    }
+        return None
+
+    def existing_nodes(self) -> List[dict]:
+        with self.lock:
+            nodes = [(label, dict(node)) for label, by_id in self.nodes.items() if label != "Artifact"
+                     for node in by_id.values()]
+        return [{"id": node["id"], "tipo": label, **decode_embedding_properties(node)} for label, node in nodes]
+
+    def artifact_graph(self, artifact_id: str) -> Optional[dict]:
+        with self.lock:
+            artifact = self.node(artifact_id, "Artifact")
+            if artifact is None:
+                return None
+            nodes = [
+                {"tipo": self.labels[destino], **without_embeddings(self.node(destino))}
+                for origen, tipo, destino in self.relationships
+                if origen == artifact_id and tipo == "GENERATED" and self.node(destino) is not None
+            ]
+        return {"id": artifact_id, "code": artifact.get("code"), "status": artifact.get("status"), "nodes": nodes}
+
+    def similar_nodes(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        with self.lock:
+            vectors = list(self.vectors[label].items())
+        matches = []
+        for row in rows:
+            query = normalize(row["vector"])
+            if query is None:
+                continue
+            scored = ((sum(map(operator.mul, query, vector)), node_id) for node_id, vector in vectors)
+            for score, node_id in heapq.nlargest(k, scored):
+                with self.lock:
+                    properties = without_embeddings(self.nodes[label][node_id])
+                matches.append({"source": row["source"], "id": node_id, "tipo": [label],
+                                "properties": properties, "score": score})
+        return matches
+
+    async def similar_nodes_async(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        # Exact search is CPU-bound; it runs off the event loop like the local index of retrieval.py.
+        return await asyncio.to_thread(self.similar_nodes, label, rows, k)
+
+    def catalog_page(self, label: str, after: str, fields: List[str], limit: int) -> List[dict]:
+        with self.lock:
+            ids = heapq.nsmallest(limit, (node_id for node_id in self.nodes[label] if node_id > after))
+            return [self.catalog_record(label, node_id, fields) for node_id in ids]
+
+    def catalog_delta(self, label: str, since: int, fields: List[str]) -> List[dict]:
+        with self.lock:
+            return [self.catalog_record(label, node_id, fields) for node_id, node in self.nodes[label].items()
+                    if node.get("created_at", 0) >= since]
+
+    def catalog_record(self, label: str, node_id: str, fields: List[str]) -> dict:
+        node = self.nodes[label][node_id]
+        return {"id": node_id, "canonical_key": node.get("canonical_key"), "values": [node.get(f) for f in fields]}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.labels)
+
+    def relationship_count(self) -> int:
+        with self.lock:
+            return len(self.relationships)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "version": 1,
+                "nodes": {
+                    label: [{key: encode_snapshot_value(value) for key, value in node.items()}
+                            for node in by_id.values()]
+                    for label, by_id in self.nodes.items()
+                },
+                "relationships": sorted(self.relationships),
+            }
+
+    def save_snapshot(self, path: str):
+        """
+        Writes the graph to `path` as JSON (packed embeddings in base64), replacing the file atomically.
+        """
+        data = self.snapshot()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary, path)
+
+    def load_snapshot(self, path: str):
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        with self.lock:
+            for label, nodes in data["nodes"].items():
+                for node in nodes:
+                    node = {key: decode_snapshot_value(value) for key, value in node.items()}
+                    self.nodes[label][node["id"]] = node
+                    self.index_node(label, node["id"], node)
+                    self.clock = max(self.clock, node.get("created_at", 0))
+            self.relationships.update(tuple(relationship) for relationship in data["relationships"])
+        print(f"[Grafo] Snapshot {path} cargado: {len(self)} nodos, {self.relationship_count()} relaciones.")
+
+    def persist(self):
+        if self.snapshot_path:
+            self.save_snapshot(self.snapshot_path)
+
+    def close(self):
+        self.persist()
+
+    def export_ops(self) -> List[WriteOp]:
+        """
+        Returns the whole graph as write operations, in the order they must be applied.
+        """
+        with self.lock:
+            ops = []
+            for label, by_id in sorted(self.nodes.items()):
+                if label == "Artifact":
+                    continue
+                if label == "User":
+                    ops.append(WriteOp(USERS, (), [{"id": node_id} for node_id in by_id]))
+                    continue
+                rows = [
+                    {"id": node_id, "canonical_key": node.get("canonical_key"),
+                     "atributos": {key: value for key, value in node.items()
+                                   if key not in ("id", "canonical_key", "created_at")}}
+                    for node_id, node in by_id.items()
+                ]
+                ops.append(WriteOp(NODES, (label,), rows))
+
+            relationships = defaultdict(list)
+            generated = defaultdict(list)
+            created_by = []
+            revisions = []
+            for origen, tipo, destino in sorted(self.relationships):
+                if tipo == "GENERATED":
+                    generated[self.labels.get(destino, "")].append({"artifact_id": origen, "node_id": destino})
+                elif tipo == "CREATED_BY":
+                    created_by.append({"user_id": destino, "artifact_id": origen})
+                elif tipo == "REVISION_OF":
+                    revisions.append({"artifact_id": origen, "previous_id": destino})
+                else:
+                    key = (self.labels.get(origen, ""), tipo, self.labels.get(destino, ""))
+                    relationships[key].append({"origen": origen, "destino": destino})
+            ops.extend(WriteOp(RELATIONSHIPS, key, rows) for key, rows in relationships.items())
+
+            artifacts = [{"id": artifact_id, **{field: artifact.get(field) for field in ARTIFACT_FIELDS}}
+                         for artifact_id, artifact in self.nodes["Artifact"].items()]
+            ops.append(WriteOp(ARTIFACTS, (), artifacts))
+            ops.extend(WriteOp(GENERATED, (label,), rows) for label, rows in generated.items())
+            ops.append(WriteOp(CREATED_BY, (), created_by))
+            ops.append(WriteOp(REVISIONS, (), revisions))
+        return [op for op in ops if op.rows]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sube un snapshot del grafo en memoria a Neo4j/Memgraph.")
+    parser.add_argument("snapshot", nargs="?", default=GRAPH_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    from insertion import BoltGraphStore, VECTOR_INDEX_PROPERTIES, push_graph
+
+    source = MemoryGraphStore(VECTOR_INDEX_PROPERTIES, args.snapshot)
+    target = BoltGraphStore()
+    target.ensure_schema()
+    push_graph(source, target)
+    target.close()
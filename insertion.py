@@ -1,8 +1,26 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
+from neo4j.exceptions import ClientError, ServiceUnavailable, SessionExpired, TransientError
 from process import GraphUpdate
 import os
+import time
+import queue
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from nodes import ArtifactNode, UserNode
+from relationship_rules import RELATIONSHIP_TYPES
+from fingerprint import compute_entity_key
+from vectors import EMBEDDING_GRAPH_FORMAT, embedding_dimensions, encode_embedding, decode_embedding_properties
+from metrics import observe_query, observe_query_async, register_collector
+from bulk_export import BulkExportStore
+from graph_store import (
+    GraphStore, MemoryGraphStore, WriteOp, GRAPH_STORE, GRAPH_SNAPSHOT_PATH,
+    NODES, RELATIONSHIPS, ARTIFACTS, ARTIFACT_STATUS, USERS, GENERATED, CREATED_BY, REVISIONS
+)
 
 load_dotenv()
 
@@ -10,18 +28,77 @@ NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
 
+# "neo4j" or "memgraph": both speak Bolt, but their schema DDL differs.
+GRAPH_DIALECT = os.getenv("GRAPH_DIALECT", "neo4j").lower()
+
+# Maximum number of rows sent in a single `UNWIND $rows` statement.
+BULK_WRITE_CHUNK_SIZE = int(os.getenv("NEO4J_BULK_CHUNK_SIZE", "500"))
+
+# Write-behind buffer: the writes of many artifacts are committed together, in one transaction per batch.
+NEO4J_WRITE_BUFFER_ENABLED = os.getenv("NEO4J_WRITE_BUFFER_ENABLED", "true").lower() == "true"
+# Artifact writes waiting for a batch; further writes block until there is room.
+NEO4J_WRITE_BUFFER_MAX_PENDING = int(os.getenv("NEO4J_WRITE_BUFFER_MAX_PENDING", "256"))
+NEO4J_WRITE_BATCH_MAX_ARTIFACTS = int(os.getenv("NEO4J_WRITE_BATCH_MAX_ARTIFACTS", "64"))
+NEO4J_WRITE_BATCH_MAX_ROWS = int(os.getenv("NEO4J_WRITE_BATCH_MAX_ROWS", "5000"))
+# Longest wait for more writes once the first one of a batch arrives.
+NEO4J_WRITE_FLUSH_SECONDS = float(os.getenv("NEO4J_WRITE_FLUSH_SECONDS", "0.01"))
+NEO4J_WRITE_MAX_ATTEMPTS = int(os.getenv("NEO4J_WRITE_MAX_ATTEMPTS", "5"))
+NEO4J_WRITE_BACKOFF_SECONDS = float(os.getenv("NEO4J_WRITE_BACKOFF_SECONDS", "0.5"))
+
+TRANSIENT_WRITE_ERRORS = (ServiceUnavailable, SessionExpired, TransientError)
+
+# Order in which the statements of a batch run: relationships and links need their nodes written first.
+WRITE_PHASES = ("nodes", "relationships", "artifacts", "links")
+
+# Operations of one write, by phase.
+GraphDelta = Dict[str, List[WriteOp]]
+
 
 class Neo4jConnection:
     """
-    Handles connection to Neo4j and executes queries.
+    Handles connection to Neo4j and executes queries. The drivers are created on first use, so importing
+    this module does not need a Bolt server (e.g. with GRAPH_STORE=memory).
     """
 
     def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.uri = uri
+        self.auth = (user, password)
+        self._driver = None
+        self._async_driver = None
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = GraphDatabase.driver(self.uri, auth=self.auth)
+        return self._driver
+
+    @driver.setter
+    def driver(self, driver):
+        self._driver = driver
+
+    @property
+    def async_driver(self):
+        if self._async_driver is None:
+            self._async_driver = AsyncGraphDatabase.driver(self.uri, auth=self.auth)
+        return self._async_driver
+
+    @async_driver.setter
+    def async_driver(self, driver):
+        self._async_driver = driver
+
+    def close(self):
+        if self._driver is not None:
+            self._driver.close()
+
+    async def close_async(self):
+        if self._async_driver is not None:
+            await self._async_driver.close()
+        self.close()
 
     def execute_query(self, query, parameters=None):
+        # The records are read before the session closes; a `Result` is not usable afterwards.
         with self.driver.session() as session:
-            return session.run(query, parameters)
+            return session.run(query, parameters).data()
 
 neo4j_conn = Neo4jConnection(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
 
@@ -37,108 +114,310 @@ NODE_TYPE_MAPPING = {
     "ArtifactNode": "Artifact"
 }
 
-def get_existing_nodes():
-    query = """
-    MATCH (n)
-    WHERE NOT n:Artifact
-    RETURN n.id AS id, labels(n) AS tipo, properties(n) AS properties
-    """
-    with neo4j_conn.driver.session() as session:
-        results = session.run(query)
-        records = results.data()
+ALLOW_RELATIONSHIPS_BETWEEN_ARTIFACTNODE = {"APINode", "EndpointNode", "DatabaseNode", "QueryNode", "TableNode", "VisualizationNode"}
 
-    existing_nodes = []
-    for record in records:
-        node_type = record["tipo"][0] if record["tipo"] else "Unknown"
-        node_data = {"id": record["id"], "tipo": node_type, **record["properties"]}
-        existing_nodes.append(node_data)
+ARTIFACT_STATUS_PROCESSING = "processing"
+ARTIFACT_STATUS_COMPLETE = "complete"
+ARTIFACT_STATUS_FAILED = "failed"
 
-    return existing_nodes
+# The artifact and link writes take `$rows` like the node writes, so a batch merges them across artifacts.
+ARTIFACT_NODE_QUERY = """
+UNWIND $rows AS row
+MERGE (a:Artifact {id: row.id})
+SET a.code = row.code,
+    a.fingerprint = row.fingerprint,
+    a.nodes_inserted = row.nodes_inserted,
+    a.relationships_inserted = row.relationships_inserted,
+    a.status = row.status
+"""
 
-def create_artifact_node(artifact_node):
-    """
-    Crea un nodo Artifact en Neo4j.
+ARTIFACT_STATUS_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Artifact {id: row.id})
+SET a.status = row.status
+"""
+
+USER_NODE_QUERY = """
+UNWIND $rows AS row
+MERGE (u:User {id: row.id})
+"""
+
+SCHEMA_LABELS = sorted(set(NODE_TYPE_MAPPING.values()) | {"User"})
+
+# Labels of the extracted entities, which are merged across artifacts by `canonical_key` (see entity_resolution.py).
+ENTITY_LABELS = sorted(set(NODE_TYPE_MAPPING.values()) - {"Artifact"})
+
+SCHEMA_STATEMENTS = {
+    "neo4j": {
+        "id": "CREATE CONSTRAINT {label_lower}_id_unique IF NOT EXISTS FOR (n:{label}) REQUIRE n.id IS UNIQUE",
+        "index": "CREATE INDEX {label_lower}_{prop}_index IF NOT EXISTS FOR (n:{label}) ON (n.{prop})",
+    },
+    "memgraph": {
+        "id": "CREATE CONSTRAINT ON (n:{label}) ASSERT n.id IS UNIQUE",
+        "index": "CREATE INDEX ON :{label}({prop})",
+    },
+}
+
+# Embedding property indexed per label for similarity search (see retrieval.py): the composite embedding
+# of each node's EMBEDDING_POLICY, so every label is searched in the same text space.
+VECTOR_INDEX_PROPERTIES = {
+    label: "composite_embedding"
+    for label in ("API", "Endpoint", "Database", "Query", "Table", "KPI", "Statistic", "Visualization")
+}
+VECTOR_INDEX_DIMENSIONS = int(os.getenv("VECTOR_INDEX_DIMENSIONS") or embedding_dimensions())
+VECTOR_INDEX_CAPACITY = int(os.getenv("VECTOR_INDEX_CAPACITY", "1000000"))
+
+VECTOR_INDEX_STATEMENTS = {
+    "neo4j": (
+        "CREATE VECTOR INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.{prop}) "
+        "OPTIONS {{indexConfig: {{`vector.dimensions`: {dimensions}, `vector.similarity_function`: 'cosine'}}}}"
+    ),
+    "memgraph": (
+        "CREATE VECTOR INDEX {name} ON :{label}({prop}) "
+        'WITH CONFIG {{"dimension": {dimensions}, "capacity": {capacity}, "metric": "cos"}}'
+    ),
+}
+
+# Artifacts written before the status existed have none and count as complete.
+FIND_ARTIFACT_BY_FINGERPRINT_QUERY = """
+MATCH (a:Artifact {fingerprint: $fingerprint})
+WHERE coalesce(a.status, 'complete') = 'complete'
+RETURN a.id AS id, a.nodes_inserted AS nodes_inserted, a.relationships_inserted AS relationships_inserted
+LIMIT 1
+"""
+
+EXISTING_NODES_QUERY = """
+MATCH (n)
+WHERE NOT n:Artifact
+RETURN n.id AS id, labels(n) AS tipo, properties(n) AS properties
+"""
+
+VECTOR_SEARCH_QUERIES = {
+    "neo4j": """
+    UNWIND $rows AS row
+    CALL db.index.vector.queryNodes($index_name, $k, row.vector) YIELD node, score
+    RETURN row.source AS source, node.id AS id, labels(node) AS tipo,
+           [key IN keys(node) WHERE NOT key ENDS WITH '_embedding' | [key, node[key]]] AS properties, score
+    """,
+    "memgraph": """
+    UNWIND $rows AS row
+    CALL vector_search.search($index_name, $k, row.vector) YIELD node, similarity
+    RETURN row.source AS source, node.id AS id, labels(node) AS tipo,
+           [key IN keys(node) WHERE NOT key ENDS WITH '_embedding' | [key, node[key]]] AS properties,
+           similarity AS score
+    """,
+}
+
+CATALOG_PAGE_QUERY = """
+MATCH (n:{label})
+WHERE n.id > $after
+RETURN n.id AS id, n.canonical_key AS canonical_key, [field IN $fields | n[field]] AS values
+ORDER BY n.id
+LIMIT $limit
+"""
+
+CATALOG_DELTA_QUERY = """
+MATCH (n:{label})
+WHERE n.created_at >= $since
+RETURN n.id AS id, n.canonical_key AS canonical_key, [field IN $fields | n[field]] AS values
+"""
+
+SERVER_TIME_QUERY = "RETURN timestamp() AS now"
+
+USER_LINK_QUERY = """
+UNWIND $rows AS row
+MERGE (u:User {id: row.user_id})
+WITH u, row
+MATCH (a:Artifact {id: row.artifact_id})
+MERGE (a)-[:CREATED_BY]->(u)
+"""
+
+REVISION_LINK_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Artifact {id: row.artifact_id})
+MATCH (p:Artifact {id: row.previous_id})
+MERGE (a)-[:REVISION_OF]->(p)
+"""
+
+ARTIFACT_GRAPH_QUERY = """
+MATCH (a:Artifact {id: $id})
+OPTIONAL MATCH (a)-[:GENERATED]->(n)
+WITH a, n, [key IN keys(n) WHERE NOT key ENDS WITH '_embedding' | [key, n[key]]] AS properties
+RETURN a.code AS code, a.status AS status,
+       collect(CASE WHEN n IS NULL THEN NULL ELSE {tipo: labels(n)[0], properties: properties} END) AS nodes
+"""
+
+def vector_index_name(label: str) -> str:
+    return f"{label.lower()}_{VECTOR_INDEX_PROPERTIES[label]}_index"
+
+def vector_search_statement(label: str, rows, k: int) -> tuple:
+    return VECTOR_SEARCH_QUERIES[GRAPH_DIALECT], {"index_name": vector_index_name(label), "k": k, "rows": rows}
+
+def match_records(records) -> list:
+    return [
+        {
+            "source": record["source"],
+            "id": record["id"],
+            "tipo": record["tipo"],
+            "properties": dict(record["properties"]),
+            "score": record["score"],
+        }
+        for record in records
+    ]
+
+def artifact_graph_record(artifact_id: str, record) -> Optional[dict]:
+    if record is None:
+        return None
+    nodes = [{"tipo": node["tipo"], **dict(node["properties"])} for node in record["nodes"]]
+    return {"id": artifact_id, "code": record["code"], "status": record["status"], "nodes": nodes}
+
+# Errors of DDL whose index or constraint is already in the graph; any other schema error is raised.
+SCHEMA_EXISTS_CODES = {
+    "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists",
+    "Neo.ClientError.Schema.ConstraintAlreadyExists",
+    "Neo.ClientError.Schema.ConstraintWithNameAlreadyExists",
+    "Neo.ClientError.Schema.IndexAlreadyExists",
+    "Neo.ClientError.Schema.IndexWithNameAlreadyExists",
+}
+
+def schema_exists_error(error: ClientError) -> bool:
+    # Memgraph reports every error with the same code, so it is told apart by its message.
+    return error.code in SCHEMA_EXISTS_CODES or "already exists" in (error.message or "").lower()
+
+def schema_statements(dialect: str = GRAPH_DIALECT) -> list:
     """
-    artifact_query = """
-    MERGE (a:Artifact {id: $id})
-    SET a.code = $code
-    RETURN a
+    Returns the DDL that creates a unique `id` per label in the graph (plus the lookup indexes it needs)
+    and the vector indexes used to retrieve similar nodes.
     """
-    artifact_params = {"id": artifact_node.id, "code": artifact_node.code}
-    neo4j_conn.execute_query(artifact_query, artifact_params)
+    templates = SCHEMA_STATEMENTS[dialect]
+    statements = []
+    for label in SCHEMA_LABELS:
+        if dialect == "memgraph":
+            # Memgraph constraints are not backed by an index, so the index is created explicitly.
+            statements.append(templates["index"].format(label=label, label_lower=label.lower(), prop="id"))
+        statements.append(templates["id"].format(label=label, label_lower=label.lower()))
+    statements.append(templates["index"].format(label="Artifact", label_lower="artifact", prop="fingerprint"))
+    for label in ENTITY_LABELS:
+        statements.append(templates["index"].format(label=label, label_lower=label.lower(), prop="canonical_key"))
+        statements.append(templates["index"].format(label=label, label_lower=label.lower(), prop="created_at"))
+    if EMBEDDING_GRAPH_FORMAT == "bytes":
+        # Packed embeddings cannot be indexed; retrieval has to use RETRIEVAL_BACKEND=local.
+        return statements
+    for label, prop in VECTOR_INDEX_PROPERTIES.items():
+        statements.append(VECTOR_INDEX_STATEMENTS[dialect].format(
+            name=vector_index_name(label),
+            label=label,
+            prop=prop,
+            dimensions=VECTOR_INDEX_DIMENSIONS,
+            capacity=VECTOR_INDEX_CAPACITY
+        ))
+    return statements
 
-def create_user_node(user_node):
+def ensure_schema():
     """
-    Crea un nodo User en Neo4j.
-    """
-    user_query = """
-    MERGE (u:User {id: $id})
-    RETURN u
+    Crea las constraints e índices del grafo. Es idempotente y se ejecuta al iniciar la API.
     """
-    user_params = {"id": user_node.id}
-    neo4j_conn.execute_query(user_query, user_params)
+    get_graph_store().ensure_schema()
 
-ALLOW_RELATIONSHIPS_BETWEEN_ARTIFACTNODE = {"APINode", "EndpointNode", "DatabaseNode", "QueryNode", "TableNode", "VisualizationNode"}
+def find_entities_by_key_query(label: str) -> str:
+    return f"""
+    UNWIND $keys AS key
+    MATCH (n:{label} {{canonical_key: key}})
+    RETURN key, min(n.id) AS id
+    """
 
-def link_artifact_to_nodes(artifact_node: ArtifactNode, knowledge_nodes):
+def find_entities_by_key(label: str, keys) -> dict:
     """
-    Links the ArtifactNode to key Nodes.
+    Returns the id of the existing `label` node for each canonical key found in the graph.
     """
-    print("[Neo4j] Creando relaciones del Artifact con nodos válidos...")
+    return get_graph_store().find_entities_by_key(label, keys)
 
-    create_artifact_node(artifact_node)
+async def find_entities_by_key_async(label: str, keys) -> dict:
+    return await get_graph_store().find_entities_by_key_async(label, keys)
 
-    for nodo in knowledge_nodes:
-        node_class_name = nodo.__class__.__name__
+def get_existing_nodes():
+    return get_graph_store().existing_nodes()
 
-        if node_class_name in ALLOW_RELATIONSHIPS_BETWEEN_ARTIFACTNODE:
-            relation_query = """
-            MATCH (a:Artifact {id: $artifact_id}), (n {id: $node_id})
-            MERGE (a)-[:GENERATED]->(n)
-            """
-            relation_params = {"artifact_id": artifact_node.id, "node_id": nodo.id}
-            neo4j_conn.execute_query(relation_query, relation_params)
+def artifact_node_params(artifact_node: ArtifactNode) -> dict:
+    return {
+        "id": artifact_node.id,
+        "code": artifact_node.code,
+        "fingerprint": artifact_node.fingerprint,
+        "nodes_inserted": artifact_node.nodes_inserted,
+        "relationships_inserted": artifact_node.relationships_inserted,
+        "status": artifact_node.status
+    }
 
-    print("[Neo4j] Relaciones del Artifact insertadas correctamente.")
+def artifact_node_ops(artifact_node: ArtifactNode) -> list:
+    return [WriteOp(ARTIFACTS, (), [artifact_node_params(artifact_node)])]
 
-def link_user_to_artifact(artifact_node: ArtifactNode, user_node: UserNode):
+def create_artifact_node(artifact_node):
     """
-    Links a User to an Artifact.
+    Crea un nodo Artifact en Neo4j.
     """
-    print("[Neo4j] Creando relación Usuario-Artifact...")
+    write_graph_delta({"artifacts": artifact_node_ops(artifact_node)})
+
+def find_artifact_by_fingerprint(fingerprint: str):
+    """
+    Busca un Artifact ya procesado con el mismo fingerprint. Retorna None si no existe.
+    Los artifacts que todavía se están procesando (o que fallaron) no cuentan.
+    """
+    return get_graph_store().find_artifact_by_fingerprint(fingerprint)
+
+async def find_artifact_by_fingerprint_async(fingerprint: str):
+    return await get_graph_store().find_artifact_by_fingerprint_async(fingerprint)
 
-    create_user_node(user_node)
+def find_artifact_graph(artifact_id: str) -> Optional[dict]:
+    return get_graph_store().artifact_graph(artifact_id)
 
-    relation_query = """
-    MATCH (u:User {id: $user_id}), (a:Artifact {id: $artifact_id})
-    MERGE (a)-[:CREATED_BY]->(u)
+async def find_artifact_graph_async(artifact_id: str) -> Optional[dict]:
+    return await get_graph_store().artifact_graph_async(artifact_id)
+
+def create_user_node(user_node):
+    """
+    Crea un nodo User en Neo4j.
     """
-    relation_params = {"user_id": user_node.id, "artifact_id": artifact_node.id}
-    neo4j_conn.execute_query(relation_query, relation_params)
+    write_graph_delta({"nodes": [WriteOp(USERS, (), [{"id": user_node.id}])]})
 
-    print("[Neo4j] Relación Usuario-Artifact insertada correctamente.")
+def is_packed_embedding(prop: str, node_label: str) -> bool:
+    if EMBEDDING_GRAPH_FORMAT == "bytes":
+        return True
+    if EMBEDDING_GRAPH_FORMAT == "hybrid":
+        return prop != VECTOR_INDEX_PROPERTIES.get(node_label)
+    return False
 
 def get_private_embeddings(node) -> dict:
-    return {
-        key.lstrip("_"): value
-        for key, value in getattr(node, "__pydantic_private__").items()
-        if key.endswith("_embedding")
-    }
+    """
+    Returns the node embeddings listed in its EMBEDDING_POLICY as graph properties, encoded per
+    EMBEDDING_GRAPH_FORMAT (see vectors.py).
+    """
+    node_label = NODE_TYPE_MAPPING.get(node.__class__.__name__)
+    policy = getattr(node, "EMBEDDING_POLICY", None)
+    allowed = set(policy.embedding_properties()) if policy else set()
+    embeddings = {}
+    for key, value in getattr(node, "__pydantic_private__").items():
+        if key.endswith("_embedding") and key.lstrip("_") in allowed:
+            prop = key.lstrip("_")
+            embeddings[prop] = encode_embedding(
+                value, packed=is_packed_embedding(prop, node_label), as_text=GRAPH_DIALECT == "memgraph"
+            )
+    return embeddings
 
 def serialize_node_with_private_attrs(node):
     data = node.model_dump()
     embeddings = get_private_embeddings(node)
     return {**data, **embeddings}
 
-def insert_into_neo4j(graph_update: GraphUpdate):
+def chunked(rows, size=BULK_WRITE_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def group_nodes_by_label(nodos) -> dict:
     """
-    Inserts nodes and relationships into Neo4j without checking for duplicates.
-    Includes private _embedding attributes in insertion.
+    Groups serialized nodes by their Neo4j label, as `UNWIND` rows.
     """
-    print("[Neo4j] Inserting nodes...")
-
-    for nodo in graph_update.nodos:
-        nodo_dict = serialize_node_with_private_attrs(nodo)
+    groups = defaultdict(list)
+    for nodo in nodos:
         node_class_name = nodo.__class__.__name__
         node_label = NODE_TYPE_MAPPING.get(node_class_name, "Unknown")
 
@@ -146,30 +425,602 @@ def insert_into_neo4j(graph_update: GraphUpdate):
             print(f"[Warning] Unrecognized node type: {node_class_name}")
             continue
 
-        query = f"""
-        CREATE (n:{node_label} {{ id: $id }})
-        SET n += $atributos
-        RETURN n
-        """
-        parameters = {
+        nodo_dict = serialize_node_with_private_attrs(nodo)
+        groups[node_label].append({
             "id": nodo_dict["id"],
+            "canonical_key": compute_entity_key(nodo),
             "atributos": {k: v for k, v in nodo_dict.items() if k != "id"}
-        }
-        neo4j_conn.execute_query(query, parameters)
+        })
+    return groups
 
-    print("[Neo4j] Inserting relationships...")
+def build_node_labels(nodos, existing_nodes=None) -> dict:
+    """
+    Maps node ids to their Neo4j labels, for new nodes and for existing nodes as returned by `get_existing_nodes`.
+    """
+    node_labels = {
+        existing_node["id"]: existing_node["tipo"]
+        for existing_node in existing_nodes or []
+        if existing_node.get("tipo") in SCHEMA_LABELS
+    }
+    for nodo in nodos:
+        node_label = NODE_TYPE_MAPPING.get(nodo.__class__.__name__)
+        if node_label:
+            node_labels[nodo.id] = node_label
+    return node_labels
 
-    for relacion in graph_update.relaciones:
+def group_relationships_by_type(relaciones, node_labels=None) -> dict:
+    """
+    Groups relationships by (origin label, type, destination label), as `UNWIND` rows.
+    Endpoints with an unknown label are grouped under an empty label.
+    """
+    node_labels = node_labels or {}
+    groups = defaultdict(list)
+    for relacion in relaciones:
         relacion_dict = relacion if isinstance(relacion, dict) else relacion.model_dump()
+        origen_label = node_labels.get(relacion_dict["origen"], "")
+        destino_label = node_labels.get(relacion_dict["destino"], "")
+        groups[(origen_label, relacion_dict["tipo"], destino_label)].append({
+            "origen": relacion_dict["origen"],
+            "destino": relacion_dict["destino"]
+        })
+    return groups
+
+def node_pattern(variable: str, label: str, id_expression: str) -> str:
+    label_part = f":{label}" if label else ""
+    return f"({variable}{label_part} {{id: {id_expression}}})"
+
+def node_query(label: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MERGE (n:{label} {{ id: row.id }})
+    ON CREATE SET n += row.atributos, n.created_at = timestamp()
+    SET n.canonical_key = coalesce(n.canonical_key, row.canonical_key)
+    """
+
+def relationship_query(origen_label: str, tipo: str, destino_label: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MATCH {node_pattern("a", origen_label, "row.origen")}
+    MATCH {node_pattern("b", destino_label, "row.destino")}
+    MERGE (a)-[:{tipo}]->(b)
+    """
+
+def generated_query(label: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MATCH (a:Artifact {{id: row.artifact_id}})
+    MATCH (n:{label} {{id: row.node_id}})
+    MERGE (a)-[:GENERATED]->(n)
+    """
+
+WRITE_OP_QUERIES = {
+    NODES: node_query,
+    RELATIONSHIPS: relationship_query,
+    GENERATED: generated_query,
+    ARTIFACTS: lambda: ARTIFACT_NODE_QUERY,
+    ARTIFACT_STATUS: lambda: ARTIFACT_STATUS_QUERY,
+    USERS: lambda: USER_NODE_QUERY,
+    CREATED_BY: lambda: USER_LINK_QUERY,
+    REVISIONS: lambda: REVISION_LINK_QUERY,
+}
+
+def write_op_statement(op: WriteOp) -> tuple:
+    """
+    Returns the Cypher (query, parameters) that applies a write operation.
+    """
+    return WRITE_OP_QUERIES[op.kind](*op.key), {"rows": op.rows}
+
+def node_ops(nodos) -> list:
+    """
+    Returns the operations that write the given nodes, one per label and chunk.
+    Nodes are merged on their id: an entity already in the graph keeps its attributes and only gets
+    its `canonical_key` filled if it had none. New nodes get a server-side `created_at`, which the graph
+    catalog syncs by (see graph_catalog.py).
+    """
+    return [
+        WriteOp(NODES, (node_label,), chunk)
+        for node_label, rows in group_nodes_by_label(nodos).items()
+        for chunk in chunked(rows)
+    ]
+
+def relationship_ops(relaciones, node_labels=None) -> list:
+    ops = []
+    for (origen_label, tipo, destino_label), rows in group_relationships_by_type(relaciones, node_labels).items():
+        if tipo not in RELATIONSHIP_TYPES:
+            # `tipo` is interpolated into the query, so only the types of POSSIBLE_RELATIONSHIPS are written.
+            print(f"[Warning] {len(rows)} relaciones con tipo no permitido {tipo!r}; se omiten.")
+            continue
+        if not origen_label or not destino_label:
+            print(f"[Warning] {len(rows)} relaciones {tipo} con nodos sin label conocido; se buscarán sin índice.")
+        ops.extend(WriteOp(RELATIONSHIPS, (origen_label, tipo, destino_label), chunk) for chunk in chunked(rows))
+    return ops
 
-        query = f"""
-        MATCH (a {{id: $origen}}), (b {{id: $destino}})
-        CREATE (a)-[:{relacion_dict["tipo"]}]->(b)
+def generated_link_ops(artifact_node: ArtifactNode, knowledge_nodes) -> list:
+    groups = defaultdict(list)
+    for nodo in knowledge_nodes:
+        node_class_name = nodo.__class__.__name__
+        if node_class_name in ALLOW_RELATIONSHIPS_BETWEEN_ARTIFACTNODE:
+            groups[NODE_TYPE_MAPPING[node_class_name]].append({"artifact_id": artifact_node.id, "node_id": nodo.id})
+    return [WriteOp(GENERATED, (node_label,), chunk) for node_label, rows in groups.items() for chunk in chunked(rows)]
+
+def user_link_ops(artifact_node: ArtifactNode, user_node: UserNode) -> list:
+    return [WriteOp(CREATED_BY, (), [{"user_id": user_node.id, "artifact_id": artifact_node.id}])]
+
+def revision_link_ops(artifact_node: ArtifactNode, previous_id: str, linked_nodes) -> list:
+    """
+    Links a revision to its previous artifact and GENERATED to the previous nodes it keeps (as returned by
+    `find_artifact_graph`), which are not written again.
+    """
+    allowed_labels = {NODE_TYPE_MAPPING[name] for name in ALLOW_RELATIONSHIPS_BETWEEN_ARTIFACTNODE}
+    groups = defaultdict(list)
+    for node_data in linked_nodes:
+        if node_data["tipo"] in allowed_labels:
+            groups[node_data["tipo"]].append({"artifact_id": artifact_node.id, "node_id": node_data["id"]})
+    ops = [WriteOp(GENERATED, (node_label,), chunk) for node_label, rows in groups.items() for chunk in chunked(rows)]
+    return ops + [WriteOp(REVISIONS, (), [{"artifact_id": artifact_node.id, "previous_id": previous_id}])]
+
+def artifact_graph_delta(graph_update: GraphUpdate, artifact_node: ArtifactNode, user_node: UserNode,
+                         existing_nodes=None, extra_links=()) -> GraphDelta:
+    node_labels = build_node_labels(graph_update.nodos, existing_nodes)
+    return {
+        "nodes": node_ops(graph_update.nodos),
+        "relationships": relationship_ops(graph_update.relaciones, node_labels),
+        "artifacts": artifact_node_ops(artifact_node),
+        "links": (generated_link_ops(artifact_node, graph_update.nodos) + user_link_ops(artifact_node, user_node)
+                  + list(extra_links)),
+    }
+
+def delta_ops(delta: GraphDelta) -> list:
+    return [op for phase in WRITE_PHASES for op in delta.get(phase, [])]
+
+def artifact_graph_statements(graph_update: GraphUpdate, artifact_node: ArtifactNode, user_node: UserNode,
+                              existing_nodes=None) -> list:
+    delta = artifact_graph_delta(graph_update, artifact_node, user_node, existing_nodes)
+    return [write_op_statement(op) for op in delta_ops(delta)]
+
+def delta_rows(delta: GraphDelta) -> int:
+    return sum(len(op.rows) for op in delta_ops(delta))
+
+def coalesce_ops(ops) -> list:
+    """
+    Merges the operations of the same kind and key, re-chunked to BULK_WRITE_CHUNK_SIZE rows.
+    Order of first appearance is kept.
+    """
+    merged = {}
+    for op in ops:
+        merged.setdefault((op.kind, op.key), []).extend(op.rows)
+    return [WriteOp(kind, key, chunk) for (kind, key), rows in merged.items() for chunk in chunked(rows)]
+
+def batch_ops(deltas: List[GraphDelta]) -> list:
+    """
+    Operations of several writes as one transaction: phase by phase, so every node is written before the
+    relationships and links that match it, with the operations of a phase coalesced across writes.
+    """
+    ops = []
+    for phase in WRITE_PHASES:
+        ops.extend(coalesce_ops([op for delta in deltas for op in delta.get(phase, [])]))
+    return ops
+
+def run_statements(tx, statements):
+    for query, parameters in statements:
+        tx.run(query, parameters).consume()
+
+async def run_statements_async(tx, statements):
+    for query, parameters in statements:
+        result = await tx.run(query, parameters)
+        await result.consume()
+
+def execute_write_statements(statements, operation: str = "write"):
+    with observe_query(operation, statements), neo4j_conn.driver.session() as session:
+        session.execute_write(run_statements, statements)
+
+async def execute_write_statements_async(statements, operation: str = "write"):
+    async with observe_query_async(operation, statements), neo4j_conn.async_driver.session() as session:
+        await session.execute_write(run_statements_async, statements)
+
+
+class BoltGraphStore(GraphStore):
+    """
+    Graph store on a Neo4j or Memgraph server (GRAPH_DIALECT), through `neo4j_conn`.
+    """
+
+    def ensure_schema(self):
+        print("[Neo4j] Creando constraints e índices...")
+
+        with neo4j_conn.driver.session() as session:
+            for statement in schema_statements():
+                try:
+                    session.run(statement).consume()
+                except ClientError as e:
+                    # Memgraph reports already existing indexes/constraints as errors.
+                    if not schema_exists_error(e):
+                        raise
+                    print(f"[Warning] {statement}: {e.message}")
+
+        print("[Neo4j] Esquema listo.")
+
+    def write(self, ops: List[WriteOp]):
+        execute_write_statements([write_op_statement(op) for op in ops])
+
+    async def write_async(self, ops: List[WriteOp]):
+        await execute_write_statements_async([write_op_statement(op) for op in ops])
+
+    def find_entities_by_key(self, label: str, keys) -> dict:
+        with observe_query("find_entities"), neo4j_conn.driver.session() as session:
+            records = session.run(find_entities_by_key_query(label), {"keys": list(keys)}).data()
+        return {record["key"]: record["id"] for record in records}
+
+    async def find_entities_by_key_async(self, label: str, keys) -> dict:
+        async with observe_query_async("find_entities"), neo4j_conn.async_driver.session() as session:
+            result = await session.run(find_entities_by_key_query(label), {"keys": list(keys)})
+            records = await result.data()
+        return {record["key"]: record["id"] for record in records}
+
+    def find_artifact_by_fingerprint(self, fingerprint: str) -> Optional[dict]:
+        with observe_query("find_artifact"), neo4j_conn.driver.session() as session:
+            record = session.run(FIND_ARTIFACT_BY_FINGERPRINT_QUERY, {"fingerprint": fingerprint}).single()
+        return record.data() if record else None
+
+    async def find_artifact_by_fingerprint_async(self, fingerprint: str) -> Optional[dict]:
+        async with observe_query_async("find_artifact"), neo4j_conn.async_driver.session() as session:
+            result = await session.run(FIND_ARTIFACT_BY_FINGERPRINT_QUERY, {"fingerprint": fingerprint})
+            record = await result.single()
+        return record.data() if record else None
+
+    def existing_nodes(self) -> List[dict]:
+        existing_nodes = []
+        with observe_query("existing_nodes"), neo4j_conn.driver.session() as session:
+            for record in session.run(EXISTING_NODES_QUERY):
+                node_type = record["tipo"][0] if record["tipo"] else "Unknown"
+                existing_nodes.append(
+                    {"id": record["id"], "tipo": node_type, **decode_embedding_properties(record["properties"])}
+                )
+        return existing_nodes
+
+    def artifact_graph(self, artifact_id: str) -> Optional[dict]:
+        with observe_query("artifact_graph"), neo4j_conn.driver.session() as session:
+            record = session.run(ARTIFACT_GRAPH_QUERY, {"id": artifact_id}).single()
+            return artifact_graph_record(artifact_id, record)
+
+    async def artifact_graph_async(self, artifact_id: str) -> Optional[dict]:
+        async with observe_query_async("artifact_graph"), neo4j_conn.async_driver.session() as session:
+            result = await session.run(ARTIFACT_GRAPH_QUERY, {"id": artifact_id})
+            return artifact_graph_record(artifact_id, await result.single())
+
+    def similar_nodes(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        with observe_query("vector_search"), neo4j_conn.driver.session() as session:
+            return match_records(session.run(*vector_search_statement(label, rows, k)))
+
+    async def similar_nodes_async(self, label: str, rows: List[dict], k: int) -> List[dict]:
+        async with observe_query_async("vector_search"), neo4j_conn.async_driver.session() as session:
+            result = await session.run(*vector_search_statement(label, rows, k))
+            return match_records(await result.data())
+
+    def server_time(self) -> int:
+        with neo4j_conn.driver.session() as session:
+            return session.run(SERVER_TIME_QUERY).single()["now"]
+
+    def catalog_page(self, label: str, after: str, fields: List[str], limit: int):
+        # Records are yielded as they stream in.
+        parameters = {"after": after, "fields": fields, "limit": limit}
+        with observe_query("catalog_page"), neo4j_conn.driver.session() as session:
+            yield from session.run(CATALOG_PAGE_QUERY.format(label=label), parameters)
+
+    def catalog_delta(self, label: str, since: int, fields: List[str]):
+        parameters = {"since": since, "fields": fields}
+        with observe_query("catalog_delta"), neo4j_conn.driver.session() as session:
+            yield from session.run(CATALOG_DELTA_QUERY.format(label=label), parameters)
+
+    def close(self):
+        neo4j_conn.close()
+
+    async def close_async(self):
+        await neo4j_conn.close_async()
+
+
+_graph_store: Optional[GraphStore] = None
+
+def get_graph_store() -> GraphStore:
+    """
+    Returns the graph store picked by GRAPH_STORE, created on first use.
+    """
+    global _graph_store
+    if _graph_store is None:
+        if GRAPH_STORE == "memory":
+            _graph_store = MemoryGraphStore(VECTOR_INDEX_PROPERTIES, GRAPH_SNAPSHOT_PATH)
+        elif GRAPH_STORE == "bulk":
+            _graph_store = BulkExportStore()
+        else:
+            _graph_store = BoltGraphStore()
+    return _graph_store
+
+def set_graph_store(store: GraphStore):
+    global _graph_store
+    _graph_store = store
+
+def persist_graph_store():
+    get_graph_store().persist()
+
+def push_graph(source: MemoryGraphStore, target: GraphStore, chunk_size: int = BULK_WRITE_CHUNK_SIZE):
+    """
+    Writes everything in `source` to `target`, one transaction per chunk of rows.
+    """
+    ops = source.export_ops()
+    total = sum(len(op.rows) for op in ops)
+    written = 0
+    for op in ops:
+        for chunk in chunked(op.rows, chunk_size):
+            target.write([WriteOp(op.kind, op.key, chunk)])
+            written += len(chunk)
+        print(f"[Grafo] {written}/{total} filas escritas ({op.kind} {'/'.join(op.key)}).")
+
+@dataclass
+class PendingWrite:
+    delta: GraphDelta
+    future: Future
+    rows: int
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces the graph writes of many artifacts into batched transactions.
+
+    Writes wait in a bounded queue; a background thread takes them as a batch once NEO4J_WRITE_FLUSH_SECONDS
+    have passed since the first one or the batch reaches NEO4J_WRITE_BATCH_MAX_ARTIFACTS writes or
+    NEO4J_WRITE_BATCH_MAX_ROWS rows, and commits the batch in one transaction (see `batch_ops`).
+    Transient errors are retried with exponential backoff; if a batch fails otherwise, its writes are retried
+    one by one so only the failing one gets the error. Each write has a future that resolves when its batch
+    is committed.
+    """
+
+    def __init__(self):
+        self.queue: "queue.Queue[Optional[PendingWrite]]" = queue.Queue(maxsize=NEO4J_WRITE_BUFFER_MAX_PENDING)
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.artifacts = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="neo4j-write-behind", daemon=True)
+                self.thread.start()
+
+    def close(self):
         """
-        parameters = {
-            "origen": relacion_dict["origen"],
-            "destino": relacion_dict["destino"],
-        }
-        neo4j_conn.execute_query(query, parameters)
+        Commits the pending writes and stops the background thread.
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join()
+
+    def pending_write(self, delta: GraphDelta) -> PendingWrite:
+        return PendingWrite(delta, Future(), delta_rows(delta))
+
+    def submit(self, delta: GraphDelta) -> Future:
+        """
+        Queues the statements of one write; blocks while the queue is full.
+        """
+        pending = self.pending_write(delta)
+        self.start()
+        self.queue.put(pending)
+        return pending.future
+
+    def write(self, delta: GraphDelta):
+        self.submit(delta).result()
+
+    async def write_async(self, delta: GraphDelta):
+        pending = self.pending_write(delta)
+        self.start()
+        try:
+            self.queue.put_nowait(pending)
+        except queue.Full:
+            await asyncio.to_thread(self.queue.put, pending)
+        await asyncio.wrap_future(pending.future)
+
+    def next_batch(self) -> Optional[List[PendingWrite]]:
+        """
+        Waits for the next batch; returns None once `close` was called and nothing is left.
+        """
+        first = self.queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        rows = first.rows
+        deadline = time.monotonic() + NEO4J_WRITE_FLUSH_SECONDS
+        while len(batch) < NEO4J_WRITE_BATCH_MAX_ARTIFACTS and rows < NEO4J_WRITE_BATCH_MAX_ROWS:
+            try:
+                pending = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if pending is None:
+                # Stop after this batch.
+                self.queue.put(None)
+                break
+            batch.append(pending)
+            rows += pending.rows
+        return batch
+
+    def run(self):
+        while (batch := self.next_batch()) is not None:
+            # Writes whose caller was cancelled while waiting are dropped.
+            batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+            if batch:
+                self.flush(batch)
+
+    def flush(self, batch: List[PendingWrite]):
+        try:
+            self.commit(batch_ops([pending.delta for pending in batch]))
+        except TRANSIENT_WRITE_ERRORS as error:
+            for pending in batch:
+                pending.future.set_exception(error)
+            return
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0].future.set_exception(error)
+                return
+            print(f"[Neo4j] Falló un lote de {len(batch)} artifacts ({error}); se escriben por separado.")
+            for pending in batch:
+                self.flush([pending])
+            return
+
+        with self.lock:
+            self.batches += 1
+            self.artifacts += len(batch)
+        for pending in batch:
+            pending.future.set_result(None)
+
+    def commit(self, ops: List[WriteOp]):
+        for attempt in range(NEO4J_WRITE_MAX_ATTEMPTS):
+            try:
+                get_graph_store().write(ops)
+                return
+            except TRANSIENT_WRITE_ERRORS as error:
+                if attempt == NEO4J_WRITE_MAX_ATTEMPTS - 1:
+                    raise
+                delay = NEO4J_WRITE_BACKOFF_SECONDS * 2 ** attempt
+                print(
+                    f"[Neo4j] {error.__class__.__name__} al escribir un lote; "
+                    f"reintento {attempt + 1}/{NEO4J_WRITE_MAX_ATTEMPTS - 1} en {delay:.1f}s."
+                )
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"pending": self.queue.qsize(), "batches": self.batches, "artifacts": self.artifacts}
+
+
+write_buffer = WriteBehindBuffer()
+
+
+def collect_write_buffer_metrics():
+    stats = write_buffer.stats()
+    yield ("neo4j_write_buffer_pending", "gauge", "Artifact writes waiting for a batch.", [({}, stats["pending"])])
+    yield ("neo4j_write_batches_total", "counter", "Batched write transactions committed.", [({}, stats["batches"])])
+    yield ("neo4j_write_batch_artifacts_total", "counter", "Artifact writes committed in batches.",
+           [({}, stats["artifacts"])])
+
+
+register_collector(collect_write_buffer_metrics)
+
+def write_graph_delta(delta: GraphDelta):
+    """
+    Writes the statements through the write-behind buffer (or directly, when it is disabled) and returns
+    once they are committed.
+    """
+    if not any(delta.values()):
+        return
+    if NEO4J_WRITE_BUFFER_ENABLED:
+        write_buffer.write(delta)
+    else:
+        get_graph_store().write(delta_ops(delta))
+
+async def write_graph_delta_async(delta: GraphDelta):
+    if not any(delta.values()):
+        return
+    if NEO4J_WRITE_BUFFER_ENABLED:
+        await write_buffer.write_async(delta)
+    else:
+        await get_graph_store().write_async(delta_ops(delta))
+
+def link_artifact_to_nodes(artifact_node: ArtifactNode, knowledge_nodes):
+    """
+    Links the ArtifactNode to key Nodes.
+    """
+    print("[Neo4j] Creando relaciones del Artifact con nodos válidos...")
+
+    write_graph_delta({
+        "artifacts": artifact_node_ops(artifact_node),
+        "links": generated_link_ops(artifact_node, knowledge_nodes),
+    })
+
+    print("[Neo4j] Relaciones del Artifact insertadas correctamente.")
+
+def link_user_to_artifact(artifact_node: ArtifactNode, user_node: UserNode):
+    """
+    Links a User to an Artifact.
+    """
+    print("[Neo4j] Creando relación Usuario-Artifact...")
+
+    write_graph_delta({"links": user_link_ops(artifact_node, user_node)})
+
+    print("[Neo4j] Relación Usuario-Artifact insertada correctamente.")
+
+async def link_user_to_artifact_async(artifact_node: ArtifactNode, user_node: UserNode):
+    print("[Neo4j] Creando relación Usuario-Artifact...")
+
+    await write_graph_delta_async({"links": user_link_ops(artifact_node, user_node)})
+
+    print("[Neo4j] Relación Usuario-Artifact insertada correctamente.")
+
+def record_artifact_delta(artifact_node: ArtifactNode, user_node: UserNode) -> GraphDelta:
+    processing = artifact_node.model_copy(update={"status": ARTIFACT_STATUS_PROCESSING})
+    return {"artifacts": artifact_node_ops(processing), "links": user_link_ops(artifact_node, user_node)}
+
+def record_artifact(artifact_node: ArtifactNode, user_node: UserNode):
+    """
+    Writes the Artifact (status "processing") and its CREATED_BY link before the rest of the pipeline finishes.
+    """
+    write_graph_delta(record_artifact_delta(artifact_node, user_node))
+
+async def record_artifact_async(artifact_node: ArtifactNode, user_node: UserNode):
+    await write_graph_delta_async(record_artifact_delta(artifact_node, user_node))
+
+def artifact_status_delta(artifact_id: str, status: str) -> GraphDelta:
+    return {"artifacts": [WriteOp(ARTIFACT_STATUS, (), [{"id": artifact_id, "status": status}])]}
+
+def mark_artifact_status(artifact_id: str, status: str):
+    write_graph_delta(artifact_status_delta(artifact_id, status))
+
+async def mark_artifact_status_async(artifact_id: str, status: str):
+    await write_graph_delta_async(artifact_status_delta(artifact_id, status))
+
+def insert_into_neo4j(graph_update: GraphUpdate, existing_nodes=None):
+    """
+    Inserts nodes and relationships into Neo4j, merging nodes and relationships that already exist.
+    Includes the private embeddings allowed by each node's EMBEDDING_POLICY.
+    Nodes are written with one `UNWIND` statement per label and relationships with one per type,
+    all inside a single transaction. Relationship endpoints are matched by label so the `id` constraints apply;
+    `existing_nodes` provides the labels of nodes that are not part of this update.
+    """
+    print("[Neo4j] Inserting nodes and relationships...")
+
+    node_labels = build_node_labels(graph_update.nodos, existing_nodes)
+    write_graph_delta({
+        "nodes": node_ops(graph_update.nodos),
+        "relationships": relationship_ops(graph_update.relaciones, node_labels),
+    })
+
+    print("[Neo4j] Data inserted successfully.")
+
+def write_artifact_graph(graph_update: GraphUpdate, artifact_node: ArtifactNode, user_node: UserNode,
+                         existing_nodes=None, extra_links=()):
+    """
+    Writes everything produced for one artifact (nodes, relationships, GENERATED and CREATED_BY links, plus
+    `extra_links` such as those of `revision_link_ops`) in a single transaction, shared with the writes of
+    other artifacts when the write-behind buffer is on.
+    """
+    print("[Neo4j] Escribiendo nodos, relaciones y enlaces del artifact en una transacción...")
+
+    write_graph_delta(artifact_graph_delta(graph_update, artifact_node, user_node, existing_nodes, extra_links))
+
+    print("[Neo4j] Data inserted successfully.")
+
+async def write_artifact_graph_async(graph_update: GraphUpdate, artifact_node: ArtifactNode, user_node: UserNode,
+                                     existing_nodes=None, extra_links=()):
+    """
+    Async version of `write_artifact_graph`.
+    """
+    print("[Neo4j] Escribiendo nodos, relaciones y enlaces del artifact en una transacción...")
+
+    await write_graph_delta_async(
+        artifact_graph_delta(graph_update, artifact_node, user_node, existing_nodes, extra_links)
+    )
+
+    print("[Neo4j] Data inserted successfully.")
 
-    print("[Neo4j] Data inserted successfully.")
\ No newline at end of file
+if __name__ == "__main__":
+    ensure_schema()
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", ".cache/jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobStore:
+    """
+    SQLite-backed store of artifact processing jobs, so queued jobs survive a restart.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                code TEXT NOT NULL,
+                user TEXT NOT NULL,
+                force INTEGER NOT NULL,
+                previous_artifact_id TEXT,
+                timings TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "previous_artifact_id" not in columns:
+            # Databases created before revisions were supported.
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN previous_artifact_id TEXT")
+
+    def _execute(self, query, parameters=(), fetch: Optional[str] = None):
+        with self._lock:
+            cursor = self._conn.execute(query, parameters)
+            if fetch == "one":
+                return cursor.fetchone()
+            if fetch == "all":
+                return cursor.fetchall()
+            return None
+
+    def create(self, code: str, user: str, force: bool = False, previous_artifact_id: Optional[str] = None) -> str:
+        job_id = str(uuid.uuid4())
+        self._execute(
+            "INSERT INTO jobs (id, status, code, user, force, previous_artifact_id, timings, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, JOB_QUEUED, code, user, int(force), previous_artifact_id, "{}", time.time())
+        )
+        return job_id
+
+    def load(self, job_id: str) -> Optional[dict]:
+        """
+        Returns the stored job including its code, or None if it does not exist.
+        """
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,), fetch="one")
+        return dict(row) if row else None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Returns the public view of a job: status, current stage, per-stage timings and result.
+        """
+        job = self.load(job_id)
+        if job is None:
+            return None
+
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "timings": json.loads(job["timings"]),
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+        }
+
+    def mark_running(self, job_id: str):
+        self._execute(
+            "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+            (JOB_RUNNING, time.time(), job_id)
+        )
+
+    def update_stage(self, job_id: str, stage: str, timings: dict):
+        self._execute(
+            "UPDATE jobs SET stage = ?, timings = ? WHERE id = ?",
+            (stage, json.dumps(timings), job_id)
+        )
+
+    def finish(self, job_id: str, result: dict, timings: dict):
+        self._execute(
+            "UPDATE jobs SET status = ?, stage = NULL, result = ?, timings = ?, finished_at = ? WHERE id = ?",
+            (JOB_SUCCEEDED, json.dumps(result), json.dumps(timings), time.time(), job_id)
+        )
+
+    def fail(self, job_id: str, error: str, timings: dict):
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, timings = ?, finished_at = ? WHERE id = ?",
+            (JOB_FAILED, error, json.dumps(timings), time.time(), job_id)
+        )
+
+    def pending_ids(self) -> list:
+        """
+        Returns the jobs that did not finish, oldest first. Jobs interrupted while running are queued again.
+        """
+        self._execute("UPDATE jobs SET status = ?, stage = NULL WHERE status = ?", (JOB_QUEUED, JOB_RUNNING))
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (JOB_QUEUED,), fetch="all"
+        )
+        return [row["id"] for row in rows]
+
+
+class StageTimer:
+    """
+    Records how long each pipeline stage takes, closing the previous stage when the next one starts.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._stage = None
+        self._started_at = None
+
+    def start(self, stage: str):
+        self.stop()
+        self._stage = stage
+        self._started_at = time.perf_counter()
+
+    def stop(self):
+        if self._stage is not None:
+            self.timings[self._stage] = round(time.perf_counter() - self._started_at, 4)
+            self._stage = None
+
+
+class JobQueue:
+    """
+    Runs artifact processing jobs in the background with a bounded number of concurrent workers.
+    """
+
+    def __init__(self, store: JobStore, process_fn, workers: int = JOB_WORKERS):
+        self.store = store
+        self.process_fn = process_fn
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for job_id in self.store.pending_ids():
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"[Jobs] {self.workers} workers iniciados, {self._queue.qsize()} jobs pendientes.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, code: str, user: str, force: bool = False, previous_artifact_id: Optional[str] = None) -> str:
+        job_id = self.store.create(code, user, force, previous_artifact_id)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self.store.load(job_id)
+        if job is None or job["status"] != JOB_QUEUED:
+            return
+
+        self.store.mark_running(job_id)
+        timer = StageTimer()
+
+        def on_stage(stage: str):
+            timer.start(stage)
+            self.store.update_stage(job_id, stage, timer.timings)
+
+        try:
+            result = await self.process_fn(
+                job["code"], job["user"], force=bool(job["force"]), on_stage=on_stage,
+                previous_artifact_id=job["previous_artifact_id"]
+            )
+            timer.stop()
+            # Stages overlap, so the timings measured by the pipeline are more accurate than the stage starts.
+            self.store.finish(job_id, result, result.get("timings") or timer.timings)
+        except Exception as e:
+            timer.stop()
+            print(f"[Jobs] Error procesando el job {job_id}: {e}")
+            self.store.fail(job_id, str(e), timer.timings)
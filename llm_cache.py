@@ -0,0 +1,142 @@
+"""
+On-disk cache of parsed LLM responses.
+
+Entries are keyed by (stage, model, prompt template version, hash of the rendered messages, hash of the response
+schema) and hold the parsed Pydantic result as JSON in their own SQLite file (LLM_CACHE_PATH, default
+`.cache/llm.sqlite`), a `SQLiteStore` like the embedding cache's but separate from it, with TTL and size eviction.
+Each stage (extraction, business_analysis, relationships) can be switched off.
+"""
+import os
+import json
+import hashlib
+from typing import Awaitable, Callable, Optional, Type, TypeVar
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from embedding_cache import SQLiteStore
+from metrics import register_collector
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_STAGES = {
+    stage.strip() for stage in os.getenv("LLM_CACHE_STAGES", "extraction,business_analysis,relationships").split(",")
+    if stage.strip()
+}
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm.sqlite")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Entries older than this are ignored (0 disables the TTL).
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+ParsedModel = TypeVar("ParsedModel", bound=BaseModel)
+
+
+class LLMCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 ttl_seconds: float = LLM_CACHE_TTL_SECONDS):
+        self.store = SQLiteStore(path, max_bytes, table="llm_responses")
+        self.max_age = ttl_seconds or None
+        self.hits = {}
+        self.misses = {}
+
+    @staticmethod
+    def make_key(stage: str, model: str, template_version: str, messages: list,
+                 response_format: Type[BaseModel]) -> str:
+        rendered = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+        prompt_hash = hashlib.sha256(rendered.encode("utf-8")).hexdigest()
+        schema = json.dumps(response_format.model_json_schema(), sort_keys=True)
+        schema_hash = hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+        return f"{stage}:{model}:v{template_version}:{schema_hash}:{prompt_hash}"
+
+    def get(self, stage: str, key: str, response_format: Type[ParsedModel]) -> Optional[ParsedModel]:
+        data = self.store.get_many([key], max_age=self.max_age).get(key)
+        if data is None:
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+            return None
+
+        self.hits[stage] = self.hits.get(stage, 0) + 1
+        return response_format.model_validate_json(data)
+
+    def put(self, key: str, parsed: BaseModel):
+        self.store.put_many({key: parsed.model_dump_json().encode("utf-8")})
+
+    def stats(self) -> dict:
+        return {
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "disk_bytes": self.store.total_bytes,
+        }
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache(stage: str) -> Optional[LLMCache]:
+    """
+    Returns the process-wide LLM cache, or None when caching is disabled for `stage`.
+    """
+    global _llm_cache
+    if not LLM_CACHE_ENABLED or stage not in LLM_CACHE_STAGES:
+        return None
+    if _llm_cache is None:
+        _llm_cache = LLMCache()
+    return _llm_cache
+
+
+def cached_parse(stage: str, model: str, template_version: str, messages: list,
+                 response_format: Type[ParsedModel], call: Callable[[], ParsedModel],
+                 cacheable: Callable[[ParsedModel], bool] = lambda parsed: True) -> ParsedModel:
+    """
+    Returns the cached parsed response for these messages, or runs `call` and stores its result
+    when `cacheable` accepts it.
+    """
+    cache = get_llm_cache(stage)
+    if cache is None:
+        return call()
+
+    key = cache.make_key(stage, model, template_version, messages, response_format)
+    parsed = cache.get(stage, key, response_format)
+    if parsed is not None:
+        print(f"[LLM cache] Respuesta de {stage} obtenida del cache.")
+        return parsed
+
+    parsed = call()
+    if cacheable(parsed):
+        cache.put(key, parsed)
+    return parsed
+
+
+async def cached_parse_async(stage: str, model: str, template_version: str, messages: list,
+                             response_format: Type[ParsedModel], call: Callable[[], Awaitable[ParsedModel]],
+                             cacheable: Callable[[ParsedModel], bool] = lambda parsed: True) -> ParsedModel:
+    """
+    Async version of `cached_parse`; `call` returns an awaitable.
+    """
+    cache = get_llm_cache(stage)
+    if cache is None:
+        return await call()
+
+    key = cache.make_key(stage, model, template_version, messages, response_format)
+    parsed = cache.get(stage, key, response_format)
+    if parsed is not None:
+        print(f"[LLM cache] Respuesta de {stage} obtenida del cache.")
+        return parsed
+
+    parsed = await call()
+    if cacheable(parsed):
+        cache.put(key, parsed)
+    return parsed
+
+
+def collect_llm_cache_metrics():
+    if _llm_cache is None:
+        return
+    stats = _llm_cache.stats()
+    yield ("llm_cache_lookups_total", "counter", "LLM response cache lookups by stage and result.",
+           [({"stage": stage, "result": "hit"}, count) for stage, count in stats["hits"].items()]
+           + [({"stage": stage, "result": "miss"}, count) for stage, count in stats["misses"].items()])
+    lookups = sum(stats["hits"].values()) + sum(stats["misses"].values())
+    yield ("llm_cache_hit_ratio", "gauge", "Share of LLM calls served from the cache.",
+           [({}, sum(stats["hits"].values()) / lookups if lookups else 0.0)])
+
+
+register_collector(collect_llm_cache_metrics)
@@ -1,66 +1,472 @@
 import uuid
-from extract import extract_metadata_with_retries
-from business_analyst_agent import analyze_business_context
-from nodes_generator import generate_knowledge_nodes
-from relationship_agent import determine_relationships
-from insertion import insert_into_neo4j, get_existing_nodes, link_artifact_to_nodes, link_user_to_artifact
+from typing import Callable, Optional
+from extract import extract_metadata_with_retries, extract_metadata_with_retries_async, empty_extraction
+from business_analyst_agent import analyze_business_context, analyze_business_context_async
+from nodes_generator import (
+    build_entity_nodes, build_business_nodes, add_private_embeddings_batch, add_private_embeddings_batch_async
+)
+from relationship_agent import determine_relationships, determine_relationships_async
+from insertion import (
+    link_user_to_artifact, find_artifact_by_fingerprint, write_artifact_graph, record_artifact, mark_artifact_status,
+    link_user_to_artifact_async, find_artifact_by_fingerprint_async, write_artifact_graph_async,
+    record_artifact_async, mark_artifact_status_async, find_artifact_graph, find_artifact_graph_async,
+    revision_link_ops,
+    ARTIFACT_STATUS_PROCESSING, ARTIFACT_STATUS_COMPLETE, ARTIFACT_STATUS_FAILED
+)
 from process import GraphUpdate
 from nodes import ArtifactNode, UserNode
+from fingerprint import compute_artifact_fingerprint
+from retrieval import retrieve_candidate_nodes, retrieve_candidate_nodes_async, index_new_nodes
+from graph_catalog import merge_candidates, merge_candidates_async, record_written_nodes
+from entity_resolution import resolve_entities, resolve_entities_async, remap_relationships
+from metrics import PipelineRun, log_event
+from pipeline_dag import Stage, run_stages, run_stages_async, critical_path
+from revision import RevisionPlan, plan_revision
 
-def process_artifact(artifact_code: str, artifact_user: str):
+def print_extracted_entities(extracted_entities):
+    print("APIs detectadas:", extracted_entities.apis)
+    print("Endpoints detectados:", extracted_entities.endpoints)
+    print("Bases de datos detectadas:", extracted_entities.databases)
+    print("Consultas SQL detectadas:", extracted_entities.queries)
+    print("Tablas detectadas:", extracted_entities.tables)
+    print("Relaciones detectadas:", extracted_entities.relationships)
+
+def reused_artifact_response(existing_artifact):
+    return {
+        "artifact_id": existing_artifact["id"],
+        "message": "Artifact already processed",
+        "nodes_inserted": existing_artifact["nodes_inserted"] or 0,
+        "relationships_inserted": existing_artifact["relationships_inserted"] or 0,
+        "reused": True
+    }
+
+def build_graph_update(artifact_node: ArtifactNode, nodos, relaciones) -> GraphUpdate:
+    """
+    Builds the GraphUpdate to insert for a processed artifact and records its counts in the Artifact node.
+    """
+    artifact_node.nodes_inserted = len(nodos)
+    artifact_node.relationships_inserted = len(relaciones)
+    artifact_node.status = ARTIFACT_STATUS_COMPLETE
+
+    return GraphUpdate(
+        nodos=list(nodos),
+        relaciones=[rel.model_dump() for rel in relaciones]
+    )
+
+def combine_relationships(results: dict) -> list:
+    """
+    Joins the relationships between new nodes (computed before entity resolution, so remapped to the canonical
+    ids) with the relationships between new and existing nodes.
+    """
+    _, id_map = results["entity_resolution"]
+    relaciones = remap_relationships(results["new_relationships"].relaciones, id_map)
+    return remap_relationships(relaciones + results["relationships"].relaciones, {})
+
+def processed_artifact_response(artifact_node: ArtifactNode):
+    return {
+        "artifact_id": artifact_node.id,
+        "message": "Artifact processed successfully",
+        "nodes_inserted": artifact_node.nodes_inserted,
+        "relationships_inserted": artifact_node.relationships_inserted,
+        "reused": False
+    }
+
+def revision_response(artifact_node: ArtifactNode, plan: RevisionPlan):
+    return {
+        **processed_artifact_response(artifact_node),
+        "message": "Artifact revision processed successfully",
+        "previous_artifact_id": plan.previous_id,
+        "incremental": not plan.full,
+        "changed_lines": plan.diff.changed_lines,
+        "nodes_reused": len(plan.linked_nodes()),
+        "nodes_removed": len(plan.removed),
+    }
+
+def finish_run(run: PipelineRun, response: dict) -> dict:
+    outcome = "reused" if response["reused"] else "processed"
+    response["timings"] = run.finish(outcome, artifact_id=response["artifact_id"])
+    return response
+
+# Stage dependencies. Business analysis and the embeddings only need the extraction, the relationships between
+# new nodes do not need embeddings, and the Artifact/User nodes are written as soon as the run starts.
+PIPELINE_DEPENDENCIES = {
+    "record_artifact": (),
+    "extraction": (),
+    "business_analysis": ("extraction",),
+    "node_generation": ("extraction",),
+    "business_nodes": ("business_analysis",),
+    "embeddings": ("node_generation",),
+    "business_embeddings": ("business_nodes",),
+    "new_relationships": ("node_generation", "business_nodes"),
+    "entity_resolution": ("embeddings", "business_embeddings"),
+    "existing_nodes": ("entity_resolution",),
+    "relationships": ("existing_nodes",),
+    "insertion": ("record_artifact", "new_relationships", "relationships"),
+}
+
+def pipeline_stages(functions: dict) -> list:
+    return [Stage(name, functions[name], after) for name, after in PIPELINE_DEPENDENCIES.items()]
+
+def new_nodes(results: dict) -> list:
+    return results["node_generation"] + results["business_nodes"]
+
+def resolution_copies(results: dict) -> list:
+    # Entity resolution changes node ids in place; it works on copies because the relationships between new
+    # nodes may still be evaluated on the original ids (they are remapped afterwards, see combine_relationships).
+    return [nodo.model_copy() for nodo in new_nodes(results)]
+
+def artifact_stage_functions(artifact_node: ArtifactNode, user_node: UserNode) -> dict:
+    def extraction(results):
+        print("[Paso 2] Extrayendo información del código...")
+        extracted_entities = extract_metadata_with_retries(artifact_node.code)
+        print_extracted_entities(extracted_entities)
+        return extracted_entities
+
+    def business_analysis(results):
+        print("[Paso 3] Generando contexto de negocio para APIs, Endpoints, Bases de Datos, KPIs y Estadísticas...")
+        return analyze_business_context(results["extraction"])
+
+    def node_generation(results):
+        print("[Paso 4] Generando nodos a partir de las entidades extraídas...")
+        return build_entity_nodes(results["extraction"])
+
+    def new_relationships(results):
+        print("[Paso 6] Evaluando relaciones entre los nodos nuevos...")
+        return determine_relationships(new_nodes(results), [])
+
+    def entity_resolution(results):
+        print("[Paso 4] Resolviendo entidades ya existentes en el grafo...")
+        id_map = {}
+        return resolve_entities(resolution_copies(results), id_map), id_map
+
+    def existing_nodes(results):
+        print("[Paso 5] Obteniendo nodos existentes similares de la base...")
+        nodos = results["entity_resolution"][0]
+        return merge_candidates(retrieve_candidate_nodes(nodos), nodos)
+
+    def relationships(results):
+        print("[Paso 6] Evaluando relaciones con los nodos existentes...")
+        return determine_relationships(results["entity_resolution"][0], results["existing_nodes"], include_new_pairs=False)
+
+    def insertion(results):
+        print("[Paso 7] Insertando nodos y relaciones en Neo4j...")
+        nodos = results["entity_resolution"][0]
+        graph_update = build_graph_update(artifact_node, nodos, combine_relationships(results))
+        write_artifact_graph(graph_update, artifact_node, user_node, results["existing_nodes"])
+        index_new_nodes(graph_update.nodos)
+        record_written_nodes(graph_update.nodos)
+
+    return {
+        "record_artifact": lambda results: record_artifact(artifact_node, user_node),
+        "extraction": extraction,
+        "business_analysis": business_analysis,
+        "node_generation": node_generation,
+        "business_nodes": lambda results: build_business_nodes(results["business_analysis"]),
+        "embeddings": lambda results: add_private_embeddings_batch(results["node_generation"]),
+        "business_embeddings": lambda results: add_private_embeddings_batch(results["business_nodes"]),
+        "new_relationships": new_relationships,
+        "entity_resolution": entity_resolution,
+        "existing_nodes": existing_nodes,
+        "relationships": relationships,
+        "insertion": insertion,
+    }
+
+def artifact_stage_functions_async(artifact_node: ArtifactNode, user_node: UserNode) -> dict:
+    async def extraction(results):
+        print("[Paso 2] Extrayendo información del código...")
+        extracted_entities = await extract_metadata_with_retries_async(artifact_node.code)
+        print_extracted_entities(extracted_entities)
+        return extracted_entities
+
+    async def business_analysis(results):
+        print("[Paso 3] Generando contexto de negocio para APIs, Endpoints, Bases de Datos, KPIs y Estadísticas...")
+        return await analyze_business_context_async(results["extraction"])
+
+    async def node_generation(results):
+        print("[Paso 4] Generando nodos a partir de las entidades extraídas...")
+        return build_entity_nodes(results["extraction"])
+
+    async def business_nodes(results):
+        return build_business_nodes(results["business_analysis"])
+
+    async def new_relationships(results):
+        print("[Paso 6] Evaluando relaciones entre los nodos nuevos...")
+        return await determine_relationships_async(new_nodes(results), [])
+
+    async def entity_resolution(results):
+        print("[Paso 4] Resolviendo entidades ya existentes en el grafo...")
+        id_map = {}
+        return await resolve_entities_async(resolution_copies(results), id_map), id_map
+
+    async def existing_nodes(results):
+        print("[Paso 5] Obteniendo nodos existentes similares de la base...")
+        nodos = results["entity_resolution"][0]
+        return await merge_candidates_async(await retrieve_candidate_nodes_async(nodos), nodos)
+
+    async def relationships(results):
+        print("[Paso 6] Evaluando relaciones con los nodos existentes...")
+        return await determine_relationships_async(
+            results["entity_resolution"][0], results["existing_nodes"], include_new_pairs=False
+        )
+
+    async def insertion(results):
+        print("[Paso 7] Insertando nodos y relaciones en Neo4j...")
+        nodos = results["entity_resolution"][0]
+        graph_update = build_graph_update(artifact_node, nodos, combine_relationships(results))
+        await write_artifact_graph_async(graph_update, artifact_node, user_node, results["existing_nodes"])
+        index_new_nodes(graph_update.nodos)
+        record_written_nodes(graph_update.nodos)
+
+    return {
+        "record_artifact": lambda results: record_artifact_async(artifact_node, user_node),
+        "extraction": extraction,
+        "business_analysis": business_analysis,
+        "node_generation": node_generation,
+        "business_nodes": business_nodes,
+        "embeddings": lambda results: add_private_embeddings_batch_async(results["node_generation"]),
+        "business_embeddings": lambda results: add_private_embeddings_batch_async(results["business_nodes"]),
+        "new_relationships": new_relationships,
+        "entity_resolution": entity_resolution,
+        "existing_nodes": existing_nodes,
+        "relationships": relationships,
+        "insertion": insertion,
+    }
+
+def artifact_stages(artifact_node: ArtifactNode, user_node: UserNode) -> list:
+    return pipeline_stages(artifact_stage_functions(artifact_node, user_node))
+
+def artifact_stages_async(artifact_node: ArtifactNode, user_node: UserNode) -> list:
+    return pipeline_stages(artifact_stage_functions_async(artifact_node, user_node))
+
+def with_linked_nodes(existing_nodes: list, plan: RevisionPlan) -> list:
+    # The previous nodes kept by the revision are candidates too, so new nodes get related to them.
+    known = {node_data["id"] for node_data in existing_nodes}
+    return existing_nodes + [node_data for node_data in plan.linked_nodes() if node_data["id"] not in known]
+
+def revision_stages(artifact_node: ArtifactNode, user_node: UserNode, plan: RevisionPlan) -> list:
+    """
+    Stages of an incremental revision (see revision.py): only the changed region of the code is extracted, only
+    the nodes new to the artifact are embedded, resolved and related, and the insertion links the kept previous
+    nodes and the previous artifact instead of writing them again.
+    """
+    functions = artifact_stage_functions(artifact_node, user_node)
+    node_generation, business_nodes, existing_nodes = (
+        functions["node_generation"], functions["business_nodes"], functions["existing_nodes"]
+    )
+
+    def extraction(results):
+        if not plan.region_code.strip():
+            return empty_extraction()
+        print("[Paso 2] Extrayendo información de las líneas cambiadas...")
+        extracted_entities = extract_metadata_with_retries(plan.region_code)
+        print_extracted_entities(extracted_entities)
+        return extracted_entities
+
+    def insertion(results):
+        print("[Paso 7] Insertando el delta de la revisión en Neo4j...")
+        nodos = results["entity_resolution"][0]
+        graph_update = build_graph_update(artifact_node, nodos, combine_relationships(results))
+        revision_links = revision_link_ops(artifact_node, plan.previous_id, plan.linked_nodes())
+        write_artifact_graph(graph_update, artifact_node, user_node, results["existing_nodes"], revision_links)
+        index_new_nodes(graph_update.nodos)
+        record_written_nodes(graph_update.nodos)
+
+    functions.update({
+        "extraction": extraction,
+        "node_generation": lambda results: plan.reuse(node_generation(results)),
+        "business_nodes": lambda results: plan.reuse(business_nodes(results)),
+        "existing_nodes": lambda results: with_linked_nodes(existing_nodes(results), plan),
+        "insertion": insertion,
+    })
+    return pipeline_stages(functions)
+
+def revision_stages_async(artifact_node: ArtifactNode, user_node: UserNode, plan: RevisionPlan) -> list:
+    """
+    Async version of `revision_stages`.
+    """
+    functions = artifact_stage_functions_async(artifact_node, user_node)
+    node_generation, business_nodes, existing_nodes = (
+        functions["node_generation"], functions["business_nodes"], functions["existing_nodes"]
+    )
+
+    async def extraction(results):
+        if not plan.region_code.strip():
+            return empty_extraction()
+        print("[Paso 2] Extrayendo información de las líneas cambiadas...")
+        extracted_entities = await extract_metadata_with_retries_async(plan.region_code)
+        print_extracted_entities(extracted_entities)
+        return extracted_entities
+
+    async def reused_node_generation(results):
+        return plan.reuse(await node_generation(results))
+
+    async def reused_business_nodes(results):
+        return plan.reuse(await business_nodes(results))
+
+    async def linked_existing_nodes(results):
+        return with_linked_nodes(await existing_nodes(results), plan)
+
+    async def insertion(results):
+        print("[Paso 7] Insertando el delta de la revisión en Neo4j...")
+        nodos = results["entity_resolution"][0]
+        graph_update = build_graph_update(artifact_node, nodos, combine_relationships(results))
+        revision_links = revision_link_ops(artifact_node, plan.previous_id, plan.linked_nodes())
+        await write_artifact_graph_async(
+            graph_update, artifact_node, user_node, results["existing_nodes"], revision_links
+        )
+        index_new_nodes(graph_update.nodos)
+        record_written_nodes(graph_update.nodos)
+
+    functions.update({
+        "extraction": extraction,
+        "node_generation": reused_node_generation,
+        "business_nodes": reused_business_nodes,
+        "existing_nodes": linked_existing_nodes,
+        "insertion": insertion,
+    })
+    return pipeline_stages(functions)
+
+def revision_plan(previous: Optional[dict], previous_artifact_id: str, artifact_code: str) -> RevisionPlan:
+    if previous is None:
+        raise ValueError(f"No existe el artifact previo {previous_artifact_id}.")
+    return plan_revision(previous, artifact_code)
+
+def new_artifact_nodes(artifact_code: str, artifact_user: str, fingerprint: str):
+    artifact_node = ArtifactNode(id=str(uuid.uuid4()), code=artifact_code, fingerprint=fingerprint, status=ARTIFACT_STATUS_PROCESSING)
+    return artifact_node, UserNode(id=artifact_user)
+
+def log_critical_path(stages: list, run: PipelineRun):
+    path, seconds = critical_path(stages, run.timings)
+    log_event("pipeline_critical_path", stages=path, seconds=round(seconds, 4))
+
+def mark_failed(artifact_node: ArtifactNode, error: Exception):
+    print(f"[Error] Falló el procesamiento del artifact {artifact_node.id}: {error}")
+    try:
+        mark_artifact_status(artifact_node.id, ARTIFACT_STATUS_FAILED)
+    except Exception as e:
+        print(f"[Warning] No se pudo marcar el artifact {artifact_node.id} como fallido: {e}")
+
+async def mark_failed_async(artifact_node: ArtifactNode, error: Exception):
+    print(f"[Error] Falló el procesamiento del artifact {artifact_node.id}: {error}")
+    try:
+        await mark_artifact_status_async(artifact_node.id, ARTIFACT_STATUS_FAILED)
+    except Exception as e:
+        print(f"[Warning] No se pudo marcar el artifact {artifact_node.id} como fallido: {e}")
+
+def process_artifact(artifact_code: str, artifact_user: str, force: bool = False,
+                     previous_artifact_id: Optional[str] = None):
     """
     Processes an artifact provided as a string instead of reading from a file.
+    If an artifact with the same code fingerprint was already processed, the user is linked to it
+    and the extraction is skipped, unless `force` is True.
+    With `previous_artifact_id` the code is processed as a revision of that artifact: only the changed
+    region is extracted and the new artifact is linked to it with REVISION_OF (see revision.py).
+    The stages run as a dependency graph (see PIPELINE_DEPENDENCIES), overlapping the independent ones.
+    The response includes the seconds spent in each stage under `timings`.
     """
+    run = PipelineRun()
+    try:
+        response = run_pipeline(artifact_code, artifact_user, force, run, previous_artifact_id)
+    except Exception:
+        run.finish("failed")
+        raise
+    return finish_run(run, response)
+
+def run_pipeline(artifact_code: str, artifact_user: str, force: bool, run: PipelineRun,
+                 previous_artifact_id: Optional[str] = None):
     print("[Paso 1] Recibiendo el código del artifact...")
+    run.stage("fingerprint")
 
     if not artifact_code:
         raise ValueError("El código del artifact está vacío.")
 
-    print("[Paso 2] Extrayendo información del código...")
-    extracted_entities = extract_metadata_with_retries(artifact_code)
+    fingerprint = compute_artifact_fingerprint(artifact_code)
 
-    print("APIs detectadas:", extracted_entities.apis)
-    print("Endpoints detectados:", extracted_entities.endpoints)
-    print("Bases de datos detectadas:", extracted_entities.databases)
-    print("Consultas SQL detectadas:", extracted_entities.queries)
-    print("Tablas detectadas:", extracted_entities.tables)
-    print("Relaciones detectadas:", extracted_entities.relationships)
+    if not force:
+        existing_artifact = find_artifact_by_fingerprint(fingerprint)
+        if existing_artifact:
+            print(f"[Paso 1] Artifact ya procesado ({existing_artifact['id']}), enlazando usuario...")
+            artifact_node = ArtifactNode(id=existing_artifact["id"], code=artifact_code, fingerprint=fingerprint)
+            link_user_to_artifact(artifact_node, UserNode(id=artifact_user))
+            return reused_artifact_response(existing_artifact)
+    run.close_stage()
 
-    print("[Paso 3] Generando contexto de negocio para APIs, Endpoints, Bases de Datos, KPIs y Estadísticas...")
-    business_contexts = analyze_business_context(extracted_entities)
+    plan = None
+    if previous_artifact_id:
+        run.stage("revision_plan")
+        plan = revision_plan(find_artifact_graph(previous_artifact_id), previous_artifact_id, artifact_code)
+        run.close_stage()
 
-    print("[Paso 4] Generando nodos a partir de las entidades extraídas...")
-    knowledge_nodes = generate_knowledge_nodes(extracted_entities, business_contexts)
+    artifact_node, user_node = new_artifact_nodes(artifact_code, artifact_user, fingerprint)
+    stages = revision_stages(artifact_node, user_node, plan) if plan else artifact_stages(artifact_node, user_node)
+    try:
+        run_stages(stages, on_done=run.record)
+    except Exception as e:
+        mark_failed(artifact_node, e)
+        raise
+    log_critical_path(stages, run)
 
-    print("[Paso 5] Obteniendo nodos existentes de la base...")
-    existing_nodes = []
+    return revision_response(artifact_node, plan) if plan else processed_artifact_response(artifact_node)
 
-    print("[Paso 6] Evaluando relaciones entre todos los nodos...")
-    knowledge_relationships = determine_relationships(
-        knowledge_nodes,
-        existing_nodes
-    )
+async def process_artifact_async(artifact_code: str, artifact_user: str, force: bool = False,
+                                 on_stage: Optional[Callable[[str], None]] = None,
+                                 previous_artifact_id: Optional[str] = None):
+    """
+    Async version of `process_artifact`: every OpenAI and Neo4j call is awaited,
+    so the event loop keeps serving other requests while an artifact is processed.
+    `on_stage` is called with the name of each stage when it starts.
+    """
+    run = PipelineRun()
+    try:
+        response = await run_pipeline_async(
+            artifact_code, artifact_user, force, run, on_stage, previous_artifact_id
+        )
+    except Exception:
+        run.finish("failed")
+        raise
+    return finish_run(run, response)
 
-    print("[Paso 7] Insertando nodos y relaciones en Neo4j...")
+async def run_pipeline_async(artifact_code: str, artifact_user: str, force: bool, run: PipelineRun,
+                             on_stage: Optional[Callable[[str], None]] = None,
+                             previous_artifact_id: Optional[str] = None):
+    print("[Paso 1] Recibiendo el código del artifact...")
+    run.stage("fingerprint")
+    if on_stage is not None:
+        on_stage("fingerprint")
 
-    artifact_id = str(uuid.uuid4())
-    artifact_node = ArtifactNode(id=artifact_id, code=artifact_code)
+    if not artifact_code:
+        raise ValueError("El código del artifact está vacío.")
 
-    user_id = artifact_user
-    user_node = UserNode(id=user_id)
+    fingerprint = compute_artifact_fingerprint(artifact_code)
 
-    graph_update = GraphUpdate(
-        nodos=[node for node in knowledge_nodes.nodos],
-        relaciones=[rel.model_dump() for rel in knowledge_relationships.relaciones]
-    )
-    insert_into_neo4j(graph_update)
+    if not force:
+        existing_artifact = await find_artifact_by_fingerprint_async(fingerprint)
+        if existing_artifact:
+            print(f"[Paso 1] Artifact ya procesado ({existing_artifact['id']}), enlazando usuario...")
+            artifact_node = ArtifactNode(id=existing_artifact["id"], code=artifact_code, fingerprint=fingerprint)
+            await link_user_to_artifact_async(artifact_node, UserNode(id=artifact_user))
+            return reused_artifact_response(existing_artifact)
+    run.close_stage()
 
-    link_artifact_to_nodes(artifact_node, knowledge_nodes.nodos)
-    link_user_to_artifact(artifact_node, user_node)
+    plan = None
+    if previous_artifact_id:
+        run.stage("revision_plan")
+        if on_stage is not None:
+            on_stage("revision_plan")
+        previous = await find_artifact_graph_async(previous_artifact_id)
+        plan = revision_plan(previous, previous_artifact_id, artifact_code)
+        run.close_stage()
 
-    return {
-        "artifact_id": artifact_id,
-        "message": "Artifact processed successfully",
-        "nodes_inserted": len(knowledge_nodes.nodos),
-        "relationships_inserted": len(knowledge_relationships.relaciones)
-    }
\ No newline at end of file
+    artifact_node, user_node = new_artifact_nodes(artifact_code, artifact_user, fingerprint)
+    if plan:
+        stages = revision_stages_async(artifact_node, user_node, plan)
+    else:
+        stages = artifact_stages_async(artifact_node, user_node)
+    try:
+        await run_stages_async(stages, on_start=on_stage, on_done=run.record)
+    except Exception as e:
+        await mark_failed_async(artifact_node, e)
+        raise
+    log_critical_path(stages, run)
+
+    return revision_response(artifact_node, plan) if plan else processed_artifact_response(artifact_node)
@@ -0,0 +1,243 @@
+"""
+Pipeline instrumentation.
+
+Counters and latency histograms for the pipeline stages, the OpenAI calls and the Neo4j queries, rendered in the
+Prometheus text format by `GET /metrics`. Modules with their own counters (caches, scheduler queue) register a
+collector that is read at render time. Stage timings are also emitted as JSON log lines.
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_LOG_ENABLED = os.getenv("METRICS_LOG_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+# (name, type, help, [(labels, value)]) as returned by a collector.
+MetricFamily = Tuple[str, str, str, List[Tuple[dict, float]]]
+
+
+def log_event(event: str, **fields):
+    if METRICS_LOG_ENABLED:
+        print(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, default=str))
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[dict] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values: Dict[LabelValues, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series: Dict[LabelValues, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            # [count per bucket..., +Inf count, sum]
+            series = self.series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    labels = format_labels(self.label_names, key, {"le": format_value(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {format_value(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+ARTIFACTS_TOTAL = Counter("pipeline_artifacts_total", "Artifacts processed by outcome.", ("outcome",))
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Duration of each pipeline stage.", ("stage",))
+ARTIFACT_SECONDS = Histogram("pipeline_artifact_seconds", "Total processing time per artifact.", ("outcome",))
+
+OPENAI_REQUESTS_TOTAL = Counter(
+    "openai_requests_total", "OpenAI calls by stage, model and result (ok, retry, error).", ("stage", "model", "result")
+)
+OPENAI_REQUEST_SECONDS = Histogram("openai_request_seconds", "Latency of OpenAI calls.", ("stage", "model"))
+OPENAI_TOKENS_TOTAL = Counter(
+    "openai_tokens_total", "Tokens used by OpenAI calls (prompt, completion).", ("stage", "model", "kind")
+)
+
+NEO4J_QUERIES_TOTAL = Counter("neo4j_queries_total", "Graph queries by operation and result.", ("operation", "result"))
+NEO4J_QUERY_SECONDS = Histogram("neo4j_query_seconds", "Latency of graph queries.", ("operation",))
+NEO4J_BYTES_WRITTEN_TOTAL = Counter(
+    "neo4j_bytes_written_total", "Approximate size of the parameters sent in graph writes.", ("operation",)
+)
+
+REGISTRY = [
+    ARTIFACTS_TOTAL, STAGE_SECONDS, ARTIFACT_SECONDS,
+    OPENAI_REQUESTS_TOTAL, OPENAI_REQUEST_SECONDS, OPENAI_TOKENS_TOTAL,
+    NEO4J_QUERIES_TOTAL, NEO4J_QUERY_SECONDS, NEO4J_BYTES_WRITTEN_TOTAL,
+]
+
+_collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[MetricFamily]]):
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, help_text, samples in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels.keys(), labels.values())} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def payload_bytes(value) -> int:
+    """
+    Approximate size of a query parameter: text and bytes by length, numbers as 8 bytes.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_bytes(key) + payload_bytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_bytes(item) for item in value)
+    return 8
+
+
+def record_openai_call(stage: str, model: str, seconds: float, result: str, response=None):
+    OPENAI_REQUESTS_TOTAL.inc(stage=stage, model=model, result=result)
+    OPENAI_REQUEST_SECONDS.observe(seconds, stage=stage, model=model)
+
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is not None:
+        OPENAI_TOKENS_TOTAL.inc(prompt_tokens, stage=stage, model=model, kind="prompt")
+    if completion_tokens is not None:
+        OPENAI_TOKENS_TOTAL.inc(completion_tokens, stage=stage, model=model, kind="completion")
+
+
+@contextmanager
+def observe_query(operation: str, statements=None):
+    """
+    Times a graph query; `statements` ((query, parameters) pairs) are counted as bytes written.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        NEO4J_QUERIES_TOTAL.inc(operation=operation, result="error")
+        raise
+    finally:
+        NEO4J_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    NEO4J_QUERIES_TOTAL.inc(operation=operation, result="ok")
+    if statements:
+        NEO4J_BYTES_WRITTEN_TOTAL.inc(
+            sum(payload_bytes(parameters) for _, parameters in statements), operation=operation
+        )
+
+
+@asynccontextmanager
+async def observe_query_async(operation: str, statements=None):
+    with observe_query(operation, statements):
+        yield
+
+
+class PipelineRun:
+    """
+    Timings of one artifact: `stage(name)` closes the running stage and starts the next one; overlapping
+    stages are reported with `record`.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self._stage: Optional[str] = None
+        self._stage_started_at = 0.0
+
+    def stage(self, name: str):
+        self.close_stage()
+        self._stage = name
+        self._stage_started_at = time.perf_counter()
+
+    def close_stage(self):
+        if self._stage is None:
+            return
+        self.record(self._stage, time.perf_counter() - self._stage_started_at)
+        self._stage = None
+
+    def record(self, stage: str, seconds: float):
+        """
+        Records a stage timed elsewhere, e.g. by the DAG executor, where stages overlap.
+        """
+        self.timings[stage] = round(self.timings.get(stage, 0.0) + seconds, 4)
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        log_event("pipeline_stage", stage=stage, seconds=round(seconds, 4))
+
+    def finish(self, outcome: str, **fields) -> Dict[str, float]:
+        self.close_stage()
+        total = time.perf_counter() - self.started_at
+        self.timings["total"] = round(total, 4)
+        ARTIFACTS_TOTAL.inc(outcome=outcome)
+        ARTIFACT_SECONDS.observe(total, outcome=outcome)
+        log_event("artifact_processed", outcome=outcome, timings=self.timings, **fields)
+        return self.timings
@@ -0,0 +1,174 @@
+"""
+Reduces artifact code before it is sent to the extraction prompt.
+
+Comments, styling (className/style/chart styling props), static JSX markup and UI imports are removed;
+string literals, URLs, SQL and the data-access code are kept as they are.
+
+    uv run python minify.py artifacts/*.txt
+"""
+import os
+import re
+import sys
+from static_extract import iter_string_literals, is_python
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Imports of modules that may reveal data access are kept; every other import is UI noise for the extractor.
+DATA_ACCESS_MODULES = re.compile(
+    r"axios|supabase|firebase|graphql|apollo|prisma|mongo|knex|sequelize|\bpg\b|mysql|sqlite|sql|"
+    r"requests|httpx|urllib|aiohttp|\bapi\b|client|\bdb\b|database|service",
+    re.IGNORECASE,
+)
+JS_IMPORT_LINE = re.compile(r"^\s*import\s[^;]*?\bfrom\s+(['\"])([^'\"]+)\1\s*;?\s*$|^\s*import\s+(['\"])([^'\"]+)\3\s*;?\s*$")
+PYTHON_IMPORT_LINE = re.compile(r"^\s*(?:from\s+([\w.]+)\s+import\s.+|import\s+([\w., ]+))$")
+
+# JSX props that only carry presentation.
+STYLE_ATTRIBUTES = (
+    "className", "class", "style", "stroke", "fill", "strokeWidth", "strokeDasharray", "strokeOpacity",
+    "fillOpacity", "radius", "margin", "width", "height", "fontSize", "fontWeight", "tick", "tickLine",
+    "axisLine", "barSize", "barGap", "dot", "activeDot", "iconType", "iconSize", "cursor", "opacity",
+    "viewBox", "xmlns", "size", "color", "variant", "align", "verticalAlign", "wrapperStyle", "contentStyle",
+    "labelStyle", "angle", "textAnchor", "dx", "dy", "offset", "interval", "minTickGap", "padding",
+)
+ATTRIBUTE_START = re.compile(r"\s(" + "|".join(STYLE_ATTRIBUTES) + r")=(?=[\"'{])")
+
+JSX_COMMENT = re.compile(r"\{\s*/\*.*?\*/\s*\}", re.DOTALL)
+BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+LINE_COMMENT = re.compile(r"(?<![:\\])//[^\n]*")
+PYTHON_COMMENT = re.compile(r"#[^\n]*")
+# A line that is only JSX tags and text, without expressions.
+STATIC_JSX_LINE = re.compile(r"^\s*(</?[A-Za-z][\w.]*[^{}]*>[^{}<]*)+$|^\s*/?>\s*$|^\s*<[A-Za-z][\w.]*\s*$")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with tiktoken when it is installed, otherwise estimates ~4 characters per token.
+    """
+    if tiktoken is not None:
+        return len(tiktoken.encoding_for_model("gpt-4o").encode(text))
+    return (len(text) + 3) // 4
+
+
+def strip_comments(code: str) -> str:
+    python = is_python(code)
+    pieces = []
+    position = 0
+    for literal in iter_string_literals(code):
+        pieces.append(strip_comments_outside_literals(code[position:literal.start], python))
+        pieces.append(code[literal.start:literal.end])
+        position = literal.end
+    pieces.append(strip_comments_outside_literals(code[position:], python))
+    return "".join(pieces)
+
+
+def strip_comments_outside_literals(segment: str, python: bool) -> str:
+    if python:
+        return PYTHON_COMMENT.sub("", segment)
+    segment = JSX_COMMENT.sub("", segment)
+    segment = BLOCK_COMMENT.sub("", segment)
+    return LINE_COMMENT.sub("", segment)
+
+
+def skip_attribute_value(code: str, position: int) -> int:
+    """
+    Returns the position right after the attribute value starting at `position` (a quoted string or a {...} block).
+    """
+    opening = code[position]
+    if opening in "\"'":
+        end = code.find(opening, position + 1)
+        return len(code) if end == -1 else end + 1
+
+    depth = 0
+    quote = None
+    escaped = False
+    for index in range(position, len(code)):
+        char = code[index]
+        if escaped:
+            escaped = False
+        elif quote:
+            if char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'`":
+            quote = char
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(code)
+
+
+def strip_style_attributes(code: str) -> str:
+    pieces = []
+    position = 0
+    for match in ATTRIBUTE_START.finditer(code):
+        if match.start() < position:
+            continue
+        pieces.append(code[position:match.start()])
+        position = skip_attribute_value(code, match.end())
+    pieces.append(code[position:])
+    return "".join(pieces)
+
+
+def is_irrelevant_import(line: str, python: bool) -> bool:
+    if python:
+        match = PYTHON_IMPORT_LINE.match(line)
+        return bool(match) and not DATA_ACCESS_MODULES.search(match.group(1) or match.group(2))
+    match = JS_IMPORT_LINE.match(line)
+    return bool(match) and not DATA_ACCESS_MODULES.search(match.group(2) or match.group(4))
+
+
+def minify_code(code: str) -> str:
+    """
+    Returns the artifact code without comments, styling, static JSX markup, UI imports and indentation.
+    """
+    python = is_python(code)
+    code = strip_comments(code)
+    if not python:
+        code = strip_style_attributes(code)
+
+    lines = []
+    for line in code.split("\n"):
+        if is_irrelevant_import(line, python):
+            continue
+        if not python and STATIC_JSX_LINE.match(line):
+            continue
+        line = line.rstrip() if python else line.strip()
+        if line.strip():
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def token_report(code: str, minified: str = None) -> dict:
+    """
+    Compares the token count of the original and minified code.
+    """
+    minified = minify_code(code) if minified is None else minified
+    original_tokens = count_tokens(code)
+    minified_tokens = count_tokens(minified)
+    return {
+        "original_tokens": original_tokens,
+        "minified_tokens": minified_tokens,
+        "reduction": 1 - minified_tokens / original_tokens if original_tokens else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    total_original = 0
+    total_minified = 0
+    print(f"{'artifact':45} {'original':>10} {'minified':>10} {'reduction':>10}")
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as file:
+            report = token_report(file.read())
+        total_original += report["original_tokens"]
+        total_minified += report["minified_tokens"]
+        print(f"{os.path.basename(path):45} {report['original_tokens']:>10} {report['minified_tokens']:>10} {report['reduction']:>10.1%}")
+
+    if total_original:
+        print(f"{'TOTAL':45} {total_original:>10} {total_minified:>10} {1 - total_minified / total_original:>10.1%}")
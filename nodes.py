@@ -1,11 +1,35 @@
 from pydantic import BaseModel, PrivateAttr
-from typing import List, Optional
+from typing import ClassVar, List, Optional, Tuple
+from dataclasses import dataclass
 from datetime import datetime
+from vectors import Embedding
+
+@dataclass(frozen=True)
+class EmbeddingPolicy:
+    """
+    Which fields of a node are embedded on their own (`_<field>_embedding`), which are concatenated
+    into a single `_composite_embedding`, and which are never embedded.
+    """
+    embed: Tuple[str, ...] = ()
+    composite: Tuple[str, ...] = ()
+    skip: Tuple[str, ...] = ()
+
+    def embedding_properties(self) -> List[str]:
+        properties = [f"{field}_embedding" for field in self.embed]
+        if self.composite:
+            properties.append("composite_embedding")
+        return properties
 
 class ArtifactNode(BaseModel):
     id: str
     code: str
-    _code_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    fingerprint: Optional[str] = None
+    nodes_inserted: int = 0
+    relationships_inserted: int = 0
+    # "processing" while the pipeline runs, "complete" once everything is written, "failed" if it stopped.
+    status: str = "complete"
+
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(skip=("code", "fingerprint"))
 
 class UserNode(BaseModel):
     id: str
@@ -17,10 +41,13 @@ class QueryNode(BaseModel):
     sql_query: Optional[str]
     cypher_query: str
 
-    _pregunta_original_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _pregunta_generica_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _sql_query_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _cypher_query_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(
+        embed=("pregunta_generica",),
+        composite=("pregunta_original", "pregunta_generica", "sql_query", "cypher_query"),
+    )
+
+    _pregunta_generica_embedding: Optional[Embedding] = PrivateAttr(default=None)
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class TableNode(BaseModel):
     id: str
@@ -28,17 +55,23 @@ class TableNode(BaseModel):
     columnas: List[str]
     tipos_datos: List[str]
 
-    _nombre_tabla_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _columnas_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _tipos_datos_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(
+        embed=("nombre_tabla",),
+        composite=("nombre_tabla", "columnas"),
+        skip=("tipos_datos",),
+    )
+
+    _nombre_tabla_embedding: Optional[Embedding] = PrivateAttr(default=None)
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class KPINode(BaseModel):
     id: str
     nombre: str
     descripcion: str
 
-    _nombre_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _descripcion_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(composite=("nombre", "descripcion"))
+
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class VisualizationNode(BaseModel):
     id: str
@@ -47,18 +80,21 @@ class VisualizationNode(BaseModel):
     eje_y: List[str]
     colores: List[str]
 
-    _tipo_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _eje_x_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _eje_y_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _colores_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(
+        composite=("tipo", "eje_x", "eje_y"),
+        skip=("colores",),
+    )
+
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class StatisticNode(BaseModel):
     id: str
     name: str
     description: str
 
-    _name_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _description_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(composite=("name", "description"))
+
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class APINode(BaseModel):
     id: str
@@ -66,9 +102,13 @@ class APINode(BaseModel):
     description: str
     base_url: str
 
-    _name_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _description_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _base_url_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(
+        embed=("description",),
+        composite=("name", "base_url", "description"),
+    )
+
+    _description_embedding: Optional[Embedding] = PrivateAttr(default=None)
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class EndpointNode(BaseModel):
     id: str
@@ -78,11 +118,14 @@ class EndpointNode(BaseModel):
     parameters: Optional[List[str]]
     description: str
 
-    _api_id_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _path_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _method_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _parameters_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _description_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(
+        embed=("description",),
+        composite=("method", "path", "parameters", "description"),
+        skip=("api_id",),
+    )
+
+    _description_embedding: Optional[Embedding] = PrivateAttr(default=None)
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class DatabaseNode(BaseModel):
     id: str
@@ -91,10 +134,14 @@ class DatabaseNode(BaseModel):
     description: str
     query_pattern: Optional[str]
 
-    _name_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _type_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _description_embedding: Optional[List[float]] = PrivateAttr(default=None)
-    _query_pattern_embedding: Optional[List[float]] = PrivateAttr(default=None)
+    EMBEDDING_POLICY: ClassVar[EmbeddingPolicy] = EmbeddingPolicy(
+        embed=("description",),
+        composite=("name", "description", "query_pattern"),
+        skip=("type",),
+    )
+
+    _description_embedding: Optional[Embedding] = PrivateAttr(default=None)
+    _composite_embedding: Optional[Embedding] = PrivateAttr(default=None)
 
 class KnowledgeNodesCollection(BaseModel):
-    nodos: List[BaseModel]
\ No newline at end of file
+    nodos: List[BaseModel]
@@ -1,64 +1,106 @@
-import os
 import uuid
-from openai import OpenAI
 from nodes import (
-    KnowledgeNodesCollection, QueryNode, VisualizationNode, 
+    EmbeddingPolicy, KnowledgeNodesCollection, QueryNode, VisualizationNode, 
     APINode, EndpointNode, DatabaseNode, TableNode, 
     KPINode, StatisticNode
 )
 from business_analyst_agent import BusinessAnalysisResponse
+from embeddings import embed_texts, embed_texts_async
 
-def embed_with_openai_large(text: str) -> list[float]:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    if not client.api_key:
-        raise ValueError("OPENAI_API_KEY no está definido en el archivo .env")
+def embedding_text(value) -> str:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return " ".join(value).strip()
+    return ""
 
-    response = client.embeddings.create(
-        model="text-embedding-3-large",
-        input=text
-    )
-    return response.data[0].embedding
+def embedding_policy(node) -> EmbeddingPolicy:
+    return getattr(node, "EMBEDDING_POLICY", EmbeddingPolicy())
 
-def add_private_embeddings(node):
-    for field, value in node.__dict__.items():
-        if field == "id":
-            continue
+def collect_embedding_inputs(node) -> list[tuple[str, str]]:
+    """
+    Returns the (private attribute, text) pairs to embed for a node, following its EMBEDDING_POLICY:
+    one input per `embed` field and one composite input with the `composite` fields as "field: value" lines.
+    """
+    policy = embedding_policy(node)
+    inputs = []
+    for field in policy.embed:
+        text = embedding_text(getattr(node, field))
+        if text:
+            inputs.append((f"_{field}_embedding", text))
 
-        private_attr = f"_{field}_embedding"
+    composite_lines = []
+    for field in policy.composite:
+        text = embedding_text(getattr(node, field))
+        if text:
+            composite_lines.append(f"{field}: {text}")
+    if composite_lines:
+        inputs.append(("_composite_embedding", "\n".join(composite_lines)))
+    return inputs
 
-        if isinstance(value, str) and value.strip():
-            setattr(node, private_attr, embed_with_openai_large(value))
-        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
-            joined = " ".join(value)
-            setattr(node, private_attr, embed_with_openai_large(joined))
-    return node
+def collect_embedding_targets(nodes) -> tuple[list, list]:
+    targets = []
+    texts = []
+    for node in nodes:
+        for private_attr, text in collect_embedding_inputs(node):
+            targets.append((node, private_attr))
+            texts.append(text)
+    return targets, texts
 
-def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeNodesCollection:
+def add_private_embeddings_batch(nodes):
     """
-    Converts extracted entities and business analysis insights into knowledge nodes, ensuring unique IDs,
-    and adds private embedding fields for all applicable properties (except 'id').
+    Embeds the fields of all nodes together, in as few embedding requests as possible,
+    and writes each vector back into its `_<field>_embedding` / `_composite_embedding` private attribute.
+    """
+    targets, texts = collect_embedding_targets(nodes)
+    for (node, private_attr), vector in zip(targets, embed_texts(texts)):
+        setattr(node, private_attr, vector)
+    return nodes
+
+async def add_private_embeddings_batch_async(nodes):
+    targets, texts = collect_embedding_targets(nodes)
+    for (node, private_attr), vector in zip(targets, await embed_texts_async(texts)):
+        setattr(node, private_attr, vector)
+    return nodes
+
+def add_private_embeddings(node):
+    return add_private_embeddings_batch([node])[0]
+
+def build_knowledge_nodes(extracted_entities, business_context) -> list:
+    """
+    Converts extracted entities and business analysis insights into knowledge nodes, ensuring unique IDs.
+    The nodes are returned without embeddings.
+    """
+    return build_entity_nodes(extracted_entities) + build_business_nodes(business_context)
+
+def build_entity_nodes(extracted_entities) -> list:
+    """
+    Builds the API, Endpoint, Database, Table and Query nodes of the extracted entities, without embeddings.
     """
     nodes = []
+    # Extracted ids (api_1, ...) are replaced by UUIDs; endpoints keep pointing to their API.
+    api_ids = {}
 
     for api in extracted_entities.apis:
+        api_ids[api.id] = str(uuid.uuid4())
         api_node = APINode(
-            id=str(uuid.uuid4()),
+            id=api_ids[api.id],
             name=api.name,
             description=api.description,
             base_url=api.base_url
         )
-        nodes.append(add_private_embeddings(api_node))
+        nodes.append(api_node)
 
     for endpoint in extracted_entities.endpoints:
         endpoint_node = EndpointNode(
             id=str(uuid.uuid4()),
-            api_id=str(uuid.uuid4()),
+            api_id=api_ids.get(endpoint.api_id) or str(uuid.uuid4()),
             path=endpoint.path,
             method=endpoint.method,
             parameters=endpoint.parameters or [],
             description=endpoint.description
         )
-        nodes.append(add_private_embeddings(endpoint_node))
+        nodes.append(endpoint_node)
 
     for db in extracted_entities.databases:
         db_node = DatabaseNode(
@@ -68,7 +110,7 @@ def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeN
             description=db.description,
             query_pattern=db.query_pattern or ""
         )
-        nodes.append(add_private_embeddings(db_node))
+        nodes.append(db_node)
 
     for table in extracted_entities.tables:
         table_node = TableNode(
@@ -77,7 +119,7 @@ def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeN
             columnas=table.columnas,
             tipos_datos=table.tipos_datos
         )
-        nodes.append(add_private_embeddings(table_node))
+        nodes.append(table_node)
 
     for query in extracted_entities.queries:
         query_node = QueryNode(
@@ -87,8 +129,15 @@ def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeN
             sql_query=query.sql_query or "",
             cypher_query=query.cypher_query or ""
         )
-        nodes.append(add_private_embeddings(query_node))
+        nodes.append(query_node)
 
+    return nodes
+
+def build_business_nodes(business_context) -> list:
+    """
+    Builds the KPI and Statistic nodes of the business analysis insights, without embeddings.
+    """
+    nodes = []
     if business_context and business_context.insights:
         for insight in business_context.insights:
 
@@ -99,7 +148,7 @@ def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeN
                         nombre=kpi,
                         descripcion=f"KPI clave en faenación de pollos: {kpi}"
                     )
-                    nodes.append(add_private_embeddings(kpi_node))
+                    nodes.append(kpi_node)
 
             if insight.statistical_methods:
                 for stat in insight.statistical_methods:
@@ -108,6 +157,25 @@ def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeN
                         name=stat,
                         description=f"Método estadístico relevante en producción avícola: {stat}"
                     )
-                    nodes.append(add_private_embeddings(stat_node))
+                    nodes.append(stat_node)
+
+    return nodes
+
+def generate_knowledge_nodes(extracted_entities, business_context) -> KnowledgeNodesCollection:
+    """
+    Converts extracted entities and business analysis insights into knowledge nodes, ensuring unique IDs,
+    and adds the private embeddings listed in each node's EMBEDDING_POLICY.
+    """
+    nodes = build_knowledge_nodes(extracted_entities, business_context)
+    add_private_embeddings_batch(nodes)
+
+    return KnowledgeNodesCollection(nodos=nodes)
+
+async def generate_knowledge_nodes_async(extracted_entities, business_context) -> KnowledgeNodesCollection:
+    """
+    Async version of `generate_knowledge_nodes`.
+    """
+    nodes = build_knowledge_nodes(extracted_entities, business_context)
+    await add_private_embeddings_batch_async(nodes)
 
     return KnowledgeNodesCollection(nodos=nodes)
\ No newline at end of file
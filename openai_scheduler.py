@@ -0,0 +1,332 @@
+"""
+Shared scheduler for every OpenAI call.
+
+All stages (extraction, business analysis, relationships, embeddings) use the same clients and submit their
+requests here. Each model has a request and token budget per minute (refilled continuously); requests wait in a
+priority queue until the budget allows them, so under load throughput stays at the account limit instead of
+bursting into 429s. Rate limits, timeouts and 5xx errors are retried with jittered exponential backoff, honoring
+the `retry-after` headers, and a 429 pauses the whole model so the other queued requests back off too.
+"""
+import os
+import time
+import heapq
+import random
+import asyncio
+import threading
+import itertools
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
+from dotenv import load_dotenv
+from minify import count_tokens
+from metrics import record_openai_call, register_collector
+
+load_dotenv()
+
+# "model=rpm:tpm,..." with the limits of the account; models not listed use the gpt-4o limits.
+OPENAI_RATE_LIMITS = os.getenv("OPENAI_RATE_LIMITS", "gpt-4o=500:30000,text-embedding-3-large=3000:1000000")
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "6"))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "1"))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "60"))
+
+# Output tokens reserved for a chat completion before its real usage is known.
+CHAT_OUTPUT_TOKENS_ESTIMATE = 1000
+
+# Lower runs first: finishing the artifacts already in progress goes before starting new ones.
+STAGE_PRIORITIES = {
+    "relationships": 0,
+    "embeddings": 1,
+    "extraction": 2,
+    "business_analysis": 3,
+}
+
+# Longest sleep between two checks of the queue, so a waiting request notices when it reaches the head.
+QUEUE_POLL_SECONDS = 0.05
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+Response = TypeVar("Response")
+
+_openai_client: Optional[OpenAI] = None
+_async_openai_client: Optional[AsyncOpenAI] = None
+
+
+def get_openai_client() -> OpenAI:
+    """
+    Returns the OpenAI client shared by every stage. Its own retries are disabled: the scheduler retries.
+    """
+    global _openai_client
+    if _openai_client is None:
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        if not client.api_key:
+            raise ValueError("OPENAI_API_KEY no está definido en el archivo .env")
+        _openai_client = client
+    return _openai_client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    Returns the AsyncOpenAI client shared by every stage.
+    """
+    global _async_openai_client
+    if _async_openai_client is None:
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        if not client.api_key:
+            raise ValueError("OPENAI_API_KEY no está definido en el archivo .env")
+        _async_openai_client = client
+    return _async_openai_client
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[int, int]]:
+    limits = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        model, budget = item.split("=", 1)
+        rpm, tpm = budget.split(":")
+        limits[model.strip()] = (int(rpm), int(tpm))
+    return limits
+
+
+def estimate_chat_tokens(messages: list) -> int:
+    return sum(count_tokens(message["content"]) for message in messages) + CHAT_OUTPUT_TOKENS_ESTIMATE
+
+
+def estimate_embedding_tokens(texts: list) -> int:
+    return sum(count_tokens(text) for text in texts)
+
+
+def response_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class ModelBudget:
+    """
+    Requests and tokens available for one model, refilled continuously up to the per-minute limits.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now: float):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """
+        Seconds until a request of `tokens` fits in the budget (0 when it fits now).
+        """
+        self.refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        tokens = min(tokens, self.tpm)
+        missing_requests = max(0.0, 1 - self.requests) * 60 / self.rpm
+        missing_tokens = max(0.0, tokens - self.tokens) * 60 / self.tpm
+        return max(missing_requests, missing_tokens)
+
+    def take(self, tokens: int):
+        self.requests -= 1
+        self.tokens -= min(tokens, self.tpm)
+
+    def settle(self, estimated: int, actual: int):
+        # The budget may go below zero when a response used more than estimated; later requests wait for it.
+        self.tokens -= actual - min(estimated, self.tpm)
+
+    def pause(self, seconds: float, now: float):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class OpenAIScheduler:
+    def __init__(self, limits: Dict[str, Tuple[int, int]]):
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.budgets: Dict[str, ModelBudget] = {}
+        self.waiting = defaultdict(list)
+        self.in_flight = defaultdict(int)
+        self.sequence = itertools.count()
+
+    def budget(self, model: str) -> ModelBudget:
+        if model not in self.budgets:
+            rpm, tpm = self.limits.get(model) or self.limits.get("gpt-4o", (500, 30000))
+            self.budgets[model] = ModelBudget(rpm, tpm)
+        return self.budgets[model]
+
+    def enqueue(self, model: str, priority: int) -> tuple:
+        ticket = (priority, next(self.sequence))
+        with self.lock:
+            heapq.heappush(self.waiting[model], ticket)
+        return ticket
+
+    def try_acquire(self, model: str, ticket: tuple, tokens: int) -> float:
+        """
+        Takes the budget for the request when it is at the head of the queue and fits; otherwise returns
+        how long to sleep before checking again.
+        """
+        with self.lock:
+            queue = self.waiting[model]
+            if queue[0] != ticket:
+                return QUEUE_POLL_SECONDS
+
+            budget = self.budget(model)
+            wait = budget.wait_time(tokens, time.monotonic())
+            if wait > 0:
+                return min(wait, QUEUE_POLL_SECONDS * 10)
+
+            heapq.heappop(queue)
+            budget.take(tokens)
+            self.in_flight[model] += 1
+            return 0.0
+
+    def abandon(self, model: str, ticket: tuple):
+        with self.lock:
+            queue = self.waiting[model]
+            if ticket in queue:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+
+    def acquire(self, model: str, priority: int, tokens: int):
+        ticket = self.enqueue(model, priority)
+        try:
+            while (wait := self.try_acquire(model, ticket, tokens)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self.abandon(model, ticket)
+            raise
+
+    async def acquire_async(self, model: str, priority: int, tokens: int):
+        ticket = self.enqueue(model, priority)
+        try:
+            while (wait := self.try_acquire(model, ticket, tokens)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.abandon(model, ticket)
+            raise
+
+    def release(self, model: str, estimated: int, response=None):
+        actual = response_tokens(response)
+        with self.lock:
+            self.in_flight[model] -= 1
+            if actual is not None:
+                self.budget(model).settle(estimated, actual)
+
+    def backoff(self, model: str, stage: str, error: Exception, attempt: int) -> float:
+        """
+        Returns the jittered delay before retrying `error`; a rate limit also pauses the model for everyone.
+        """
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, OPENAI_BACKOFF_BASE_SECONDS)
+        else:
+            ceiling = min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * 2 ** attempt)
+            delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+
+        if isinstance(error, RateLimitError):
+            with self.lock:
+                self.budget(model).pause(delay, time.monotonic())
+
+        print(
+            f"[OpenAI] {error.__class__.__name__} en {stage} ({model}); "
+            f"reintento {attempt + 1}/{OPENAI_MAX_ATTEMPTS - 1} en {delay:.1f}s."
+        )
+        return delay
+
+    def submit(self, stage: str, model: str, call: Callable[[], Response], estimated_tokens: int) -> Response:
+        """
+        Runs `call` when the model budget allows it, retrying transient errors. Returns the API response.
+        """
+        priority = STAGE_PRIORITIES.get(stage, len(STAGE_PRIORITIES))
+        for attempt in range(OPENAI_MAX_ATTEMPTS):
+            self.acquire(model, priority, estimated_tokens)
+            started = time.perf_counter()
+            try:
+                response = call()
+            except RETRYABLE_ERRORS as error:
+                self.release(model, estimated_tokens)
+                if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                    record_openai_call(stage, model, time.perf_counter() - started, "error")
+                    raise
+                record_openai_call(stage, model, time.perf_counter() - started, "retry")
+                time.sleep(self.backoff(model, stage, error, attempt))
+                continue
+            except BaseException:
+                self.release(model, estimated_tokens)
+                record_openai_call(stage, model, time.perf_counter() - started, "error")
+                raise
+
+            self.release(model, estimated_tokens, response)
+            record_openai_call(stage, model, time.perf_counter() - started, "ok", response)
+            return response
+
+    async def submit_async(self, stage: str, model: str, call: Callable[[], Awaitable[Response]],
+                           estimated_tokens: int) -> Response:
+        """
+        Async version of `submit`; `call` returns an awaitable.
+        """
+        priority = STAGE_PRIORITIES.get(stage, len(STAGE_PRIORITIES))
+        for attempt in range(OPENAI_MAX_ATTEMPTS):
+            await self.acquire_async(model, priority, estimated_tokens)
+            started = time.perf_counter()
+            try:
+                response = await call()
+            except RETRYABLE_ERRORS as error:
+                self.release(model, estimated_tokens)
+                if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                    record_openai_call(stage, model, time.perf_counter() - started, "error")
+                    raise
+                record_openai_call(stage, model, time.perf_counter() - started, "retry")
+                await asyncio.sleep(self.backoff(model, stage, error, attempt))
+                continue
+            except BaseException:
+                self.release(model, estimated_tokens)
+                record_openai_call(stage, model, time.perf_counter() - started, "error")
+                raise
+
+            self.release(model, estimated_tokens, response)
+            record_openai_call(stage, model, time.perf_counter() - started, "ok", response)
+            return response
+
+    def queue_depth(self) -> dict:
+        with self.lock:
+            models = set(self.waiting) | set(self.in_flight)
+            return {
+                model: {"waiting": len(self.waiting[model]), "in_flight": self.in_flight[model]}
+                for model in sorted(models)
+            }
+
+
+scheduler = OpenAIScheduler(parse_rate_limits(OPENAI_RATE_LIMITS))
+
+
+def collect_queue_metrics():
+    depth = scheduler.queue_depth()
+    yield ("openai_queue_waiting", "gauge", "OpenAI requests waiting for rate-limit budget.",
+           [({"model": model}, values["waiting"]) for model, values in depth.items()])
+    yield ("openai_queue_in_flight", "gauge", "OpenAI requests in flight.",
+           [({"model": model}, values["in_flight"]) for model, values in depth.items()])
+
+
+register_collector(collect_queue_metrics)
@@ -0,0 +1,152 @@
+"""
+Dependency-graph executor for the pipeline stages.
+
+Each stage declares the stages it needs (`after`) and receives the results of the finished stages; a stage starts
+as soon as its dependencies are done, so independent stages overlap and the latency of an artifact is its critical
+path instead of the sum of its stages. `run_stages_async` runs the stages as asyncio tasks and `run_stages` runs
+them on threads. If a stage fails, no new stage starts and the error is raised once the running ones finish.
+"""
+import time
+import asyncio
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+StageCallback = Optional[Callable[[str], None]]
+TimingCallback = Optional[Callable[[str, float], None]]
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    # Receives the results of the finished stages, keyed by stage name.
+    run: Callable[[Dict[str, Any]], Any]
+    after: Tuple[str, ...] = ()
+
+
+def validate_stages(stages: List[Stage]):
+    names = [stage.name for stage in stages]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Etapas duplicadas en el pipeline: {names}")
+
+    known = set(names)
+    for stage in stages:
+        missing = set(stage.after) - known
+        if missing:
+            raise ValueError(f"La etapa {stage.name} depende de etapas inexistentes: {sorted(missing)}")
+
+    done = set()
+    pending = list(stages)
+    while pending:
+        ready = [stage for stage in pending if set(stage.after) <= done]
+        if not ready:
+            raise ValueError(f"Dependencias circulares entre: {[stage.name for stage in pending]}")
+        done.update(stage.name for stage in ready)
+        pending = [stage for stage in pending if stage.name not in done]
+
+
+def critical_path(stages: List[Stage], timings: Dict[str, float]) -> Tuple[List[str], float]:
+    """
+    Returns the chain of dependent stages with the largest total time, and that time.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    best: Dict[str, Tuple[float, List[str]]] = {}
+
+    def longest(name: str) -> Tuple[float, List[str]]:
+        if name not in best:
+            parents = [longest(parent) for parent in by_name[name].after]
+            seconds, path = max(parents, default=(0.0, []), key=lambda item: item[0])
+            best[name] = (seconds + timings.get(name, 0.0), path + [name])
+        return best[name]
+
+    seconds, path = max((longest(stage.name) for stage in stages), default=(0.0, []), key=lambda item: item[0])
+    return path, seconds
+
+
+def run_stages(stages: List[Stage], on_start: StageCallback = None, on_done: TimingCallback = None) -> Dict[str, Any]:
+    """
+    Runs the stages on threads, each one as soon as its dependencies finish. Returns every stage result.
+    """
+    validate_stages(stages)
+    results: Dict[str, Any] = {}
+    pending = list(stages)
+    running = {}
+    error = None
+
+    def run_timed(stage: Stage, inputs: Dict[str, Any]):
+        started = time.perf_counter()
+        result = stage.run(inputs)
+        return result, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=len(stages) or 1, thread_name_prefix="pipeline") as executor:
+        while pending or running:
+            if error is None:
+                for stage in [stage for stage in pending if all(name in results for name in stage.after)]:
+                    pending.remove(stage)
+                    if on_start is not None:
+                        on_start(stage.name)
+                    running[executor.submit(run_timed, stage, dict(results))] = stage
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    results[stage.name], seconds = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if on_done is not None:
+                    on_done(stage.name, seconds)
+
+    if error is not None:
+        raise error
+    return results
+
+
+async def run_stages_async(stages: List[Stage], on_start: StageCallback = None,
+                           on_done: TimingCallback = None) -> Dict[str, Any]:
+    """
+    Async version of `run_stages`: stage functions return awaitables and run as asyncio tasks.
+    """
+    validate_stages(stages)
+    results: Dict[str, Any] = {}
+    pending = list(stages)
+    running = {}
+    error = None
+
+    async def run_timed(stage: Stage, inputs: Dict[str, Any]):
+        started = time.perf_counter()
+        result = await stage.run(inputs)
+        return result, time.perf_counter() - started
+
+    try:
+        while pending or running:
+            if error is None:
+                for stage in [stage for stage in pending if all(name in results for name in stage.after)]:
+                    pending.remove(stage)
+                    if on_start is not None:
+                        on_start(stage.name)
+                    running[asyncio.ensure_future(run_timed(stage, dict(results)))] = stage
+            if not running:
+                break
+
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                stage = running.pop(task)
+                try:
+                    results[stage.name], seconds = task.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if on_done is not None:
+                    on_done(stage.name, seconds)
+    finally:
+        # Only reached with tasks still running when the caller is cancelled.
+        for task in running:
+            task.cancel()
+
+    if error is not None:
+        raise error
+    return results
@@ -1,16 +1,30 @@
+from typing import Dict, Tuple
 from relations import KnowledgeRelationshipsCollection, POSSIBLE_RELATIONSHIPS, KnowledgeRelationship
 from nodes import ArtifactNode
-from openai import OpenAI
 from openai.types.chat import ParsedChatCompletion
+from openai_scheduler import scheduler, estimate_chat_tokens, get_openai_client, get_async_openai_client
+from retrieval import without_embeddings
+from llm_cache import cached_parse, cached_parse_async
+from relationship_rules import (
+    RelationshipPlan, plan_relationships, validate_relationships, ambiguous_nodes, ambiguous_pair_keys
+)
 
-openai_client = OpenAI()
 
+# Bump when the prompt or the validation of its answer changes, to invalidate cached responses.
+RELATIONSHIPS_PROMPT_VERSION = "2"
 
-def determine_relationships(nodos, existing_nodes) -> KnowledgeRelationshipsCollection:
-    """
-    Evaluates relationships between new and existing nodes, ensuring they match POSSIBLE_RELATIONSHIPS.
-    """
-    prompt = f"""
+
+def build_relationships_prompt(nodos, existing_nodes, candidate_pairs=None) -> str:
+    # Only the candidates selected by retrieval.py are expected here; embeddings never go into the prompt.
+    existing_nodes = [without_embeddings(existing_node) for existing_node in existing_nodes]
+    pairs_section = ""
+    if candidate_pairs:
+        pairs = "\n".join(f"    - {origen} -[{tipo}]-> {destino}" for origen, destino, tipo in candidate_pairs)
+        pairs_section = f"""
+    **Pares a Evaluar (solo puedes devolver relaciones de esta lista):**
+{pairs}
+"""
+    return f"""
     Eres un analista experto en grafos de conocimiento. Tienes una lista de nodos nuevos y existentes,
     y tu tarea es determinar las relaciones entre ellos basándote en las reglas definidas.
 
@@ -20,7 +34,7 @@ def determine_relationships(nodos, existing_nodes) -> KnowledgeRelationshipsColl
 
     **Reglas de Relación (POSSIBLE_RELATIONSHIPS):**
     {POSSIBLE_RELATIONSHIPS}
-
+{pairs_section}
     **Criterios Importantes:**
     - **No crees relaciones entre nodos que no tienen conexión lógica real en los datos.**
     - **Verifica que las queries y bases de datos realmente se refieran entre sí antes de crear una relación.**
@@ -40,12 +54,120 @@ def determine_relationships(nodos, existing_nodes) -> KnowledgeRelationshipsColl
     ```
     """
 
-    response: ParsedChatCompletion[KnowledgeRelationshipsCollection] = openai_client.beta.chat.completions.parse(
-        model="gpt-4o",
-        response_format=KnowledgeRelationshipsCollection,
-        messages=[{"role": "system", "content": prompt}]
+def plan_for(nodos, existing_nodes, include_new_pairs: bool = True) -> RelationshipPlan:
+    plan = plan_relationships(getattr(nodos, "nodos", nodos), existing_nodes, include_new_pairs)
+    print(
+        f"[Relaciones] {len(plan.resolved)} resueltas por reglas, {plan.rejected} descartadas, "
+        f"{len(plan.ambiguous)} pares ambiguos para el LLM."
+    )
+    return plan
+
+def new_node_aliases(plan: RelationshipPlan, prompt: str) -> Dict[str, str]:
+    """
+    Placeholders (n0, n1, ...) for the ids of the new nodes in the prompt and the API ids their endpoints point to,
+    numbered by first appearance. New nodes get a fresh uuid4 on every run, so without them the prompt (and its
+    cache key) would never repeat.
+    """
+    ids = set()
+    for origin, destination, _ in plan.ambiguous:
+        for view in (origin, destination):
+            if view.new:
+                ids.add(view.id)
+                if view.data.get("api_id"):
+                    ids.add(view.data["api_id"])
+    positions = sorted((prompt.find(node_id), node_id) for node_id in ids if node_id in prompt)
+    return {node_id: f"n{index}" for index, (_, node_id) in enumerate(positions)}
+
+def ambiguous_relationships_prompt(plan: RelationshipPlan) -> Tuple[str, Dict[str, str]]:
+    """
+    Returns the prompt for the ambiguous pairs, with the new ids replaced by placeholders, and the placeholders
+    by id.
+    """
+    new_nodes, existing_nodes = ambiguous_nodes(plan)
+    # Pairs in plan order: sorting them by id would shuffle them with the fresh ids of every run.
+    pairs = list(dict.fromkeys((origin.id, destination.id, tipo) for origin, destination, tipo in plan.ambiguous))
+    prompt = build_relationships_prompt(new_nodes, existing_nodes, pairs)
+    aliases = new_node_aliases(plan, prompt)
+    for node_id, alias in aliases.items():
+        prompt = prompt.replace(node_id, alias)
+    return prompt, aliases
+
+def resolve_aliases(relationships, aliases: Dict[str, str]) -> list:
+    ids = {alias: node_id for node_id, alias in aliases.items()}
+    return [
+        KnowledgeRelationship(
+            origen=ids.get(relationship.origen, relationship.origen),
+            destino=ids.get(relationship.destino, relationship.destino),
+            tipo=relationship.tipo
+        )
+        for relationship in relationships
+    ]
+
+def accepted_relationships(plan: RelationshipPlan, nodos, existing_nodes, suggested_relationships):
+    suggested_relationships = validate_relationships(
+        suggested_relationships, getattr(nodos, "nodos", nodos), existing_nodes, ambiguous_pair_keys(plan)
     )
+    return KnowledgeRelationshipsCollection(relaciones=plan.resolved + suggested_relationships)
+
+def determine_relationships(nodos, existing_nodes, include_new_pairs: bool = True) -> KnowledgeRelationshipsCollection:
+    """
+    Evaluates relationships between new and existing nodes, ensuring they match POSSIBLE_RELATIONSHIPS.
+    Type-compatible pairs are resolved by the rules in relationship_rules.py; the LLM is only asked about
+    the ambiguous ones, and its answer is validated against the same rules.
+    With `include_new_pairs=False` only relationships between a new and an existing node are evaluated.
+    """
+    plan = plan_for(nodos, existing_nodes, include_new_pairs)
+    if not plan.ambiguous:
+        return KnowledgeRelationshipsCollection(relaciones=plan.resolved)
+
+    prompt, aliases = ambiguous_relationships_prompt(plan)
+    messages = [{"role": "system", "content": prompt}]
+
+    def call() -> KnowledgeRelationshipsCollection:
+        response: ParsedChatCompletion[KnowledgeRelationshipsCollection] = scheduler.submit(
+            "relationships", "gpt-4o",
+            lambda: get_openai_client().beta.chat.completions.parse(
+                model="gpt-4o",
+                response_format=KnowledgeRelationshipsCollection,
+                messages=messages
+            ),
+            estimate_chat_tokens(messages)
+        )
+        return response.choices[0].message.parsed
+
+    # The cached answer refers to the placeholders, so it is mapped back to this run's ids after the lookup.
+    suggested_relationships = resolve_aliases(cached_parse(
+        "relationships", "gpt-4o", RELATIONSHIPS_PROMPT_VERSION, messages, KnowledgeRelationshipsCollection, call
+    ).relaciones, aliases)
+
+    return accepted_relationships(plan, nodos, existing_nodes, suggested_relationships)
+
+async def determine_relationships_async(nodos, existing_nodes,
+                                        include_new_pairs: bool = True) -> KnowledgeRelationshipsCollection:
+    """
+    Async version of `determine_relationships`.
+    """
+    plan = plan_for(nodos, existing_nodes, include_new_pairs)
+    if not plan.ambiguous:
+        return KnowledgeRelationshipsCollection(relaciones=plan.resolved)
+
+    prompt, aliases = ambiguous_relationships_prompt(plan)
+    messages = [{"role": "system", "content": prompt}]
+
+    async def call() -> KnowledgeRelationshipsCollection:
+        response: ParsedChatCompletion[KnowledgeRelationshipsCollection] = await scheduler.submit_async(
+            "relationships", "gpt-4o",
+            lambda: get_async_openai_client().beta.chat.completions.parse(
+                model="gpt-4o",
+                response_format=KnowledgeRelationshipsCollection,
+                messages=messages
+            ),
+            estimate_chat_tokens(messages)
+        )
+        return response.choices[0].message.parsed
 
-    suggested_relationships = response.choices[0].message.parsed.relaciones
+    suggested_relationships = resolve_aliases((await cached_parse_async(
+        "relationships", "gpt-4o", RELATIONSHIPS_PROMPT_VERSION, messages, KnowledgeRelationshipsCollection, call
+    )).relaciones, aliases)
 
-    return KnowledgeRelationshipsCollection(relaciones=suggested_relationships)
\ No newline at end of file
+    return accepted_relationships(plan, nodos, existing_nodes, suggested_relationships)
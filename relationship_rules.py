@@ -0,0 +1,263 @@
+"""
+Rule-based relationship pre-pass driven by POSSIBLE_RELATIONSHIPS.
+
+Only type-compatible pairs are enumerated. Each rule has a resolver that decides a pair from the node data
+(an endpoint under an API's base_url, a table named in a query's SQL, ...) and returns True (link),
+False (no link) or None (ambiguous). Only the ambiguous pairs are left to the LLM, and its answer is checked
+against the same rule table.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from relations import POSSIBLE_RELATIONSHIPS, KnowledgeRelationship
+from static_extract import SQL_TABLES
+
+# (origin class, destination class) -> relationship type
+RELATIONSHIP_RULES: Dict[Tuple[str, str], str] = {
+    (rule["origen"], rule["destino"]): rule["tipo"] for rule in POSSIBLE_RELATIONSHIPS
+}
+RELATIONSHIP_TYPES = frozenset(RELATIONSHIP_RULES.values())
+
+LABEL_TO_CLASS = {
+    "API": "APINode",
+    "Endpoint": "EndpointNode",
+    "Database": "DatabaseNode",
+    "Query": "QueryNode",
+    "Table": "TableNode",
+    "KPI": "KPINode",
+    "Statistic": "StatisticNode",
+    "Visualization": "VisualizationNode",
+}
+
+# Endpoint paths that run queries or return database records.
+DATA_ENDPOINT_PATH = re.compile(r"quer|sql|/db\b|database|records|tables|rows", re.IGNORECASE)
+QUERY_ENDPOINT_PATH = re.compile(r"quer|sql", re.IGNORECASE)
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+@dataclass
+class GraphNodeView:
+    id: str
+    node_class: str
+    data: dict
+    new: bool
+
+
+@dataclass
+class RelationshipPlan:
+    resolved: List[KnowledgeRelationship] = field(default_factory=list)
+    rejected: int = 0
+    ambiguous: List[Tuple[GraphNodeView, GraphNodeView, str]] = field(default_factory=list)
+
+
+def node_views(nodos, existing_nodes) -> List[GraphNodeView]:
+    views = [GraphNodeView(nodo.id, nodo.__class__.__name__, nodo.model_dump(), True) for nodo in nodos]
+    new_ids = {view.id for view in views}
+    for existing_node in existing_nodes or []:
+        node_class = LABEL_TO_CLASS.get(existing_node.get("tipo"))
+        if node_class and existing_node["id"] not in new_ids:
+            views.append(GraphNodeView(existing_node["id"], node_class, existing_node, False))
+    return views
+
+
+def words(text) -> set:
+    if isinstance(text, list):
+        text = " ".join(str(item) for item in text)
+    return {word.lower() for word in WORD.findall(text or "")}
+
+
+def sql_table_names(sql: str) -> set:
+    return {name.split(".")[-1].lower() for name in SQL_TABLES.findall(sql or "")}
+
+
+def url_host(url: str) -> Optional[str]:
+    if not url or "://" not in url:
+        return None
+    return urlsplit(url).netloc.lower() or None
+
+
+def api_exposes_endpoint(api: GraphNodeView, endpoint: GraphNodeView, views) -> Optional[bool]:
+    api_id = endpoint.data.get("api_id")
+    if api_id == api.id:
+        return True
+    if api_id and any(view.id == api_id for view in views if view.node_class == "APINode"):
+        return False
+
+    path = endpoint.data.get("path") or ""
+    base_url = (api.data.get("base_url") or "").rstrip("/")
+    if url_host(path):
+        return bool(base_url) and path.lower().startswith(base_url.lower())
+
+    if api.new and endpoint.new:
+        new_apis = [view for view in views if view.new and view.node_class == "APINode"]
+        if len(new_apis) == 1:
+            return True
+        return None
+    return False
+
+
+def endpoint_queries_database(endpoint: GraphNodeView, database: GraphNodeView, views) -> Optional[bool]:
+    path = endpoint.data.get("path") or ""
+    if path and path in f"{database.data.get('query_pattern') or ''} {database.data.get('description') or ''}":
+        return True
+    if not (endpoint.new and database.new):
+        return False
+    if not DATA_ENDPOINT_PATH.search(path):
+        return False
+
+    new_databases = [view for view in views if view.new and view.node_class == "DatabaseNode"]
+    return True if len(new_databases) == 1 else None
+
+
+def query_calls_endpoint(query: GraphNodeView, endpoint: GraphNodeView, views) -> Optional[bool]:
+    """
+    A query is sent to the artifact's query endpoint (/query, /sql) or, if there is none, to its only data endpoint.
+    """
+    if not (query.new and endpoint.new):
+        return False
+
+    new_endpoints = [view for view in views if view.new and view.node_class == "EndpointNode"]
+    for pattern in (QUERY_ENDPOINT_PATH, DATA_ENDPOINT_PATH):
+        matching = [view for view in new_endpoints if pattern.search(view.data.get("path") or "")]
+        if matching:
+            if endpoint not in matching:
+                return False
+            return True if len(matching) == 1 else None
+    return False
+
+
+def database_tables(database: GraphNodeView) -> set:
+    return sql_table_names(database.data.get("query_pattern")) | words(database.data.get("description"))
+
+
+def query_reads_from_database(query: GraphNodeView, database: GraphNodeView, views) -> Optional[bool]:
+    if sql_table_names(query.data.get("sql_query")) & database_tables(database):
+        return True
+    if not (query.new and database.new):
+        return False
+
+    new_databases = [view for view in views if view.new and view.node_class == "DatabaseNode"]
+    return True if len(new_databases) == 1 else None
+
+
+def database_stores_table(database: GraphNodeView, table: GraphNodeView, views) -> Optional[bool]:
+    if (table.data.get("nombre_tabla") or "").lower() in database_tables(database):
+        return True
+    if not (database.new and table.new):
+        return False
+
+    new_databases = [view for view in views if view.new and view.node_class == "DatabaseNode"]
+    return True if len(new_databases) == 1 else None
+
+
+def table_used_by_query(table: GraphNodeView, query: GraphNodeView, views) -> Optional[bool]:
+    sql = query.data.get("sql_query")
+    if sql:
+        return (table.data.get("nombre_tabla") or "").lower() in sql_table_names(sql)
+    return None if table.new and query.new else False
+
+
+def table_columns_match(table: GraphNodeView, other: GraphNodeView, fields) -> Optional[bool]:
+    columns = {column.lower() for column in table.data.get("columnas") or []}
+    if columns & set().union(*(words(other.data.get(name)) for name in fields)):
+        return True
+    return None if table.new and other.new else False
+
+
+def table_used_by_visualization(table: GraphNodeView, visualization: GraphNodeView, views) -> Optional[bool]:
+    return table_columns_match(table, visualization, ("eje_x", "eje_y"))
+
+
+def table_contains_data_for_kpi(table: GraphNodeView, kpi: GraphNodeView, views) -> Optional[bool]:
+    return table_columns_match(table, kpi, ("nombre", "descripcion"))
+
+
+def semantic_only(origin: GraphNodeView, destination: GraphNodeView, views) -> Optional[bool]:
+    """
+    Pairs that can only be decided by meaning (KPIs, statistics, visualizations) go to the LLM when both are new.
+    """
+    return None if origin.new and destination.new else False
+
+
+RESOLVERS = {
+    ("APINode", "EndpointNode"): api_exposes_endpoint,
+    ("EndpointNode", "DatabaseNode"): endpoint_queries_database,
+    ("QueryNode", "EndpointNode"): query_calls_endpoint,
+    ("QueryNode", "DatabaseNode"): query_reads_from_database,
+    ("DatabaseNode", "TableNode"): database_stores_table,
+    ("TableNode", "QueryNode"): table_used_by_query,
+    ("TableNode", "VisualizationNode"): table_used_by_visualization,
+    ("TableNode", "KPINode"): table_contains_data_for_kpi,
+}
+
+
+def plan_relationships(nodos, existing_nodes=None, include_new_pairs: bool = True) -> RelationshipPlan:
+    """
+    Enumerates the type-compatible pairs with at least one new node and resolves them with the rule resolvers.
+    With `include_new_pairs=False` only pairs between a new and an existing node are planned.
+    """
+    views = node_views(nodos, existing_nodes)
+    by_class = {}
+    for view in views:
+        by_class.setdefault(view.node_class, []).append(view)
+
+    plan = RelationshipPlan()
+    for (origin_class, destination_class), tipo in RELATIONSHIP_RULES.items():
+        resolver = RESOLVERS.get((origin_class, destination_class), semantic_only)
+        for origin in by_class.get(origin_class, []):
+            for destination in by_class.get(destination_class, []):
+                if not (origin.new or destination.new) or origin.id == destination.id:
+                    continue
+                if not include_new_pairs and origin.new and destination.new:
+                    continue
+
+                decision = resolver(origin, destination, views)
+                if decision is None:
+                    plan.ambiguous.append((origin, destination, tipo))
+                elif decision:
+                    plan.resolved.append(KnowledgeRelationship(origen=origin.id, destino=destination.id, tipo=tipo))
+                else:
+                    plan.rejected += 1
+    return plan
+
+
+def validate_relationships(relaciones, nodos, existing_nodes=None, allowed_pairs=None) -> List[KnowledgeRelationship]:
+    """
+    Drops relationships whose endpoints are unknown, whose type is not the one POSSIBLE_RELATIONSHIPS defines
+    for their labels or, when `allowed_pairs` is given, that were not among the pairs asked about.
+    """
+    node_classes = {view.id: view.node_class for view in node_views(nodos, existing_nodes)}
+    valid = []
+    seen = set()
+    for relacion in relaciones:
+        origin_class = node_classes.get(relacion.origen)
+        destination_class = node_classes.get(relacion.destino)
+        key = (relacion.origen, relacion.destino, relacion.tipo)
+        if RELATIONSHIP_RULES.get((origin_class, destination_class)) != relacion.tipo:
+            print(f"[Warning] Relación descartada por no cumplir POSSIBLE_RELATIONSHIPS: {relacion}")
+            continue
+        if allowed_pairs is not None and key not in allowed_pairs:
+            print(f"[Warning] Relación descartada por no estar entre los pares consultados: {relacion}")
+            continue
+        if key not in seen:
+            seen.add(key)
+            valid.append(relacion)
+    return valid
+
+
+def ambiguous_pair_keys(plan: RelationshipPlan) -> set:
+    return {(origin.id, destination.id, tipo) for origin, destination, tipo in plan.ambiguous}
+
+
+def ambiguous_nodes(plan: RelationshipPlan) -> Tuple[list, list]:
+    """
+    Returns the data of the new and the existing nodes that take part in an ambiguous pair.
+    """
+    involved = {}
+    for origin, destination, _ in plan.ambiguous:
+        involved[origin.id] = origin
+        involved[destination.id] = destination
+    new_nodes = [{"tipo_nodo": view.node_class, **view.data} for view in involved.values() if view.new]
+    existing_nodes = [view.data for view in involved.values() if not view.new]
+    return new_nodes, existing_nodes
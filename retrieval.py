@@ -0,0 +1,228 @@
+"""
+Selects the existing graph nodes that are worth showing to the relationship step.
+
+Instead of passing every node in the graph to `determine_relationships`, each new node queries the vector index
+of the labels it can be related to (per POSSIBLE_RELATIONSHIPS) and only its top-k most similar nodes are kept,
+so the prompt size depends on the artifact and not on the size of the graph.
+"""
+import os
+import math
+import heapq
+import asyncio
+from array import array
+from collections import defaultdict
+from typing import Optional
+from dotenv import load_dotenv
+from relations import POSSIBLE_RELATIONSHIPS
+from insertion import (
+    NODE_TYPE_MAPPING, VECTOR_INDEX_PROPERTIES, vector_index_name, get_existing_nodes, get_graph_store
+)
+
+load_dotenv()
+
+# "index" asks the graph store (the vector indexes of the graph, see graph_store.py); "local" searches an
+# in-process index built from the graph.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "index").lower()
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.0"))
+
+def without_embeddings(node_data: dict) -> dict:
+    return {key: value for key, value in node_data.items() if not key.endswith("_embedding")}
+
+
+def related_labels(label: str) -> set:
+    """
+    Returns the labels a node with `label` can be connected to, in either direction.
+    """
+    labels = set()
+    for rule in POSSIBLE_RELATIONSHIPS:
+        origen = NODE_TYPE_MAPPING.get(rule["origen"])
+        destino = NODE_TYPE_MAPPING.get(rule["destino"])
+        if origen == label and destino:
+            labels.add(destino)
+        if destino == label and origen:
+            labels.add(origen)
+    return labels & set(VECTOR_INDEX_PROPERTIES)
+
+
+def retrieval_vector(nodo):
+    """
+    Returns the (label, vector) used to search for neighbours of a new node, or None if it has no vector.
+    """
+    label = NODE_TYPE_MAPPING.get(nodo.__class__.__name__)
+    prop = VECTOR_INDEX_PROPERTIES.get(label)
+    if prop is None:
+        return None
+
+    vector = getattr(nodo, f"_{prop}", None)
+    return (label, vector) if vector else None
+
+
+def build_search_requests(nodos) -> dict:
+    """
+    Groups the vectors of the new nodes by the label whose index they must be searched in.
+    """
+    requests = defaultdict(list)
+    for nodo in nodos:
+        search = retrieval_vector(nodo)
+        if search is None:
+            continue
+
+        label, vector = search
+        for target_label in related_labels(label):
+            requests[target_label].append({"source": nodo.id, "vector": list(vector)})
+    return requests
+
+
+def select_candidates(matches, new_ids, top_k: int = RETRIEVAL_TOP_K, min_score: float = RETRIEVAL_MIN_SCORE) -> list:
+    """
+    Keeps the `top_k` best matches of every new node and returns them once each, in the format of
+    `get_existing_nodes` (without embedding properties).
+    """
+    by_source = defaultdict(list)
+    for match in matches:
+        if match["id"] in new_ids or match["score"] < min_score:
+            continue
+        by_source[match["source"]].append(match)
+
+    candidates = {}
+    for source_matches in by_source.values():
+        for match in heapq.nlargest(top_k, source_matches, key=lambda m: m["score"]):
+            tipo = match["tipo"][0] if isinstance(match["tipo"], list) else match["tipo"]
+            candidates[match["id"]] = {"id": match["id"], "tipo": tipo, **without_embeddings(match["properties"])}
+    return list(candidates.values())
+
+
+class LocalVectorIndex:
+    """
+    Exact cosine search over the embeddings of the graph nodes, kept in memory per label.
+    Used when the graph has no vector index support.
+    """
+
+    def __init__(self):
+        self._entries = defaultdict(dict)
+
+    @staticmethod
+    def _normalize(vector):
+        norm = math.sqrt(sum(value * value for value in vector))
+        return array("f", (value / norm for value in vector)) if norm else None
+
+    def add(self, label: str, node_id: str, vector, properties: dict):
+        normalized = self._normalize(vector)
+        if normalized is not None:
+            self._entries[label][node_id] = (normalized, without_embeddings(properties))
+
+    def add_existing_nodes(self, existing_nodes):
+        """
+        Indexes nodes as returned by `get_existing_nodes`.
+        """
+        for node_data in existing_nodes:
+            prop = VECTOR_INDEX_PROPERTIES.get(node_data.get("tipo"))
+            if prop and node_data.get(prop):
+                self.add(node_data["tipo"], node_data["id"], node_data[prop], node_data)
+
+    def add_nodes(self, nodos):
+        for nodo in nodos:
+            search = retrieval_vector(nodo)
+            if search is not None:
+                label, vector = search
+                self.add(label, nodo.id, vector, nodo.model_dump())
+
+    def search(self, label: str, vector, k: int) -> list:
+        query = self._normalize(vector)
+        if query is None:
+            return []
+
+        scored = (
+            (sum(a * b for a, b in zip(query, entry_vector)), node_id, properties)
+            for node_id, (entry_vector, properties) in self._entries[label].items()
+        )
+        return heapq.nlargest(k, scored, key=lambda item: item[0])
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+
+_local_index: Optional[LocalVectorIndex] = None
+
+
+def get_local_index() -> LocalVectorIndex:
+    """
+    Builds the local index from the graph the first time it is used; later writes are added with `index_new_nodes`.
+    """
+    global _local_index
+    if _local_index is None:
+        _local_index = LocalVectorIndex()
+        _local_index.add_existing_nodes(get_existing_nodes())
+        print(f"[Retrieval] Índice local construido con {len(_local_index)} nodos.")
+    return _local_index
+
+
+def index_new_nodes(nodos):
+    """
+    Adds freshly written nodes to the local index, if it was built.
+    """
+    if _local_index is not None:
+        _local_index.add_nodes(nodos)
+
+
+def search_local(requests: dict, k: int) -> list:
+    index = get_local_index()
+    matches = []
+    for label, rows in requests.items():
+        for row in rows:
+            for score, node_id, properties in index.search(label, row["vector"], k):
+                matches.append({"source": row["source"], "id": node_id, "tipo": label,
+                                "properties": properties, "score": score})
+    return matches
+
+
+def search_similar(requests: dict, k: int) -> list:
+    """
+    Runs the vector searches of `requests` (label -> rows of source id and vector) and returns every match.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        return search_local(requests, k)
+
+    matches = []
+    store = get_graph_store()
+    for label, rows in requests.items():
+        try:
+            matches.extend(store.similar_nodes(label, rows, k))
+        except Exception as e:
+            print(f"[Warning] Búsqueda vectorial en {vector_index_name(label)} falló: {e}")
+    return matches
+
+
+async def search_similar_async(requests: dict, k: int) -> list:
+    if RETRIEVAL_BACKEND == "local":
+        return await asyncio.to_thread(search_local, requests, k)
+
+    matches = []
+    store = get_graph_store()
+    for label, rows in requests.items():
+        try:
+            matches.extend(await store.similar_nodes_async(label, rows, k))
+        except Exception as e:
+            print(f"[Warning] Búsqueda vectorial en {vector_index_name(label)} falló: {e}")
+    return matches
+
+
+def retrieve_candidate_nodes(nodos, top_k: int = RETRIEVAL_TOP_K) -> list:
+    """
+    Returns the existing nodes most similar to the new ones, at most `top_k` per new node.
+    """
+    matches = search_similar(build_search_requests(nodos), top_k)
+    candidates = select_candidates(matches, {nodo.id for nodo in nodos}, top_k)
+    print(f"[Retrieval] {len(candidates)} nodos existentes candidatos para {len(nodos)} nodos nuevos.")
+    return candidates
+
+
+async def retrieve_candidate_nodes_async(nodos, top_k: int = RETRIEVAL_TOP_K) -> list:
+    """
+    Async version of `retrieve_candidate_nodes`.
+    """
+    matches = await search_similar_async(build_search_requests(nodos), top_k)
+    candidates = select_candidates(matches, {nodo.id for nodo in nodos}, top_k)
+    print(f"[Retrieval] {len(candidates)} nodos existentes candidatos para {len(nodos)} nodos nuevos.")
+    return candidates
@@ -0,0 +1,293 @@
+"""
+Incremental processing of artifact revisions.
+
+A revision is new code for an artifact already in the graph, usually a few edited lines of the same dashboard.
+Both versions are split into blocks (a statement, or the header line of a block longer than
+REVISION_MAX_BLOCK_LINES) and diffed block by block; only the changed blocks, plus the unchanged declarations they
+reference, are extracted again. A previous node is dropped from the revision when its identifying literal (base
+URL, endpoint path, table name, SQL) was in a removed block and is no longer in the code; the other previous nodes
+are linked to the revision as they are, without re-embedding them, and re-extracted nodes with the label and
+canonical key of a previous node reuse it. Endpoints are dropped with their API, since the same path under another
+base URL is another endpoint. Nodes without a literal in the code (KPIs, statistics...) are kept.
+"""
+import os
+import re
+import difflib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from fingerprint import compute_entity_key
+from insertion import NODE_TYPE_MAPPING, ARTIFACT_STATUS_COMPLETE
+
+load_dotenv()
+
+REVISION_MAX_BLOCK_LINES = int(os.getenv("REVISION_MAX_BLOCK_LINES", "40"))
+# Above this share of changed lines the revision is extracted in full (still linked to the previous artifact).
+REVISION_MAX_CHANGED_RATIO = float(os.getenv("REVISION_MAX_CHANGED_RATIO", "0.6"))
+
+OPENING_BRACKETS = "([{"
+CLOSING_BRACKETS = ")]}"
+
+DECLARATION = re.compile(r"^\s*(?:export\s+)?(?:const|let|var)?\s*([A-Za-z_$][\w$]*)\s*(?::[^=]*)?=(?![=>])")
+IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+PATH_PLACEHOLDER = re.compile(r"\$?\{[^}]*\}|:\w+")
+
+
+class CodeBlock(NamedTuple):
+    start: int
+    end: int
+    text: str
+
+    @property
+    def key(self) -> str:
+        # Re-indenting or re-wrapping a block does not change it.
+        return " ".join(self.text.split())
+
+    @property
+    def lines(self) -> int:
+        return self.end - self.start + 1
+
+
+def bracket_depths(lines: List[str]) -> List[int]:
+    """
+    Bracket depth after each line, ignoring brackets inside strings and comments.
+    """
+    depths = []
+    depth = 0
+    quote = None
+    block_comment = False
+    for line in lines:
+        index = 0
+        while index < len(line):
+            char = line[index]
+            if block_comment:
+                if line.startswith("*/", index):
+                    block_comment = False
+                    index += 1
+            elif quote:
+                if char == "\\":
+                    index += 1
+                elif char == quote:
+                    quote = None
+            elif line.startswith("//", index) or (char == "#" and (index == 0 or line[index - 1].isspace())):
+                break
+            elif line.startswith("/*", index):
+                block_comment = True
+                index += 1
+            elif char in "'\"`":
+                quote = char
+            elif char in OPENING_BRACKETS:
+                depth += 1
+            elif char in CLOSING_BRACKETS:
+                depth = max(depth - 1, 0)
+            index += 1
+        # Only template literals span lines; an unclosed quote is JSX text such as "don't".
+        if quote != "`":
+            quote = None
+        depths.append(depth)
+    return depths
+
+
+def split_blocks(code: str, max_lines: int = REVISION_MAX_BLOCK_LINES) -> List[CodeBlock]:
+    """
+    Splits code into blocks: from a line to the line that closes the brackets it opens. A block longer than
+    `max_lines` (a component, a long function) is split instead: its first line is a block and the statements
+    inside it are split in turn.
+    """
+    lines = code.splitlines()
+    depths = bracket_depths(lines)
+    blocks = []
+    start = 0
+    while start < len(lines):
+        if not lines[start].strip():
+            start += 1
+            continue
+        opening_depth = depths[start - 1] if start else 0
+        end = start
+        while end < len(lines) - 1 and depths[end] > opening_depth:
+            end += 1
+        if end - start >= max_lines:
+            end = start
+        blocks.append(CodeBlock(start, end, "\n".join(lines[start:end + 1])))
+        start = end + 1
+    return blocks
+
+
+@dataclass
+class CodeDiff:
+    old_blocks: List[CodeBlock]
+    new_blocks: List[CodeBlock]
+    removed: List[CodeBlock] = field(default_factory=list)
+    added: List[CodeBlock] = field(default_factory=list)
+
+    @property
+    def changed_lines(self) -> int:
+        return sum(block.lines for block in self.removed + self.added)
+
+    @property
+    def changed_ratio(self) -> float:
+        total = sum(block.lines for block in self.old_blocks + self.new_blocks)
+        return self.changed_lines / total if total else 0.0
+
+
+def diff_code(old_code: str, new_code: str) -> CodeDiff:
+    diff = CodeDiff(split_blocks(old_code), split_blocks(new_code))
+    matcher = difflib.SequenceMatcher(
+        None, [block.key for block in diff.old_blocks], [block.key for block in diff.new_blocks], autojunk=False
+    )
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag != "equal":
+            diff.removed.extend(diff.old_blocks[old_start:old_end])
+            diff.added.extend(diff.new_blocks[new_start:new_end])
+    return diff
+
+
+def declared_name(block: CodeBlock) -> Optional[str]:
+    match = DECLARATION.match(block.text)
+    return match.group(1) if match else None
+
+
+def changed_region(diff: CodeDiff) -> str:
+    """
+    Returns the code to extract again: the added blocks and, so URLs and queries built from constants resolve,
+    the unchanged declarations they use (transitively), in their order in the new code.
+    """
+    selected = set(diff.added)
+    used = set(IDENTIFIER.findall("\n".join(block.text for block in diff.added)))
+    declarations = {block: declared_name(block) for block in diff.new_blocks if block not in selected}
+    while True:
+        context = [block for block, name in declarations.items() if name in used and block not in selected]
+        if not context:
+            break
+        selected.update(context)
+        for block in context:
+            used.update(IDENTIFIER.findall(block.text))
+    return "\n".join(block.text for block in diff.new_blocks if block in selected)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def node_evidence(node_data: dict) -> Optional[str]:
+    """
+    Literal that identifies a previous node in the code, normalized; None for nodes without one.
+    """
+    tipo = node_data.get("tipo")
+    if tipo == "API":
+        value = (node_data.get("base_url") or "").rstrip("/")
+    elif tipo == "Endpoint":
+        value = max(PATH_PLACEHOLDER.split(node_data.get("path") or ""), key=len)
+    elif tipo == "Table":
+        value = node_data.get("nombre_tabla") or ""
+    elif tipo == "Query":
+        value = node_data.get("sql_query") or ""
+    elif tipo == "Database":
+        value = node_data.get("query_pattern") or ""
+    else:
+        value = ""
+    value = normalize_text(value)
+    return value if len(value.strip("/")) >= 3 else None
+
+
+# SQL evidence must be the whole statement: the previous query is not in `... FROM orders WHERE x` just because its
+# SQL was `... FROM orders`.
+STATEMENT_LABELS = {"Query", "Database"}
+STATEMENT_END = r"\s*;?\s*(?:[\"'`)]|$)"
+
+
+def contains(text: str, value: str, statement: bool = False) -> bool:
+    end = STATEMENT_END if statement else r"(?!\w)"
+    return re.search(rf"(?<!\w){re.escape(value)}{end}", text) is not None
+
+
+@dataclass
+class RevisionPlan:
+    """
+    What a revision extracts again (`region_code`) and which previous nodes it keeps. `full` revisions extract the
+    whole code; their re-extracted nodes still reuse the previous ones by key.
+    """
+    previous_id: str
+    diff: CodeDiff
+    region_code: str
+    full: bool
+    previous_nodes: List[dict]
+    # Previous nodes linked to the revision, by id.
+    linked: Dict[str, dict]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def removed(self) -> List[dict]:
+        with self.lock:
+            return [node_data for node_data in self.previous_nodes if node_data["id"] not in self.linked]
+
+    def linked_nodes(self) -> List[dict]:
+        with self.lock:
+            return list(self.linked.values())
+
+    def reuse(self, nodos) -> list:
+        """
+        Returns the nodes that are new to the artifact. A node with the label and canonical key of a previous node
+        is replaced by it; endpoints of a replaced API are moved to the previous API first, so their keys match.
+        """
+        by_key: Dict[Tuple[str, str], dict] = {
+            (node_data["tipo"], node_data["canonical_key"]): node_data
+            for node_data in self.previous_nodes if node_data.get("canonical_key")
+        }
+        api_ids = {}
+        new_nodes = []
+        for nodo in sorted(nodos, key=lambda nodo: nodo.__class__.__name__ != "APINode"):
+            label = NODE_TYPE_MAPPING.get(nodo.__class__.__name__)
+            if label == "Endpoint" and nodo.api_id in api_ids:
+                nodo.api_id = api_ids[nodo.api_id]
+            key = compute_entity_key(nodo)
+            previous = by_key.get((label, key)) if key else None
+            if previous is None:
+                new_nodes.append(nodo)
+                continue
+            if label == "API":
+                api_ids[nodo.id] = previous["id"]
+            with self.lock:
+                self.linked[previous["id"]] = previous
+
+        if len(new_nodes) < len(nodos):
+            print(f"[Revisión] {len(nodos) - len(new_nodes)} nodos reutilizados de la versión anterior.")
+        return new_nodes
+
+
+def plan_revision(previous: dict, code: str) -> RevisionPlan:
+    """
+    Diffs the code of the previous artifact (as returned by `find_artifact_graph`) with its revision.
+    """
+    diff = diff_code(previous.get("code") or "", code)
+    previous_nodes = previous["nodes"]
+    # Nodes of an artifact that did not complete may be missing, so its revision is extracted in full.
+    complete = previous.get("status") in (None, ARTIFACT_STATUS_COMPLETE)
+    full = not complete or diff.changed_ratio > REVISION_MAX_CHANGED_RATIO
+
+    if full:
+        region_code, linked = code, {}
+    else:
+        region_code = changed_region(diff)
+        removed_text = normalize_text("\n".join(block.text for block in diff.removed))
+        new_text = normalize_text(code)
+        dropped = set()
+        for node_data in previous_nodes:
+            evidence = node_evidence(node_data)
+            statement = node_data.get("tipo") in STATEMENT_LABELS
+            if evidence and contains(removed_text, evidence, statement) and not contains(new_text, evidence, statement):
+                dropped.add(node_data["id"])
+        # The same path under another base URL is another endpoint, so endpoints go with their API.
+        for node_data in previous_nodes:
+            if node_data.get("tipo") == "Endpoint" and node_data.get("api_id") in dropped:
+                dropped.add(node_data["id"])
+        linked = {node_data["id"]: node_data for node_data in previous_nodes if node_data["id"] not in dropped}
+
+    print(
+        f"[Revisión] {diff.changed_lines} líneas cambiadas ({diff.changed_ratio:.1%}); "
+        + ("se extrae el artifact completo." if full else
+           f"se extraen {len(region_code.splitlines())} líneas, {len(previous_nodes) - len(linked)} de "
+           f"{len(previous_nodes)} nodos previos descartados.")
+    )
+    return RevisionPlan(previous["id"], diff, region_code, full, previous_nodes, linked)
@@ -0,0 +1,410 @@
+"""
+Deterministic pre-extraction of APIs, endpoints, SQL queries, tables and databases from artifact code.
+
+It finds what a parser can resolve exactly (URL constants, `fetch`/`axios`/`requests` calls and their HTTP
+methods, SQL strings and the tables after FROM/JOIN) and reports the data-access code it could not resolve.
+When nothing is left unresolved the LLM extraction can be skipped.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+from nodes import APINode, EndpointNode, DatabaseNode, QueryNode, TableNode
+from relations import KnowledgeRelationshipsCollection
+
+HTTP_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+SQL_START = re.compile(r"^\s*(SELECT|WITH|INSERT\s+INTO|UPDATE|DELETE\s+FROM)\b", re.IGNORECASE)
+SQL_TABLES = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE)\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+SQL_SELECT_LIST = re.compile(r"^\s*SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM\s", re.IGNORECASE | re.DOTALL)
+SQL_CONDITION_COLUMNS = re.compile(r"\b([A-Za-z_]\w*)\s*(?:=|<>|!=|>=|<=|>|<|\bLIKE\b|\bIN\b)", re.IGNORECASE)
+SQL_GROUP_ORDER = re.compile(r"\b(?:GROUP|ORDER)\s+BY\s+([\w\s,.]+?)(?:\b(?:HAVING|LIMIT|ORDER|ASC|DESC)\b|$)", re.IGNORECASE)
+SQL_KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "null", "true", "false", "as", "on", "in", "is", "like",
+    "group", "order", "by", "limit", "having", "distinct", "asc", "desc", "join", "left", "right", "inner",
+    "outer", "count", "sum", "avg", "min", "max", "case", "when", "then", "else", "end",
+}
+
+CONSTANT_ASSIGNMENT = re.compile(r"(?:\b(?:const|let|var)\s+)?\b([A-Za-z_]\w*)\s*(?::\s*\w+\s*)?=\s*$")
+HTTP_CALL_BEFORE = re.compile(
+    r"(?:\b(fetch|axios|fetchData|request)\s*\(|\b(?:axios|requests|httpx|session|client|http)\.(get|post|put|patch|delete|request)\s*\()\s*[fFrRbBuU]{0,2}$",
+    re.IGNORECASE,
+)
+METHOD_OPTION = re.compile(r"\bmethod\s*[:=]\s*['\"`](\w+)['\"`]", re.IGNORECASE)
+HTTP_CALL_WITH_VARIABLE = re.compile(
+    r"\b(?:fetch|axios(?:\.\w+)?|requests\.\w+|httpx\.\w+)\s*\(\s*([A-Za-z_]\w*)\s*[,)]"
+)
+TEMPLATE_PLACEHOLDER = re.compile(r"\$\{([^}]*)\}|\{([A-Za-z_]\w*)\}")
+
+# Data-access mechanisms the static pass does not understand; finding one leaves the artifact to the LLM.
+UNRESOLVED_MARKERS = {
+    "supabase": re.compile(r"\bsupabase\b|createClient\s*\("),
+    "firebase": re.compile(r"\bfirebase\b|\bfirestore\b|\bgetDocs?\s*\("),
+    "graphql": re.compile(r"\bgql\s*`|\bgraphql\b|useQuery\s*\(", re.IGNORECASE),
+    "orm": re.compile(r"\bprisma\.|\bmongoose\b|\bsequelize\b|\bknex\b|\bsqlalchemy\b|\bcollection\s*\("),
+    "indexeddb": re.compile(r"\bindexedDB\b"),
+    "websocket": re.compile(r"\bnew\s+WebSocket\s*\(|\bio\s*\(\s*['\"`]"),
+    "sql-driver": re.compile(r"\bcursor\.execute\s*\(|\bsql\s*`"),
+}
+
+
+@dataclass
+class StringLiteral:
+    start: int
+    end: int
+    value: str
+    template: bool
+
+
+@dataclass
+class StaticExtraction:
+    apis: List[APINode] = field(default_factory=list)
+    endpoints: List[EndpointNode] = field(default_factory=list)
+    databases: List[DatabaseNode] = field(default_factory=list)
+    queries: List[QueryNode] = field(default_factory=list)
+    tables: List[TableNode] = field(default_factory=list)
+    unresolved: List[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return not self.unresolved
+
+    @property
+    def empty(self) -> bool:
+        return not (self.apis or self.endpoints or self.databases or self.queries or self.tables)
+
+    def to_entities(self):
+        from extract import ExtractedEntities
+
+        return ExtractedEntities(
+            apis=self.apis,
+            endpoints=self.endpoints,
+            databases=self.databases,
+            queries=self.queries,
+            tables=self.tables,
+            relationships=KnowledgeRelationshipsCollection(relaciones=[]),
+        )
+
+
+def is_python(code: str) -> bool:
+    return bool(re.search(r"^\s*(def |import \w+\s*$|from \w[\w.]* import )", code, re.MULTILINE))
+
+
+def iter_string_literals(code: str) -> List[StringLiteral]:
+    """
+    Scans the code for string literals ('...', "...", `...`, and Python triple-quoted strings), skipping comments.
+    """
+    literals = []
+    python = is_python(code)
+    length = len(code)
+    position = 0
+
+    while position < length:
+        char = code[position]
+
+        if char == "/" and code.startswith("//", position) and not python:
+            position = code.find("\n", position)
+            position = length if position == -1 else position
+            continue
+        if char == "/" and code.startswith("/*", position) and not python:
+            position = code.find("*/", position + 2)
+            position = length if position == -1 else position + 2
+            continue
+        if char == "#" and python:
+            position = code.find("\n", position)
+            position = length if position == -1 else position
+            continue
+        if char not in "'\"`":
+            position += 1
+            continue
+
+        quote = code[position:position + 3] if code[position:position + 3] in ("'''", '"""') else char
+        start = position
+        position += len(quote)
+        value = []
+        depth = 0
+        while position < length:
+            if code[position] == "\\":
+                value.append(code[position:position + 2])
+                position += 2
+                continue
+            if quote == "`" and code.startswith("${", position):
+                depth += 1
+            elif quote == "`" and code[position] == "}" and depth:
+                depth -= 1
+            elif depth == 0 and code.startswith(quote, position):
+                break
+            elif len(quote) == 1 and quote != "`" and code[position] == "\n":
+                break
+            value.append(code[position])
+            position += 1
+
+        literals.append(StringLiteral(start, position + len(quote), "".join(value), quote == "`"))
+        position += len(quote)
+
+    return literals
+
+
+def find_url_constants(code: str, literals: List[StringLiteral]) -> Dict[str, str]:
+    """
+    Returns the constants assigned a URL literal, e.g. `const API_BASE_URL = "https://..."`.
+    """
+    constants = {}
+    for literal in literals:
+        if not literal.value.startswith(("http://", "https://")):
+            continue
+        line_start = code.rfind("\n", 0, literal.start) + 1
+        match = CONSTANT_ASSIGNMENT.search(code[line_start:literal.start])
+        if match:
+            constants[match.group(1)] = literal.value.rstrip("/")
+    return constants
+
+
+def resolve_url(value: str, constants: Dict[str, str]) -> Tuple[Optional[str], List[str]]:
+    """
+    Substitutes known constants in a URL template. Other placeholders become `{name}` path parameters.
+    Returns (url, parameters), or (None, []) if the literal is not an absolute URL.
+    """
+    parameters = []
+
+    def substitute(match):
+        expression = (match.group(1) or match.group(2) or "").strip()
+        if expression in constants:
+            return constants[expression]
+        name = re.sub(r"\W+", "_", expression).strip("_") or "param"
+        parameters.append(name)
+        return "{" + name + "}"
+
+    url = TEMPLATE_PLACEHOLDER.sub(substitute, value)
+    if not url.startswith(("http://", "https://")):
+        return None, []
+    return url, parameters
+
+
+def call_arguments_after(code: str, position: int) -> str:
+    """
+    Returns the rest of the call whose argument ends at `position`, up to its closing parenthesis.
+    """
+    depth = 0
+    for index in range(position, min(len(code), position + 2000)):
+        char = code[index]
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            if depth == 0:
+                return code[position:index]
+            depth -= 1
+    return code[position:position + 2000]
+
+
+def detect_method(code: str, literal: StringLiteral) -> str:
+    before = HTTP_CALL_BEFORE.search(code[max(0, literal.start - 80):literal.start])
+    if before and before.group(2) and before.group(2).upper() in HTTP_METHODS:
+        return before.group(2).upper()
+
+    arguments = call_arguments_after(code, literal.end)
+    option = METHOD_OPTION.search(arguments)
+    if option and option.group(1).upper() in HTTP_METHODS:
+        return option.group(1).upper()
+
+    for argument in re.findall(r"['\"`](\w+)['\"`]", arguments):
+        if argument.upper() in HTTP_METHODS:
+            return argument.upper()
+    return "GET"
+
+
+def host_name(base_url: str) -> str:
+    host = urlsplit(base_url).hostname or base_url
+    parts = [part for part in host.split(".") if part not in ("www", "api", "com", "app", "io", "net", "org")]
+    return " ".join(parts) or host
+
+
+def split_identifiers(text: str) -> List[str]:
+    return [
+        token.split(".")[-1] for token in re.findall(r"[A-Za-z_][\w.]*", text)
+        if token.split(".")[-1].lower() not in SQL_KEYWORDS
+    ]
+
+
+def sql_columns(sql: str) -> List[str]:
+    columns = []
+    select_list = SQL_SELECT_LIST.search(sql)
+    if select_list:
+        for item in select_list.group(1).split(","):
+            item = re.split(r"\s+AS\s+", item.strip(), flags=re.IGNORECASE)[0]
+            columns.extend(split_identifiers(item))
+    columns.extend(SQL_CONDITION_COLUMNS.findall(sql.split("WHERE", 1)[-1] if re.search(r"\bWHERE\b", sql, re.IGNORECASE) else ""))
+    for group in SQL_GROUP_ORDER.findall(sql):
+        columns.extend(split_identifiers(group))
+    return [column for column in dict.fromkeys(columns) if column.lower() not in SQL_KEYWORDS]
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split()).rstrip(";").lower()
+
+
+def extract_static(code: str) -> StaticExtraction:
+    """
+    Runs the deterministic extraction over JS/TS/Python artifact code.
+    """
+    result = StaticExtraction()
+    literals = iter_string_literals(code)
+    constants = find_url_constants(code, literals)
+
+    apis: Dict[str, APINode] = {}
+    endpoints: Dict[Tuple[str, str, str], EndpointNode] = {}
+    sql_literals = []
+
+    for literal in literals:
+        if SQL_START.match(literal.value) and SQL_TABLES.search(literal.value):
+            sql_literals.append(literal)
+            continue
+
+        url, path_parameters = resolve_url(literal.value, constants)
+        if url is None:
+            continue
+
+        parts = urlsplit(url.replace("{", "%7B").replace("}", "%7D"))
+        base_url = f"{parts.scheme}://{parts.netloc}"
+        path = parts.path.replace("%7B", "{").replace("%7D", "}") or "/"
+        if literal.value.rstrip("/") in constants.values():
+            # A base URL constant is an API, not an endpoint.
+            apis.setdefault(base_url, None)
+            continue
+
+        method = detect_method(code, literal)
+        parameters = path_parameters + [name for name, _ in parse_qsl(parts.query, keep_blank_values=True)]
+        apis.setdefault(base_url, None)
+        key = (base_url, path, method)
+        if key not in endpoints:
+            endpoints[key] = EndpointNode(
+                id=f"endpoint_{len(endpoints) + 1}",
+                api_id=base_url,
+                path=path,
+                method=method,
+                parameters=parameters,
+                description=f"{method} {path}",
+            )
+
+    for index, base_url in enumerate(apis, start=1):
+        name = host_name(base_url)
+        apis[base_url] = APINode(
+            id=f"api_{index}",
+            name=f"{name} API",
+            description=f"API served from {base_url}",
+            base_url=base_url,
+        )
+    for endpoint in endpoints.values():
+        endpoint.api_id = apis[endpoint.api_id].id
+
+    tables: Dict[str, TableNode] = {}
+    queries: Dict[str, QueryNode] = {}
+    for literal in sql_literals:
+        sql = " ".join(literal.value.split())
+        if "${" in sql:
+            result.unresolved.append(f"dynamic SQL: {sql[:80]}")
+            continue
+
+        table_names = list(dict.fromkeys(name.split(".")[-1] for name in SQL_TABLES.findall(sql)))
+        columns = sql_columns(sql)
+        for table_name in table_names:
+            table = tables.setdefault(table_name.lower(), TableNode(
+                id=f"table_{len(tables) + 1}", nombre_tabla=table_name, columnas=[], tipos_datos=[]
+            ))
+            for column in columns:
+                if column not in table.columnas:
+                    table.columnas.append(column)
+                    table.tipos_datos.append("UNKNOWN")
+
+        key = normalize_sql(sql)
+        if key not in queries:
+            select_list = SQL_SELECT_LIST.search(sql)
+            selected = select_list.group(1).strip() if select_list else "*"
+            described_columns = "all columns" if selected == "*" else ", ".join(columns)
+            queries[key] = QueryNode(
+                id=f"query_{len(queries) + 1}",
+                pregunta_original=sql,
+                pregunta_generica=f"Fetch {described_columns} from {', '.join(table_names)}",
+                sql_query=sql,
+                cypher_query="",
+            )
+
+    if queries:
+        query_endpoint = next((endpoint for endpoint in endpoints.values() if "query" in endpoint.path.lower()), None)
+        if query_endpoint:
+            owner = next(api for api in apis.values() if api.id == query_endpoint.api_id)
+            database_name = f"{host_name(owner.base_url)} database"
+        else:
+            database_name = "SQL database"
+        result.databases.append(DatabaseNode(
+            id="db_1",
+            name=database_name,
+            type="SQL",
+            description=f"SQL database queried for {', '.join(table.nombre_tabla for table in tables.values())}",
+            query_pattern=next(iter(queries.values())).sql_query,
+        ))
+
+    for marker, pattern in UNRESOLVED_MARKERS.items():
+        if pattern.search(code):
+            result.unresolved.append(marker)
+
+    # `fetch(url)` with a variable is resolved when the variable is a function parameter (a fetch helper
+    # whose call sites pass literal URLs) or a known constant; anything else is left to the LLM.
+    for variable in HTTP_CALL_WITH_VARIABLE.findall(code):
+        is_parameter = re.search(rf"\(([^()]*\b{variable}\b[^()]*)\)\s*(?:=>|\{{|:)", code)
+        if variable not in constants and not is_parameter:
+            result.unresolved.append(f"HTTP call with dynamic URL: {variable}")
+
+    result.apis = list(apis.values())
+    result.endpoints = list(endpoints.values())
+    result.tables = list(tables.values())
+    result.queries = list(queries.values())
+    return result
+
+
+def merge_extracted_entities(static: StaticExtraction, llm_entities):
+    """
+    Adds the static findings to the LLM extraction, keeping the LLM entity when both found the same one.
+    """
+    merged = llm_entities.model_copy(deep=True)
+
+    known_apis = {api.base_url.rstrip("/").lower() for api in merged.apis}
+    merged.apis += [api for api in static.apis if api.base_url.rstrip("/").lower() not in known_apis]
+
+    known_endpoints = {(endpoint.method.upper(), endpoint.path.rstrip("/").lower()) for endpoint in merged.endpoints}
+    merged.endpoints += [
+        endpoint for endpoint in static.endpoints
+        if (endpoint.method.upper(), endpoint.path.rstrip("/").lower()) not in known_endpoints
+    ]
+
+    known_tables = {table.nombre_tabla.lower() for table in merged.tables}
+    merged.tables += [table for table in static.tables if table.nombre_tabla.lower() not in known_tables]
+
+    known_queries = {normalize_sql(query.sql_query or "") for query in merged.queries}
+    merged.queries += [query for query in static.queries if normalize_sql(query.sql_query) not in known_queries]
+
+    if not merged.databases:
+        merged.databases = list(static.databases)
+    return merged
+
+
+def describe_static_extraction(static: StaticExtraction) -> str:
+    """
+    Summarizes the static findings for the LLM prompt, so it only has to extract what is still missing.
+    """
+    lines = []
+    for api in static.apis:
+        lines.append(f"- API {api.base_url}")
+    for endpoint in static.endpoints:
+        lines.append(f"- Endpoint {endpoint.method} {endpoint.path}")
+    for table in static.tables:
+        lines.append(f"- Table {table.nombre_tabla} ({', '.join(table.columnas)})")
+    for query in static.queries:
+        lines.append(f"- Query {query.sql_query}")
+    unresolved = "\n".join(f"- {item}" for item in static.unresolved)
+    return (
+        "### Already extracted by a static parser (do not repeat these):\n"
+        + ("\n".join(lines) or "- nothing")
+        + "\n\n### Focus on the code the parser could not resolve:\n"
+        + unresolved
+    )
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live at the repository root and read their configuration on import.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("METRICS_LOG_ENABLED", "false")
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import backfill
+import insertion
+import main
+from backfill import LocalQuery, fetch_page, fetch_rows
+from graph_store import MemoryGraphStore
+
+
+class Client:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        return LocalQuery(self.rows)
+
+
+def row(row_id: str, created_at: str) -> dict:
+    return {"id": row_id, "code": f"// {row_id}", "user_id": "user", "created_at": created_at}
+
+
+@pytest.fixture
+def client():
+    # Several rows share created_at, and their ids do not follow insertion order.
+    return Client([
+        row("c", "2025-04-01T00:00:01"),
+        row("a", "2025-04-01T00:00:01"),
+        row("b", "2025-04-01T00:00:01"),
+        row("d", "2025-04-01T00:00:02"),
+        row("e", "2025-04-01T00:00:02"),
+        row("z", "2025-03-31T23:59:59"),
+    ])
+
+
+def all_pages(client, page_size: int) -> list:
+    seen = []
+    cursor = None
+    while True:
+        page = fetch_page(client, "2025-04-01", cursor, page_size)
+        if not page:
+            return seen
+        seen.extend(item["id"] for item in page)
+        cursor = {"created_at": page[-1]["created_at"], "id": page[-1]["id"]}
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 3, 4, 10])
+def test_pages_neither_skip_nor_repeat_rows_on_timestamp_ties(client, page_size):
+    assert all_pages(client, page_size) == ["a", "b", "c", "d", "e"]
+
+
+def test_page_after_a_tie_continues_with_the_same_timestamp(client):
+    page = fetch_page(client, "2025-04-01", {"created_at": "2025-04-01T00:00:01", "id": "a"}, 3)
+
+    assert [item["id"] for item in page] == ["b", "c", "d"]
+
+
+def test_fetch_rows_returns_the_requested_ids_in_order(client):
+    assert [item["id"] for item in fetch_rows(client, ["d", "a", "missing"])] == ["a", "d"]
+
+
+def test_retry_failed_reprocesses_failed_artifacts(client, tmp_path, monkeypatch):
+    failing = {"b"}
+
+    async def process_artifact_async(code, user, force=False):
+        if code.removeprefix("// ") in failing:
+            raise RuntimeError("boom")
+        return {"reused": False}
+
+    monkeypatch.setattr(main, "process_artifact_async", process_artifact_async)
+    monkeypatch.setattr(insertion, "_graph_store", MemoryGraphStore())
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    checkpoint = asyncio.run(backfill.run_backfill(client, "2025-04-01", page_size=2, checkpoint_path=checkpoint_path))
+    assert checkpoint["failed"] == ["b"]
+    assert checkpoint["processed"] == 4
+
+    failing.clear()
+    checkpoint = asyncio.run(backfill.run_backfill(
+        client, "2025-04-01", page_size=2, checkpoint_path=checkpoint_path, retry_failed=True
+    ))
+    assert checkpoint["failed"] == []
+    assert checkpoint["processed"] == 5
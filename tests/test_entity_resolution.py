@@ -0,0 +1,60 @@
+from entity_resolution import assign_ids, deduplicate, remap_endpoint_apis, remap_relationships
+from nodes import APINode, EndpointNode, TableNode
+from relations import KnowledgeRelationship
+
+
+def relationship(origen: str, destino: str, tipo: str = "USES") -> KnowledgeRelationship:
+    return KnowledgeRelationship(origen=origen, destino=destino, tipo=tipo)
+
+
+def test_remap_relationships_points_to_canonical_ids():
+    remapped = remap_relationships([relationship("t1", "q1")], {"t1": "table", "q1": "query"})
+
+    assert [(r.origen, r.destino, r.tipo) for r in remapped] == [("table", "query", "USES")]
+
+
+def test_remap_relationships_drops_self_loops():
+    # Both ends were merged into the same entity.
+    assert remap_relationships([relationship("t1", "t2")], {"t1": "table", "t2": "table"}) == []
+
+
+def test_remap_relationships_collapses_duplicates():
+    relaciones = [relationship("t1", "q1"), relationship("t2", "q1"), relationship("t1", "q1", "READS_FROM")]
+
+    remapped = remap_relationships(relaciones, {"t1": "table", "t2": "table"})
+
+    assert [(r.origen, r.destino, r.tipo) for r in remapped] == [
+        ("table", "q1", "USES"),
+        ("table", "q1", "READS_FROM"),
+    ]
+
+
+def test_remap_relationships_keeps_unmapped_ids():
+    remapped = remap_relationships([relationship("existing", "q1")], {})
+
+    assert [(r.origen, r.destino) for r in remapped] == [("existing", "q1")]
+
+
+def test_same_key_nodes_get_one_stable_id():
+    tables = [
+        TableNode(id="uuid-1", nombre_tabla="Orders", columnas=["id"], tipos_datos=["int"]),
+        TableNode(id="uuid-2", nombre_tabla="orders", columnas=["id", "total"], tipos_datos=["int", "float"]),
+    ]
+    id_map = {}
+
+    assign_ids(tables, {}, {}, id_map)
+
+    assert id_map["uuid-1"] == id_map["uuid-2"]
+    assert [table.id for table in deduplicate(tables)] == [id_map["uuid-1"]]
+
+
+def test_endpoints_follow_their_resolved_api():
+    api = APINode(id="uuid-api", name="Orders", description="", base_url="https://api.example.com/")
+    endpoint = EndpointNode(id="uuid-endpoint", api_id="uuid-api", path="/orders", method="GET",
+                            parameters=None, description="")
+    id_map = {}
+
+    assign_ids([api], {}, {}, id_map)
+    remap_endpoint_apis([endpoint], id_map)
+
+    assert endpoint.api_id == api.id != "uuid-api"
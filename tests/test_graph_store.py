@@ -0,0 +1,83 @@
+import copy
+
+import pytest
+
+from graph_store import (
+    ARTIFACTS, ARTIFACT_STATUS, GENERATED, NODES, RELATIONSHIPS, GraphStore, MemoryGraphStore, WriteOp
+)
+
+
+def table_op(node_id: str, name: str, vector) -> WriteOp:
+    row = {"id": node_id, "canonical_key": f"table:{name}",
+           "atributos": {"nombre_tabla": name, "composite_embedding": vector}}
+    return WriteOp(NODES, ("Table",), [row])
+
+
+def state(store: MemoryGraphStore):
+    return copy.deepcopy((
+        store.nodes, store.labels, store.keys,
+        {fingerprint: ids for fingerprint, ids in store.fingerprints.items() if ids},
+        store.relationships, {label: dict(vectors) for label, vectors in store.vectors.items() if vectors},
+    ))
+
+
+@pytest.fixture
+def store():
+    store = MemoryGraphStore({"Table": "composite_embedding"})
+    store.write([
+        WriteOp(ARTIFACTS, (), [{"id": "a1", "code": "v1", "fingerprint": "f1", "status": "processing"}]),
+        table_op("t2", "orders", [1.0, 0.0]),
+        WriteOp(GENERATED, ("Table",), [{"artifact_id": "a1", "node_id": "t2"}]),
+    ])
+    return store
+
+
+def test_failed_write_is_rolled_back(store):
+    before = state(store)
+
+    with pytest.raises(ValueError):
+        store.write([
+            # Changes every index: fingerprint, status, a smaller id for an existing key, vectors, relationships.
+            WriteOp(ARTIFACTS, (), [{"id": "a1", "code": "v2", "fingerprint": "f2", "status": "complete"},
+                                    {"id": "a2", "fingerprint": "f1"}]),
+            WriteOp(ARTIFACT_STATUS, (), [{"id": "a2", "status": "failed"}]),
+            table_op("t1", "orders", [0.0, 1.0]),
+            WriteOp(GENERATED, ("Table",), [{"artifact_id": "a1", "node_id": "t1"}]),
+            WriteOp(RELATIONSHIPS, ("Table", "USES", "Table"), [{"origen": "t1", "destino": "t2"}]),
+            WriteOp("unknown", (), [{}]),
+        ])
+
+    assert state(store) == before
+    assert store.find_entities_by_key("Table", ["table:orders"]) == {"table:orders": "t2"}
+    assert store.find_artifact_by_fingerprint("f2") is None
+
+
+def test_write_after_rollback_applies_normally(store):
+    with pytest.raises(ValueError):
+        store.write([table_op("t3", "customers", [0.0, 1.0]), WriteOp("unknown", (), [{}])])
+
+    store.write([table_op("t3", "customers", [0.0, 1.0])])
+
+    assert store.find_entities_by_key("Table", ["table:customers"]) == {"table:customers": "t3"}
+    assert store.journal is None
+
+
+def test_successful_write_applies_every_op(store):
+    store.write([
+        WriteOp(ARTIFACT_STATUS, (), [{"id": "a1", "status": "complete"}]),
+        table_op("t3", "customers", [0.0, 1.0]),
+        WriteOp(RELATIONSHIPS, ("Table", "USES", "Table"), [{"origen": "t3", "destino": "t2"}]),
+    ])
+
+    assert store.find_artifact_by_fingerprint("f1")["id"] == "a1"
+    assert ("t3", "USES", "t2") in store.relationships
+    assert [match["id"] for match in store.similar_nodes("Table", [{"source": "s", "vector": [0.0, 1.0]}], 1)] == ["t3"]
+
+
+def test_backend_missing_an_operation_fails_when_built():
+    class PartialStore(GraphStore):
+        def write(self, ops):
+            pass
+
+    with pytest.raises(TypeError, match="artifact_graph"):
+        PartialStore()
@@ -0,0 +1,116 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+import openai_scheduler
+import relationship_agent
+from extract import ExtractedEntities
+from nodes import DatabaseNode, TableNode
+from nodes_generator import build_entity_nodes
+from relations import KnowledgeRelationshipsCollection
+
+
+PAIR = re.compile(r"- (\S+) -\[(\w+)\]-> (\S+)")
+
+
+class FakeRelationshipsClient:
+    """
+    Answers the relationships prompt with its first candidate pair.
+    """
+
+    def __init__(self):
+        self.prompts = []
+        completions = SimpleNamespace(parse=self.parse)
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    def parse(self, model, response_format, messages, **options):
+        prompt = messages[0]["content"]
+        self.prompts.append(prompt)
+        origen, tipo, destino = PAIR.search(prompt).groups()
+        parsed = response_format(relaciones=[{"origen": origen, "destino": destino, "tipo": tipo}])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))],
+            usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1, total_tokens=2),
+        )
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = llm_cache.LLMCache(str(tmp_path / "llm.sqlite"))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_STAGES", {"relationships"})
+    monkeypatch.setattr(llm_cache, "_llm_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeRelationshipsClient()
+    monkeypatch.setattr(openai_scheduler, "_openai_client", client)
+    return client
+
+
+def extraction() -> ExtractedEntities:
+    # Two databases and a table none of them names: which one stores it is left to the LLM.
+    return ExtractedEntities(
+        apis=[], endpoints=[], queries=[],
+        databases=[
+            DatabaseNode(id="db_1", name="ventas", type="postgres", description="Ventas", query_pattern=None),
+            DatabaseNode(id="db_2", name="stock", type="postgres", description="Inventario", query_pattern=None),
+        ],
+        tables=[TableNode(id="table_1", nombre_tabla="faenas", columnas=["fecha"], tipos_datos=["date"])],
+        relationships=KnowledgeRelationshipsCollection(relaciones=[]),
+    )
+
+
+def test_make_key_is_stable():
+    messages = [{"role": "system", "content": "prompt"}, {"role": "user", "content": "código"}]
+    key = llm_cache.LLMCache.make_key("relationships", "gpt-4o", "1", messages, KnowledgeRelationshipsCollection)
+
+    assert key == llm_cache.LLMCache.make_key(
+        "relationships", "gpt-4o", "1", [dict(message) for message in messages], KnowledgeRelationshipsCollection
+    )
+    assert key != llm_cache.LLMCache.make_key(
+        "relationships", "gpt-4o", "2", messages, KnowledgeRelationshipsCollection
+    )
+    assert key != llm_cache.LLMCache.make_key(
+        "relationships", "gpt-4o", "1", messages[:1], KnowledgeRelationshipsCollection
+    )
+    assert key != llm_cache.LLMCache.make_key("relationships", "gpt-4o", "1", messages, ExtractedEntities)
+
+
+def test_relationships_prompt_does_not_contain_fresh_ids(client, cache):
+    nodos = build_entity_nodes(extraction())
+    relationship_agent.determine_relationships(nodos, [])
+
+    assert client.prompts
+    for nodo in nodos:
+        assert nodo.id not in client.prompts[0]
+
+
+def test_same_artifact_hits_the_relationships_cache(client, cache):
+    first = build_entity_nodes(extraction())
+    second = build_entity_nodes(extraction())
+    assert {nodo.id for nodo in first}.isdisjoint(nodo.id for nodo in second)
+
+    relationship_agent.determine_relationships(first, [])
+    relationships = relationship_agent.determine_relationships(second, []).relaciones
+
+    assert len(client.prompts) == 1
+    assert cache.hits == {"relationships": 1}
+    assert cache.misses == {"relationships": 1}
+    # The cached answer is mapped back to the ids of the second run.
+    ids = {nodo.id for nodo in second}
+    assert relationships
+    assert all(relationship.origen in ids and relationship.destino in ids for relationship in relationships)
+
+
+def test_relationships_prompt_does_not_depend_on_id_order(client, cache):
+    # Fresh ids sort differently on every run; the prompt must not follow their order.
+    for _ in range(10):
+        relationship_agent.determine_relationships(build_entity_nodes(extraction()), [])
+
+    assert len(client.prompts) == 1
+    assert cache.hits == {"relationships": 9}
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+
+from pipeline_dag import Stage, critical_path, run_stages, run_stages_async, validate_stages
+
+
+def test_independent_stages_overlap():
+    # Both branches must be running at the same time to get past the barrier.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def branch(name):
+        def run(results):
+            barrier.wait()
+            return f"{results['extract']}-{name}"
+        return run
+
+    results = run_stages([
+        Stage("extract", lambda results: "code"),
+        Stage("nodes", branch("nodes"), after=("extract",)),
+        Stage("embeddings", branch("embeddings"), after=("extract",)),
+        Stage("write", lambda results: sorted(results), after=("nodes", "embeddings")),
+    ])
+
+    assert results["write"] == ["embeddings", "extract", "nodes"]
+
+
+def test_async_stages_receive_their_dependencies():
+    async def double(results):
+        return results["source"] * 2
+
+    async def source(results):
+        return 21
+
+    results = asyncio.run(run_stages_async([Stage("double", double, after=("source",)), Stage("source", source)]))
+
+    assert results == {"source": 21, "double": 42}
+
+
+def test_failed_stage_stops_the_pipeline():
+    started = []
+
+    def fail(results):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_stages([Stage("fail", fail), Stage("next", lambda results: None, after=("fail",))],
+                   on_start=started.append)
+
+    assert started == ["fail"]
+
+
+@pytest.mark.parametrize("stages", [
+    [Stage("a", None), Stage("a", None)],
+    [Stage("a", None, after=("missing",))],
+    [Stage("a", None, after=("b",)), Stage("b", None, after=("a",))],
+])
+def test_invalid_graphs_are_rejected(stages):
+    with pytest.raises(ValueError):
+        validate_stages(stages)
+
+
+def test_critical_path_follows_the_slowest_chain():
+    stages = [Stage("a", None), Stage("b", None, after=("a",)), Stage("c", None, after=("a",)),
+              Stage("d", None, after=("b", "c"))]
+
+    path, seconds = critical_path(stages, {"a": 1.0, "b": 5.0, "c": 2.0, "d": 1.0})
+
+    assert path == ["a", "b", "d"]
+    assert seconds == 7.0
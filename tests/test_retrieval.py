@@ -0,0 +1,32 @@
+from retrieval import LocalVectorIndex, select_candidates
+
+
+def match(source: str, node_id: str, score: float) -> dict:
+    return {"source": source, "id": node_id, "tipo": ["Table"], "score": score,
+            "properties": {"nombre_tabla": node_id, "composite_embedding": [1.0]}}
+
+
+def test_local_index_returns_the_k_most_similar_nodes():
+    index = LocalVectorIndex()
+    index.add("Table", "orders", [1.0, 0.0], {"nombre_tabla": "orders"})
+    index.add("Table", "items", [0.8, 0.6], {"nombre_tabla": "items"})
+    index.add("Table", "users", [0.0, 1.0], {"nombre_tabla": "users"})
+    index.add("Table", "empty", [0.0, 0.0], {"nombre_tabla": "empty"})
+
+    results = index.search("Table", [2.0, 0.0], 2)
+
+    assert [node_id for _, node_id, _ in results] == ["orders", "items"]
+    assert len(index) == 3
+    assert index.search("API", [1.0, 0.0], 2) == []
+
+
+def test_select_candidates_keeps_top_k_per_new_node():
+    matches = [
+        match("new_1", "orders", 0.9), match("new_1", "items", 0.8), match("new_1", "users", 0.7),
+        match("new_2", "users", 0.95), match("new_2", "new_1", 0.99), match("new_2", "logs", 0.1),
+    ]
+
+    candidates = select_candidates(matches, {"new_1", "new_2"}, top_k=2, min_score=0.5)
+
+    assert [candidate["id"] for candidate in candidates] == ["orders", "items", "users"]
+    assert candidates[0] == {"id": "orders", "tipo": "Table", "nombre_tabla": "orders"}
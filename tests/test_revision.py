@@ -0,0 +1,118 @@
+import revision
+from revision import changed_region, diff_code, plan_revision, split_blocks
+
+
+OLD_CODE = """const OLD_API = "https://api.old.com";
+const ORDERS_TABLE = "orders";
+
+async function loadTables() {
+  return fetch(`${OLD_API}/db/tables`);
+}
+
+async function runQuery() {
+  return fetch(`${OLD_API}/db/query`, { body: "SELECT * FROM orders" });
+}
+
+export default function Dashboard() {
+  return <Chart title="Pedidos" />;
+}
+"""
+
+NEW_CODE = """const NEW_API = "https://api.new.com";
+const ORDERS_TABLE = "orders";
+
+async function loadTables() {
+  return fetch(`${NEW_API}/db/tables`);
+}
+
+async function runQuery() {
+  return fetch(`${NEW_API}/db/query`, { body: "SELECT * FROM orders" });
+}
+
+export default function Dashboard() {
+  return <Chart title="Pedidos" />;
+}
+"""
+
+
+def previous_artifact(code: str = OLD_CODE, status: str = "complete") -> dict:
+    return {
+        "id": "previous",
+        "code": code,
+        "status": status,
+        "nodes": [
+            {"id": "api-old", "tipo": "API", "base_url": "https://api.old.com", "canonical_key": "api:old"},
+            {"id": "endpoint-tables", "tipo": "Endpoint", "api_id": "api-old", "path": "/db/tables"},
+            {"id": "endpoint-query", "tipo": "Endpoint", "api_id": "api-old", "path": "/db/query"},
+            {"id": "table-orders", "tipo": "Table", "nombre_tabla": "orders"},
+            {"id": "query-orders", "tipo": "Query", "sql_query": "SELECT * FROM orders"},
+            {"id": "kpi", "tipo": "KPI", "nombre": "Pedidos"},
+        ],
+    }
+
+
+def test_endpoints_are_dropped_with_their_api(monkeypatch):
+    monkeypatch.setattr(revision, "REVISION_MAX_CHANGED_RATIO", 0.9)
+
+    plan = plan_revision(previous_artifact(), NEW_CODE)
+
+    assert not plan.full
+    # The paths are still in the code, but under another base URL.
+    assert {node["id"] for node in plan.removed} == {"api-old", "endpoint-tables", "endpoint-query"}
+    assert set(plan.linked) == {"table-orders", "query-orders", "kpi"}
+
+
+def test_endpoint_of_a_kept_api_is_dropped_by_its_path(monkeypatch):
+    monkeypatch.setattr(revision, "REVISION_MAX_CHANGED_RATIO", 0.9)
+    code = OLD_CODE.replace("return fetch(`${OLD_API}/db/tables`);", "return [];")
+
+    plan = plan_revision(previous_artifact(), code)
+
+    assert {node["id"] for node in plan.removed} == {"endpoint-tables"}
+
+
+def test_small_edit_extracts_the_changed_blocks_with_their_declarations():
+    code = OLD_CODE.replace('body: "SELECT * FROM orders"', 'body: "SELECT * FROM orders WHERE total > 0"')
+
+    plan = plan_revision(previous_artifact(), code)
+
+    assert not plan.full
+    assert "WHERE total > 0" in plan.region_code
+    # The endpoint URL is built from OLD_API, so its declaration is extracted again too.
+    assert 'const OLD_API = "https://api.old.com";' in plan.region_code
+    assert "loadTables" not in plan.region_code
+    assert {node["id"] for node in plan.removed} == {"query-orders"}
+
+
+def test_large_change_is_extracted_in_full(monkeypatch):
+    monkeypatch.setattr(revision, "REVISION_MAX_CHANGED_RATIO", 0.2)
+
+    plan = plan_revision(previous_artifact(), NEW_CODE)
+
+    assert plan.diff.changed_ratio > 0.2
+    assert plan.full
+    assert plan.region_code == NEW_CODE
+    assert plan.linked == {}
+
+
+def test_incomplete_previous_artifact_is_extracted_in_full():
+    plan = plan_revision(previous_artifact(status="processing"), OLD_CODE + "\n// comentario\n")
+
+    assert plan.full
+
+
+def test_reindenting_a_block_does_not_change_it():
+    reindented = OLD_CODE.replace("  return fetch(`${OLD_API}/db/tables`);", "      return fetch(`${OLD_API}/db/tables`);")
+
+    diff = diff_code(OLD_CODE, reindented)
+
+    assert diff.changed_lines == 0
+    assert changed_region(diff) == ""
+
+
+def test_long_blocks_are_split_into_statements():
+    body = "\n".join(f"  const value{index} = {index};" for index in range(10))
+    blocks = split_blocks(f"function big() {{\n{body}\n}}", max_lines=5)
+
+    assert blocks[0].text == "function big() {"
+    assert len(blocks) == 12
@@ -0,0 +1,131 @@
+"""
+Compact representation of embeddings.
+
+In memory a vector is an `array('f')` (float32) or a `QuantizedVector` (int8 plus a scale) instead of a list of
+boxed Python floats. In the graph the vector-indexed property stays a native list (vector indexes need it) and the
+other embedding properties can be written as packed bytes. `decode_embedding` turns any stored form back into floats.
+"""
+import os
+import sys
+import base64
+import struct
+from array import array
+from typing import Iterable, List, Optional, Union
+from dotenv import load_dotenv
+
+load_dotenv()
+
+NATIVE_EMBEDDING_DIMENSIONS = 3072
+
+# `dimensions` parameter of the embeddings API; empty means the model's native size.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS") or 0) or None
+# "float32" or "int8" (symmetric per-vector quantization).
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32").lower()
+# "list" writes every embedding as a list of floats, "bytes" packs every embedding,
+# "hybrid" keeps the vector-indexed property as a list and packs the rest.
+EMBEDDING_GRAPH_FORMAT = os.getenv("EMBEDDING_GRAPH_FORMAT", "hybrid").lower()
+
+FLOAT32_TAG = b"\x01"
+INT8_TAG = b"\x02"
+
+
+class QuantizedVector:
+    """
+    int8 vector with a float scale: value[i] ~= data[i] * scale.
+    """
+    __slots__ = ("scale", "data")
+
+    def __init__(self, scale: float, data: array):
+        self.scale = scale
+        self.data = data
+
+    @classmethod
+    def quantize(cls, values: Iterable[float]) -> "QuantizedVector":
+        values = array("f", values)
+        peak = max((abs(value) for value in values), default=0.0)
+        scale = peak / 127 if peak else 1.0
+        return cls(scale, array("b", (round(value / scale) for value in values)))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        scale = self.scale
+        return (value * scale for value in self.data)
+
+    def tolist(self) -> List[float]:
+        return list(self)
+
+
+Embedding = Union[array, QuantizedVector]
+
+
+def embedding_dimensions() -> int:
+    return EMBEDDING_DIMENSIONS or NATIVE_EMBEDDING_DIMENSIONS
+
+
+def compact_vector(values: Iterable[float], precision: str = EMBEDDING_PRECISION) -> Embedding:
+    if precision == "int8":
+        return values if isinstance(values, QuantizedVector) else QuantizedVector.quantize(values)
+    if isinstance(values, array) and values.typecode == "f":
+        return values
+    return array("f", values)
+
+
+def little_endian(values: array) -> array:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def pack_embedding(vector: Embedding) -> bytes:
+    if isinstance(vector, QuantizedVector):
+        return INT8_TAG + struct.pack("<f", vector.scale) + vector.data.tobytes()
+    return FLOAT32_TAG + little_endian(compact_vector(vector, "float32")).tobytes()
+
+
+def unpack_embedding(data: bytes) -> Embedding:
+    tag, payload = data[:1], data[1:]
+    if tag == INT8_TAG:
+        (scale,) = struct.unpack("<f", payload[:4])
+        return QuantizedVector(scale, array("b", payload[4:]))
+    if tag == FLOAT32_TAG:
+        values = array("f")
+        values.frombytes(payload)
+        return little_endian(values)
+    raise ValueError(f"Formato de embedding desconocido: {tag!r}")
+
+
+def encode_embedding(vector: Optional[Embedding], packed: bool, as_text: bool = False):
+    """
+    Returns the value stored in the graph: a list of floats, or the packed bytes (base64 text when the
+    database has no byte array type, as in Memgraph).
+    """
+    if vector is None:
+        return None
+    if not packed:
+        return list(vector)
+
+    data = pack_embedding(vector)
+    return base64.b64encode(data).decode("ascii") if as_text else data
+
+
+def decode_embedding(value) -> Optional[List[float]]:
+    """
+    Returns the floats of an embedding as read from the graph, whatever format it was written in.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = base64.b64decode(value)
+    if isinstance(value, (bytes, bytearray)):
+        return list(unpack_embedding(bytes(value)))
+    return list(value)
+
+
+def decode_embedding_properties(properties: dict) -> dict:
+    return {
+        key: decode_embedding(value) if key.endswith("_embedding") else value
+        for key, value in properties.items()
+    }